@@ -1,440 +1,47 @@
-import hashlib
-import os
-import sqlite3
 import time
-from datetime import datetime
-from statistics import mean
-from zoneinfo import ZoneInfo
 
-import pandas as pd
-import requests
 import streamlit as st
 
-st.set_page_config(page_title="Network Monitor", page_icon="🛡️", layout="centered")
-
-DB_PATH = "results.db"
-DEFAULT_ADMIN_USERNAME = os.getenv("ADMIN_USERNAME", "admin")
-DEFAULT_ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD", "admin123")
-DEFAULT_MANAGER_USERNAME = os.getenv("MANAGER_USERNAME", "manager")
-DEFAULT_MANAGER_PASSWORD = os.getenv("MANAGER_PASSWORD", "manager123")
-DEFAULT_TECH_USERNAME = os.getenv("TECHNICIAN_USERNAME", "technician")
-DEFAULT_TECH_PASSWORD = os.getenv("TECHNICIAN_PASSWORD", "tech123")
-DEFAULT_CLIENT_USERNAME = os.getenv("CLIENT_USERNAME", "client")
-DEFAULT_CLIENT_PASSWORD = os.getenv("CLIENT_PASSWORD", "client123")
-APP_RELEASE_TAG = os.getenv("APP_RELEASE_TAG", "speed-monitor-v3")
-SPEED_DROP_THRESHOLD_MBPS = float(os.getenv("SPEED_DROP_THRESHOLD_MBPS", "20"))
-QUICK_TEST_INTERVAL_SECONDS = int(os.getenv("QUICK_TEST_INTERVAL_SECONDS", "300"))
-TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "")
-TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID", "")
-
-ROLE_LABELS = {
-    "admin": "مدير النظام",
-    "manager": "المدير",
-    "technician": "الفني",
-    "client": "العميل",
-}
-
-DEFAULT_USERS = [
-    (DEFAULT_ADMIN_USERNAME, DEFAULT_ADMIN_PASSWORD, "admin"),
-    (DEFAULT_MANAGER_USERNAME, DEFAULT_MANAGER_PASSWORD, "manager"),
-    (DEFAULT_TECH_USERNAME, DEFAULT_TECH_PASSWORD, "technician"),
-    (DEFAULT_CLIENT_USERNAME, DEFAULT_CLIENT_PASSWORD, "client"),
-]
-
-TARGETS = [
-    "https://www.google.com",
-    "https://1.1.1.1",
-    "https://www.cloudflare.com",
-    "https://n-pns.com",
-]
-
-SPEED_TEST_URLS = [
-    "https://speed.hetzner.de/10MB.bin",
-    "https://proof.ovh.net/files/10Mb.dat",
-]
-
-
-# ------------------ أدوات مساعدة ------------------
-def hash_password(password: str) -> str:
-    return hashlib.sha256(password.encode()).hexdigest()
-
-
-def get_now() -> datetime:
-    return datetime.now(ZoneInfo("Asia/Riyadh"))
-
-
-def get_conn():
-    try:
-        return sqlite3.connect(DB_PATH, check_same_thread=False)
-    except Exception as error:
-        st.error(f"Database connection error: {error}")
-        return None
-
-
-def format_duration(seconds: float | None) -> str:
-    if seconds is None:
-        return "-"
-    if seconds < 60:
-        return f"{int(seconds)}s"
-    minutes, sec = divmod(int(seconds), 60)
-    if minutes < 60:
-        return f"{minutes}m {sec}s"
-    hours, minutes = divmod(minutes, 60)
-    return f"{hours}h {minutes}m"
-
-
-def send_telegram_alert(message: str) -> bool:
-    if not TELEGRAM_BOT_TOKEN or not TELEGRAM_CHAT_ID:
-        return False
-    try:
-        requests.post(
-            f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage",
-            json={"chat_id": TELEGRAM_CHAT_ID, "text": message},
-            timeout=8,
-        )
-        return True
-    except requests.RequestException:
-        return False
-
-
-# ------------------ قاعدة البيانات ------------------
-def init_db() -> None:
-    conn = get_conn()
-    if conn is None:
-        return
-
-    with conn:
-        cur = conn.cursor()
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE,
-                password TEXT,
-                role TEXT DEFAULT 'client'
-            )
-            """
-        )
-
-        user_columns = {
-            row[1] for row in cur.execute("PRAGMA table_info(users)").fetchall()
-        }
-        if "role" not in user_columns:
-            cur.execute("ALTER TABLE users ADD COLUMN role TEXT DEFAULT 'client'")
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS checks (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                status TEXT,
-                timestamp TEXT
-            )
-            """
-        )
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS speed_checks (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                mode TEXT,
-                download_mbps REAL,
-                latency_ms REAL,
-                drop_detected INTEGER,
-                threshold_mbps REAL,
-                timestamp TEXT
-            )
-            """
-        )
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS incidents (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                started_at TEXT,
-                ended_at TEXT,
-                duration_seconds REAL,
-                start_reason TEXT,
-                end_reason TEXT
-            )
-            """
-        )
-
-        for username, password, role in DEFAULT_USERS:
-            cur.execute("SELECT id FROM users WHERE username=?", (username,))
-            user_exists = cur.fetchone()
-            if not user_exists:
-                cur.execute(
-                    "INSERT INTO users (username, password, role) VALUES (?, ?, ?)",
-                    (username, hash_password(password), role),
-                )
-            else:
-                cur.execute("UPDATE users SET role=? WHERE username=?", (role, username))
-
-    conn.close()
-
-
-def login(username: str, password: str) -> dict | None:
-    conn = get_conn()
-    if conn is None:
-        return None
-
-    cur = conn.cursor()
-    cur.execute(
-        "SELECT id, username, role FROM users WHERE username=? AND password=?",
-        (username, hash_password(password)),
-    )
-    user = cur.fetchone()
-    conn.close()
-
-    if not user:
-        return None
-
-    return {"id": user[0], "username": user[1], "role": user[2] or "client"}
-
-
-def check_connection(targets: list[str]) -> str:
-    for url in targets:
-        try:
-            response = requests.get(url, timeout=3)
-            if response.status_code == 200:
-                return "UP"
-        except requests.RequestException:
-            continue
-    return "DOWN"
-
-
-def get_last_status() -> str | None:
-    conn = get_conn()
-    if conn is None:
-        return None
-    row = conn.execute("SELECT status FROM checks ORDER BY id DESC LIMIT 1").fetchone()
-    conn.close()
-    return row[0] if row else None
-
-
-def save_check(status: str) -> None:
-    conn = get_conn()
-    if conn is None:
-        return
-
-    with conn:
-        conn.execute(
-            "INSERT INTO checks (status, timestamp) VALUES (?,?)",
-            (status, get_now().isoformat()),
-        )
-    conn.close()
-
-
-def get_recent_checks(limit: int = 20) -> pd.DataFrame:
-    conn = get_conn()
-    if conn is None:
-        return pd.DataFrame(columns=["status", "timestamp"])
-
-    query = "SELECT status, timestamp FROM checks ORDER BY id DESC LIMIT ?"
-    df = pd.read_sql_query(query, conn, params=(limit,))
-    conn.close()
-    return df
-
-
-def track_incident_transition(new_status: str) -> tuple[bool, bool]:
-    conn = get_conn()
-    if conn is None:
-        return False, False
-
-    down_started = False
-    down_recovered = False
-    with conn:
-        last_status_row = conn.execute("SELECT status FROM checks ORDER BY id DESC LIMIT 1").fetchone()
-        last_status = last_status_row[0] if last_status_row else None
-
-        open_incident = conn.execute(
-            "SELECT id, started_at FROM incidents WHERE ended_at IS NULL ORDER BY id DESC LIMIT 1"
-        ).fetchone()
-
-        if new_status == "DOWN" and (last_status is None or last_status == "UP") and open_incident is None:
-            conn.execute(
-                "INSERT INTO incidents (started_at, start_reason) VALUES (?, ?)",
-                (get_now().isoformat(), "Connectivity check failed"),
-            )
-            down_started = True
-
-        if new_status == "UP" and open_incident is not None:
-            incident_id, started_at = open_incident
-            started = datetime.fromisoformat(started_at)
-            ended = get_now()
-            duration = (ended - started).total_seconds()
-            conn.execute(
-                """
-                UPDATE incidents
-                SET ended_at=?, duration_seconds=?, end_reason=?
-                WHERE id=?
-                """,
-                (ended.isoformat(), duration, "Connectivity restored", incident_id),
-            )
-            down_recovered = True
-
-    conn.close()
-    return down_started, down_recovered
-
-
-def get_incidents(limit: int = 20) -> pd.DataFrame:
-    conn = get_conn()
-    if conn is None:
-        return pd.DataFrame(columns=["started_at", "ended_at", "duration", "start_reason", "end_reason"])
-
-    query = """
-    SELECT started_at, ended_at, duration_seconds, start_reason, end_reason
-    FROM incidents
-    ORDER BY id DESC
-    LIMIT ?
-    """
-    df = pd.read_sql_query(query, conn, params=(limit,))
-    conn.close()
-
-    if not df.empty:
-        df["duration"] = df["duration_seconds"].apply(format_duration)
-        df.drop(columns=["duration_seconds"], inplace=True)
-    return df
-
-
-def compute_sla(hours: int = 24) -> dict:
-    conn = get_conn()
-    if conn is None:
-        return {"uptime_pct": None, "checks_count": 0, "outages": 0, "avg_speed": None}
-
-    since = (get_now().timestamp() - hours * 3600)
-    since_iso = datetime.fromtimestamp(since, tz=ZoneInfo("Asia/Riyadh")).isoformat()
-
-    checks_df = pd.read_sql_query(
-        "SELECT status FROM checks WHERE timestamp >= ?", conn, params=(since_iso,)
-    )
-    speed_df = pd.read_sql_query(
-        "SELECT download_mbps FROM speed_checks WHERE timestamp >= ?", conn, params=(since_iso,)
-    )
-    outages = conn.execute(
-        "SELECT COUNT(*) FROM incidents WHERE started_at >= ?", (since_iso,)
-    ).fetchone()[0]
-    conn.close()
-
-    checks_count = len(checks_df)
-    uptime_pct = None
-    if checks_count > 0:
-        uptime_pct = round((checks_df["status"].eq("UP").sum() / checks_count) * 100, 2)
-
-    avg_speed = None
-    if not speed_df.empty:
-        speed_vals = speed_df["download_mbps"].dropna()
-        if not speed_vals.empty:
-            avg_speed = round(float(speed_vals.mean()), 2)
-
-    return {
-        "uptime_pct": uptime_pct,
-        "checks_count": checks_count,
-        "outages": outages,
-        "avg_speed": avg_speed,
-    }
-
-
-def _measure_latency_ms(url: str, timeout: int = 5) -> float | None:
-    try:
-        started = time.perf_counter()
-        requests.get(url, timeout=timeout)
-        return (time.perf_counter() - started) * 1000
-    except requests.RequestException:
-        return None
-
-
-def _measure_download_mbps(url: str, sample_bytes: int, timeout: int = 10) -> float | None:
-    try:
-        started = time.perf_counter()
-        downloaded = 0
-        with requests.get(url, stream=True, timeout=timeout) as response:
-            response.raise_for_status()
-            for chunk in response.iter_content(chunk_size=64 * 1024):
-                if not chunk:
-                    continue
-                downloaded += len(chunk)
-                if downloaded >= sample_bytes:
-                    break
-        elapsed = time.perf_counter() - started
-        if elapsed <= 0 or downloaded == 0:
-            return None
-        return (downloaded * 8) / (elapsed * 1_000_000)
-    except requests.RequestException:
-        return None
-
-
-def run_speed_test(mode: str) -> dict:
-    sample_bytes = 512 * 1024 if mode == "quick" else 3 * 1024 * 1024
-    samples = [
-        value
-        for value in (_measure_download_mbps(url, sample_bytes) for url in SPEED_TEST_URLS)
-        if value is not None
-    ]
-
-    download_mbps = mean(samples) if samples else None
-    latency_ms = _measure_latency_ms("https://www.google.com/generate_204")
-
-    return {
-        "mode": mode,
-        "download_mbps": download_mbps,
-        "latency_ms": latency_ms,
-    }
-
-
-def save_speed_check(result: dict, drop_detected: bool) -> None:
-    conn = get_conn()
-    if conn is None:
-        return
-
-    with conn:
-        conn.execute(
-            """
-            INSERT INTO speed_checks (mode, download_mbps, latency_ms, drop_detected, threshold_mbps, timestamp)
-            VALUES (?, ?, ?, ?, ?, ?)
-            """,
-            (
-                result["mode"],
-                result["download_mbps"],
-                result["latency_ms"],
-                int(drop_detected),
-                SPEED_DROP_THRESHOLD_MBPS,
-                get_now().isoformat(),
-            ),
-        )
-    conn.close()
-
-
-def get_recent_speed_checks(limit: int = 10) -> pd.DataFrame:
-    conn = get_conn()
-    if conn is None:
-        return pd.DataFrame(columns=["mode", "download_mbps", "latency_ms", "drop_detected", "timestamp"])
-
-    query = """
-    SELECT mode, ROUND(download_mbps, 2) AS download_mbps,
-           ROUND(latency_ms, 1) AS latency_ms,
-           drop_detected, timestamp
-    FROM speed_checks
-    ORDER BY id DESC
-    LIMIT ?
-    """
-    df = pd.read_sql_query(query, conn, params=(limit,))
-    conn.close()
-    return df
-
-
-def _seconds_since_last_speed_test() -> float | None:
-    conn = get_conn()
-    if conn is None:
-        return None
-
-    row = conn.execute("SELECT timestamp FROM speed_checks ORDER BY id DESC LIMIT 1").fetchone()
-    conn.close()
-    if not row:
-        return None
+from netmon.config import (
+    APP_RELEASE_TAG,
+    CONNECTIVITY_QUORUM,
+    DASHBOARD_READ_ONLY,
+    LATENCY_BURST_COUNT,
+    LATENCY_BURST_INTERVAL_MS,
+    LIVE_REFRESH_SECONDS,
+    METRICS_PORT,
+    PHASE_COLUMNS,
+    QUICK_TEST_INTERVAL_SECONDS,
+    ROLE_LABELS,
+    SPEED_DROP_THRESHOLD_MBPS,
+    SPEED_TEST_SERVER_COUNT,
+    TARGETS,
+    TELEGRAM_BOT_TOKEN,
+    TELEGRAM_CHAT_ID,
+)
+from netmon.db import (
+    compute_sla,
+    get_baselines,
+    get_last_check_targets,
+    get_latency_series,
+    get_recent_latency_probes,
+    get_remote_sites,
+    get_rollup_series,
+    get_target_health,
+    init_db,
+    login,
+)
+from netmon.metrics import histogram, start_metrics_server
+from netmon.utils import get_now
 
-    then = datetime.fromisoformat(row[0])
-    return (get_now() - then).total_seconds()
+render_started = time.perf_counter()
+st.set_page_config(page_title="Network Monitor", page_icon="🛡️", layout="centered")
 
+SLA_WINDOWS = {"Last 24h": 24, "Last 7d": 24 * 7, "Last 30d": 24 * 30}
 
 init_db()
+start_metrics_server(METRICS_PORT)
+RENDER_SECONDS = histogram("netmon_streamlit_render_seconds", "Duration of a full dashboard script run")
 
 if "logged_in" not in st.session_state:
     st.session_state.logged_in = False
@@ -478,6 +85,16 @@ if not st.session_state.logged_in:
 
 
 # ------------------ واجهة النظام ------------------
+# الوحدات الثقيلة (pandas، requests، numpy، plotly) تُحمَّل بعد تسجيل الدخول فقط، فتظهر شاشة الدخول
+# أسرع عند أول تشغيل للعملية؛ إعادات التشغيل التالية تجدها في sys.modules
+import pandas as pd
+
+from netmon.charts import CHART_RANGES, latency_figure, speed_figure, uptime_figure
+from netmon.export import EXPORT_FORMATS, EXPORT_TABLES, export_bytes
+from netmon.jobs import run_auto_quick_job, run_connectivity_job, run_latency_job, run_speed_job
+from netmon.live import LiveTable
+from netmon.servers import SERVER_POOL
+
 st.title("🛡️ Network Monitoring System")
 now = get_now()
 st.write(f"Date: {now.strftime('%Y-%m-%d')} | Time: {now.strftime('%H:%M:%S')}")
@@ -498,16 +115,51 @@ with logout_col:
         st.session_state.username = None
         st.rerun()
 
-can_run_operations = current_role in {"admin", "manager", "technician"}
+can_run_operations = current_role in {"admin", "manager", "technician"} and not DASHBOARD_READ_ONLY
 can_view_incidents = current_role in {"admin", "manager", "technician"}
 
-st.subheader("SLA Snapshot (Last 24h)")
-sla = compute_sla(24)
-k1, k2, k3, k4 = st.columns(4)
-k1.metric("Uptime", f"{sla['uptime_pct']}%" if sla["uptime_pct"] is not None else "-")
-k2.metric("Checks", str(sla["checks_count"]))
-k3.metric("Outages", str(sla["outages"]))
-k4.metric("Avg speed", f"{sla['avg_speed']} Mbps" if sla["avg_speed"] is not None else "-")
+# ------------------ اللوحات الحية ------------------
+# كل لوحة fragment يعاد تشغيله وحده كل LIVE_REFRESH_SECONDS في الوضع الحي، ويطلب من القاعدة
+# الصفوف الأحدث من آخر id في مخزن الجلسة فقط؛ خارج الوضع الحي تُرسم مرة مع كل تشغيل كامل
+live_mode = st.toggle(
+    "Live mode",
+    key="live_mode",
+    help=f"Refresh status, SLA and recent tables every {LIVE_REFRESH_SECONDS:g}s without reloading the page",
+)
+refresh_every = LIVE_REFRESH_SECONDS if live_mode else None
+LIVE_LIMITS = {"checks": 20, "speed_checks": 10, "incidents": 20}
+
+
+def live_table(table: str) -> LiveTable:
+    key = f"live_{table}"
+    if key not in st.session_state:
+        st.session_state[key] = LiveTable(table, LIVE_LIMITS[table])
+    live = st.session_state[key]
+    live.poll()
+    return live
+
+
+@st.fragment(run_every=refresh_every)
+def overview_panel() -> None:
+    last_check = live_table("checks").latest()
+    if last_check is not None:
+        icon = "✅" if last_check["status"] == "UP" else "🚨"
+        st.caption(
+            f"{icon} Last stored check: {last_check['status']} at {last_check['timestamp'][:19].replace('T', ' ')}"
+            + (f" | Updated {get_now().strftime('%H:%M:%S')}" if live_mode else "")
+        )
+
+    st.subheader("SLA Snapshot")
+    sla_window = st.radio("Window", list(SLA_WINDOWS), horizontal=True, label_visibility="collapsed")
+    sla = compute_sla(SLA_WINDOWS[sla_window])
+    k1, k2, k3, k4 = st.columns(4)
+    k1.metric("Uptime", f"{sla['uptime_pct']}%" if sla["uptime_pct"] is not None else "-")
+    k2.metric("Checks", str(sla["checks_count"]))
+    k3.metric("Outages", str(sla["outages"]))
+    k4.metric("Avg speed", f"{sla['avg_speed']} Mbps" if sla["avg_speed"] is not None else "-")
+
+
+overview_panel()
 
 st.subheader("Connectivity Check")
 st.caption("Targets: " + ", ".join(TARGETS))
@@ -521,23 +173,16 @@ with col_auto:
         value=True,
         disabled=not can_run_operations,
     )
-if not can_run_operations:
+if DASHBOARD_READ_ONLY:
+    st.caption("Read-only dashboard: probes are run by the background agent (python -m netmon run-agent).")
+elif not can_run_operations:
     st.caption("Read-only mode: your role can view status but cannot run active checks.")
 
 if run_connectivity and can_run_operations:
-    current_status = check_connection(TARGETS)
-    down_started, down_recovered = track_incident_transition(current_status)
-    save_check(current_status)
-    st.session_state.last_status = current_status
-
-    if down_started:
-        msg = f"🚨 Incident started at {get_now().strftime('%Y-%m-%d %H:%M:%S')} (internet DOWN)"
-        send_telegram_alert(msg)
-        st.session_state.event_message = msg
-    elif down_recovered:
-        msg = f"✅ Incident recovered at {get_now().strftime('%Y-%m-%d %H:%M:%S')} (internet UP)"
-        send_telegram_alert(msg)
-        st.session_state.event_message = msg
+    connection_result = run_connectivity_job()
+    st.session_state.last_status = connection_result["status"]
+    if connection_result["event_message"]:
+        st.session_state.event_message = connection_result["event_message"]
 
 if st.session_state.last_status == "DOWN":
     st.error("🚨 Internet is DOWN")
@@ -549,59 +194,48 @@ else:
 if st.session_state.event_message:
     st.info(st.session_state.event_message)
 
+last_targets = get_last_check_targets()
+if not last_targets.empty:
+    st.caption(f"Per-target results (quorum: {CONNECTIVITY_QUORUM})")
+    st.dataframe(last_targets, width="stretch")
+
+target_health = get_target_health()
+if not target_health.empty:
+    unhealthy = int((target_health["state"] != "closed").sum())
+    with st.expander(f"Target health ({unhealthy} skipped)" if unhealthy else "Target health"):
+        st.caption("Targets failing repeatedly are skipped until retry_at; timeouts adapt to each target's p95.")
+        st.dataframe(target_health, width="stretch")
+
 
 st.subheader("Speed Monitoring (Download + Latency)")
 st.caption(
-    f"Threshold: {SPEED_DROP_THRESHOLD_MBPS:.1f} Mbps | "
+    f"Drop threshold: per-hour baseline ({SPEED_DROP_THRESHOLD_MBPS:.1f} Mbps until enough history) | "
     f"Auto quick-test interval: {QUICK_TEST_INTERVAL_SECONDS}s"
 )
 
-c1, c2 = st.columns(2)
+c1, c2, c3 = st.columns(3)
 full_clicked = c1.button("Run full speed test", disabled=not can_run_operations)
 quick_clicked = c2.button("Run quick speed test", disabled=not can_run_operations)
+adaptive_clicked = c3.button("Run adaptive speed test", disabled=not can_run_operations)
 
-if full_clicked or quick_clicked:
-    mode = "full" if full_clicked else "quick"
+if full_clicked or quick_clicked or adaptive_clicked:
+    mode = "full" if full_clicked else "adaptive" if adaptive_clicked else "quick"
     with st.spinner(f"Running {mode} speed test..."):
-        result = run_speed_test(mode)
-
-    speed_value = result["download_mbps"]
-    drop_detected = speed_value is not None and speed_value < SPEED_DROP_THRESHOLD_MBPS
-    save_speed_check(result, drop_detected)
-    st.session_state.latest_speed = result
-
-    if drop_detected:
-        st.session_state.speed_alert = (
-            f"⚠️ Speed dropped to {speed_value:.2f} Mbps (< {SPEED_DROP_THRESHOLD_MBPS:.1f} Mbps). "
-            "Running automatic quick verification now..."
-        )
-        send_telegram_alert(st.session_state.speed_alert)
-        with st.spinner("Running automatic quick verification..."):
-            quick_result = run_speed_test("quick")
-        quick_drop = (
-            quick_result["download_mbps"] is not None
-            and quick_result["download_mbps"] < SPEED_DROP_THRESHOLD_MBPS
-        )
-        save_speed_check(quick_result, quick_drop)
-        st.session_state.latest_speed = quick_result
+        speed_job = run_speed_job(mode)
+    if speed_job["joined"]:
+        st.caption("A speed test was already running elsewhere; showing its result instead of starting another.")
+    st.session_state.latest_speed = {**speed_job["result"], "drop": speed_job["drop"]}
+    if speed_job["alert"]:
+        st.session_state.speed_alert = speed_job["alert"]
 
 
 if auto_quick_test and st.session_state.last_status == "UP" and run_connectivity:
-    seconds_since_last = _seconds_since_last_speed_test()
-    if seconds_since_last is None or seconds_since_last >= QUICK_TEST_INTERVAL_SECONDS:
-        with st.spinner("Auto-running quick speed test..."):
-            quick_result = run_speed_test("quick")
-        quick_drop = (
-            quick_result["download_mbps"] is not None
-            and quick_result["download_mbps"] < SPEED_DROP_THRESHOLD_MBPS
-        )
-        save_speed_check(quick_result, quick_drop)
-        st.session_state.latest_speed = quick_result
-        if quick_drop:
-            st.session_state.speed_alert = (
-                f"🚨 Low speed detected automatically: {quick_result['download_mbps']:.2f} Mbps"
-            )
-            send_telegram_alert(st.session_state.speed_alert)
+    with st.spinner("Auto-running quick speed test..."):
+        auto_job = run_auto_quick_job()
+    if auto_job is not None:
+        st.session_state.latest_speed = {**auto_job["result"], "drop": auto_job["drop"]}
+        if auto_job["alert"]:
+            st.session_state.speed_alert = auto_job["alert"]
 
 if st.session_state.speed_alert:
     st.error(st.session_state.speed_alert)
@@ -612,32 +246,118 @@ if latest:
     lat = latest["latency_ms"]
     dl_text = f"{dl:.2f} Mbps" if dl is not None else "unavailable"
     st.info(f"Latest speed result → Mode: {latest['mode']} | Download: {dl_text}")
+    drop = latest.get("drop")
+    if drop and drop["basis"] in ("hour", "ewma") and dl is not None:
+        usual = "usual for this hour" if drop["basis"] == "hour" else "recent average"
+        st.caption(f"{usual.capitalize()}: {drop['expected']:.1f} Mbps | Drop below {drop['threshold']:.1f} Mbps")
+    if latest.get("ci_mbps") is not None:
+        st.caption(
+            f"±{latest['ci_mbps']:.2f} Mbps (95%) from {latest['sample_count']} samples "
+            f"after {latest['ramp_samples']} ramp-up samples | Stopped: {latest['stop_reason']}"
+        )
     if lat is not None:
-        st.caption(f"Latency: {lat:.1f} ms")
-
-st.subheader("Recent checks")
-recent_checks = get_recent_checks()
-if recent_checks.empty:
-    st.write("No stored checks yet.")
+        phases = " | ".join(
+            f"{column[:-3].upper()}: {latest[column]:.1f} ms"
+            for column in PHASE_COLUMNS
+            if latest.get(column) is not None
+        )
+        st.caption(f"Latency: {lat:.1f} ms ({phases})")
+    if latest.get("streams"):
+        st.caption(f"Per-stream stats ({latest['bytes'] / 1_000_000:.1f} MB in total)")
+        st.dataframe(pd.DataFrame(latest["streams"]).round(2), width="stretch")
+    if latest.get("skipped_servers"):
+        st.caption("Skipped (circuit open): " + ", ".join(latest["skipped_servers"]))
+
+speed_baselines = get_baselines()
+if not speed_baselines.empty:
+    with st.expander("Download baselines by hour"):
+        st.caption("Median and MAD of recent tests at each hour of day; a test below the threshold counts as a drop.")
+        st.dataframe(speed_baselines, width="stretch")
+
+if SERVER_POOL.ranking:
+    with st.expander("Speed-test servers by RTT"):
+        st.caption(f"Tests use the {SPEED_TEST_SERVER_COUNT} nearest reachable server(s); the ranking is re-measured in the background.")
+        st.dataframe(pd.DataFrame(SERVER_POOL.ranking).round(1), width="stretch")
+
+st.subheader("Latency, jitter and loss")
+st.caption(
+    f"Bursts of {LATENCY_BURST_COUNT} requests every {LATENCY_BURST_INTERVAL_MS:.0f} ms "
+    "over a kept-alive connection to each endpoint"
+)
+if st.button("Run latency burst", disabled=not can_run_operations):
+    with st.spinner("Measuring latency distribution..."):
+        run_latency_job()
+recent_latency = get_recent_latency_probes()
+if recent_latency.empty:
+    st.write("No latency bursts yet.")
 else:
-    st.dataframe(recent_checks, width="stretch")
+    st.dataframe(recent_latency, width="stretch")
+
+st.subheader("History")
+chart_range = st.radio("Range", list(CHART_RANGES), index=2, horizontal=True, label_visibility="collapsed")
+rollup_series = get_rollup_series(CHART_RANGES[chart_range])
+latency_series = get_latency_series(CHART_RANGES[chart_range])
+uptime_tab, speed_tab, latency_tab = st.tabs(["Uptime", "Speed", "Latency"])
+with uptime_tab:
+    if rollup_series["uptime_pct"].notna().any():
+        st.plotly_chart(uptime_figure(rollup_series), width="stretch")
+    else:
+        st.write("No checks in this range.")
+with speed_tab:
+    if rollup_series["speed_avg"].notna().any():
+        # مع خطوط الأساس: أدنى عتبة ساعية، فما تحت الخط هبوط في أي ساعة من اليوم
+        threshold = SPEED_DROP_THRESHOLD_MBPS if speed_baselines.empty else speed_baselines["threshold"].min()
+        st.plotly_chart(speed_figure(rollup_series, threshold), width="stretch")
+    else:
+        st.write("No speed tests in this range.")
+with latency_tab:
+    if latency_series.empty:
+        st.write("No latency bursts in this range.")
+    else:
+        st.plotly_chart(latency_figure(latency_series), width="stretch")
 
-st.subheader("Recent speed checks")
-recent_speed = get_recent_speed_checks()
-if recent_speed.empty:
-    st.write("No speed checks yet.")
-else:
-    st.dataframe(recent_speed, width="stretch")
 
-if can_view_incidents:
-    st.subheader("Incident timeline")
-    incident_df = get_incidents()
-    if incident_df.empty:
-        st.write("No incidents yet.")
+@st.fragment(run_every=refresh_every)
+def recent_panel(title: str, table: str, empty_text: str) -> None:
+    st.subheader(title)
+    recent = live_table(table).frame()
+    if recent.empty:
+        st.write(empty_text)
     else:
-        st.dataframe(incident_df, width="stretch")
+        st.dataframe(recent, width="stretch")
+
+
+recent_panel("Recent checks", "checks", "No stored checks yet.")
+recent_panel("Recent speed checks", "speed_checks", "No speed checks yet.")
+
+remote_sites = get_remote_sites()
+if not remote_sites.empty:
+    st.subheader("Branch sites")
+    st.dataframe(remote_sites, width="stretch")
+
+if can_view_incidents:
+    recent_panel("Incident timeline", "incidents", "No incidents yet.")
+
+if can_view_incidents:
+    st.subheader("Export")
+    e1, e2, e3 = st.columns(3)
+    export_table = e1.selectbox("Table", list(EXPORT_TABLES))
+    export_range = e2.selectbox("Range", ["All", *CHART_RANGES], index=3)
+    export_format = e3.radio("Format", list(EXPORT_FORMATS), horizontal=True)
+    export_gzip = st.checkbox("Compress (gzip)", value=True)
+    export_since = None if export_range == "All" else int(now.timestamp()) - CHART_RANGES[export_range] * 3600
+    # الملف يُولَّد عند النقر فقط، في خيط منفصل عن إعادة تشغيل السكربت
+    st.download_button(
+        "Download export",
+        data=lambda: export_bytes(export_table, export_format, export_since, compress=export_gzip),
+        file_name=f"{export_table}-{now.strftime('%Y%m%d-%H%M')}.{export_format}" + (".gz" if export_gzip else ""),
+        mime="application/gzip" if export_gzip else EXPORT_FORMATS[export_format],
+    )
+    st.caption("For very large ranges use the CLI, which streams with constant memory: python -m netmon export --help")
 
 if TELEGRAM_BOT_TOKEN and TELEGRAM_CHAT_ID:
     st.caption("Telegram alerts are enabled.")
 else:
     st.caption("Telegram alerts are disabled. Set TELEGRAM_BOT_TOKEN and TELEGRAM_CHAT_ID to enable.")
+
+RENDER_SECONDS.observe(time.perf_counter() - render_started)
@@ -0,0 +1,331 @@
+import argparse
+import logging
+import os
+import signal
+import threading
+
+from netmon.config import (
+    AGENT_ID,
+    AGENT_CHECK_INTERVAL_SECONDS,
+    AGENT_COMPACTION_INTERVAL_SECONDS,
+    AGENT_JITTER_FRACTION,
+    AGENT_LATENCY_INTERVAL_SECONDS,
+    AGENT_SPEED_INTERVAL_SECONDS,
+    EXPORT_CHUNK_ROWS,
+    INGEST_URL,
+    METRICS_PORT,
+    MIGRATION_CHUNK_PAUSE_SECONDS,
+    MIGRATION_CHUNK_ROWS,
+    REMOTE_PUSH_INTERVAL_SECONDS,
+    REMOTE_SPOOL_PATH,
+    RETENTION_BATCH_ROWS,
+    RETENTION_PAUSE_SECONDS,
+    SITE_ID,
+)
+
+
+def _cmd_run_agent(args: argparse.Namespace) -> None:
+    from netmon.agent import build_jobs, run_agent
+    from netmon.alerts import drain_alerts
+    from netmon.metrics import start_metrics_server
+
+    start_metrics_server(args.metrics_port)
+    stop_event = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stop_event.set())
+
+    jobs = build_jobs(
+        args.check_interval, args.speed_interval, args.jitter, args.compaction_interval, args.latency_interval
+    )
+    run_agent(jobs, once=args.once, stop_event=stop_event)
+    drain_alerts()
+
+
+def _cmd_run_probe(args: argparse.Namespace) -> None:
+    from netmon.agent import ScheduledJob, acquire_instance_lock, run_schedule
+    from netmon.metrics import start_metrics_server
+    from netmon.remote import Spool, SpoolPusher, probe_connectivity, probe_speed
+
+    if not args.site_id or not args.ingest_url:
+        raise SystemExit("run-probe needs --site-id and --ingest-url (or SITE_ID / INGEST_URL)")
+    start_metrics_server(args.metrics_port)
+    stop_event = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stop_event.set())
+
+    lock_handle = acquire_instance_lock(f"{args.spool}.lock")
+    spool = Spool(args.spool)
+    pusher = SpoolPusher(spool, args.ingest_url, site_id=args.site_id, agent_id=args.agent_id)
+    jobs = []
+    if args.check_interval > 0:
+        jobs.append(ScheduledJob("connectivity", lambda: probe_connectivity(spool), args.check_interval, args.jitter))
+    if args.speed_interval > 0:
+        jobs.append(ScheduledJob("speed", lambda: probe_speed(spool), args.speed_interval, args.jitter))
+    jobs.append(ScheduledJob("push", pusher.push, args.push_interval, args.jitter))
+    try:
+        run_schedule(jobs, once=args.once, stop_event=stop_event)
+    finally:
+        spool.close()
+        if lock_handle is not None:
+            lock_handle.close()
+
+
+def _cmd_serve_ingest(args: argparse.Namespace) -> None:
+    from netmon.ingest import create_app
+
+    # للإنتاج: gunicorn -w 1 --threads 16 "netmon.ingest:create_app()"
+    create_app().run(host=args.host, port=args.port, threaded=True)
+
+
+def _cmd_migrate(args: argparse.Namespace) -> None:
+    from netmon.db import init_db
+    from netmon.migrations import SCHEMA_VERSION, pending_backfills, run_backfills
+
+    init_db(background_backfill=False)
+    print(f"Schema version: {SCHEMA_VERSION}")
+    for backfill in pending_backfills():
+        print(f"Backfilling {backfill['table']}.{backfill['column']} up to id {backfill['last_id']}")
+    if not args.no_backfill:
+        rows = run_backfills(chunk_rows=args.chunk_rows, pause_seconds=args.pause)
+        print(f"Backfilled {rows} rows")
+
+
+def _cmd_compact(args: argparse.Namespace) -> None:
+    from netmon.db import init_db
+    from netmon.retention import compact, enable_incremental_vacuum
+
+    init_db(background_backfill=False)
+    if args.vacuum:
+        print("Converting to incremental auto_vacuum (full VACUUM)...")
+        enable_incremental_vacuum()
+    for key, value in compact(batch_rows=args.batch_rows, pause_seconds=args.pause).items():
+        print(f"{key}: {value}")
+
+
+def _cmd_rebuild_baselines(args: argparse.Namespace) -> None:
+    from netmon.db import init_db, rebuild_anomaly_baselines
+
+    init_db(background_backfill=False)
+    rows = rebuild_anomaly_baselines()
+    if rows is None:
+        raise SystemExit("Rebuilding baselines failed; see the log for the database error")
+    print(f"baselines: {rows} (metric, hour) rows rebuilt from history")
+
+
+def _cmd_export(args: argparse.Namespace) -> None:
+    import gzip
+    import sys
+
+    from netmon.db import init_db
+    from netmon.export import parse_time, stream_export
+
+    init_db(background_backfill=False)
+    since = parse_time(args.since) if args.since else None
+    until = parse_time(args.until) if args.until else None
+    chunks = stream_export(args.table, args.format, since, until, chunk_rows=args.chunk_rows)
+    if not args.output or args.output == "-":
+        for chunk in chunks:
+            sys.stdout.write(chunk)
+        sys.stdout.flush()
+        return
+    opener = gzip.open if args.output.endswith(".gz") else open
+    with opener(args.output, "wt", encoding="utf-8", newline="") as handle:
+        for chunk in chunks:
+            handle.write(chunk)
+
+
+def _cmd_servers(args: argparse.Namespace) -> None:
+    from netmon.servers import SERVER_POOL
+
+    for position, server in enumerate(SERVER_POOL.rank(), start=1):
+        rtt = f"{server['rtt_ms']:.1f} ms" if server["rtt_ms"] is not None else f"unreachable ({server['error']})"
+        print(f"{position}. {server['name']}  {rtt}  {server['url']}")
+
+
+def _cmd_bench(args: argparse.Namespace) -> None:
+    import json
+    import tempfile
+
+    from netmon.bench import run_benchmarks
+
+    workdir = args.workdir or os.path.join(tempfile.gettempdir(), "netmon-bench")
+    os.makedirs(workdir, exist_ok=True)
+    report = run_benchmarks(args.rows, args.repeat, args.suite, workdir)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            handle.write(output + "\n")
+    else:
+        print(output)
+
+
+def _cmd_loadtest(args: argparse.Namespace) -> None:
+    import json
+    import tempfile
+
+    from netmon.loadtest import prepare_database, run_load_test
+
+    workdir = args.workdir or os.path.join(tempfile.gettempdir(), "netmon-bench")
+    os.makedirs(workdir, exist_ok=True)
+    path = args.db or prepare_database(workdir, args.rows)
+    report = run_load_test(
+        path,
+        sessions=args.sessions,
+        seconds=args.duration,
+        think_seconds=args.think,
+        check_rate=args.check_rate,
+        speed_rate=args.speed_rate,
+        writer_processes=max(1, args.writer_processes),
+    )
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            handle.write(output + "\n")
+    else:
+        print(output)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m netmon", description="Network monitor tools")
+    parser.add_argument("--log-level", default="INFO")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    agent = subparsers.add_parser("run-agent", help="Run connectivity and speed probes on a schedule")
+    agent.add_argument(
+        "--check-interval",
+        type=float,
+        default=AGENT_CHECK_INTERVAL_SECONDS,
+        help="Seconds between connectivity checks (0 disables)",
+    )
+    agent.add_argument(
+        "--speed-interval",
+        type=float,
+        default=AGENT_SPEED_INTERVAL_SECONDS,
+        help="Seconds between quick speed tests (0 disables)",
+    )
+    agent.add_argument(
+        "--compaction-interval",
+        type=float,
+        default=AGENT_COMPACTION_INTERVAL_SECONDS,
+        help="Seconds between retention/compaction runs (0 disables)",
+    )
+    agent.add_argument(
+        "--latency-interval",
+        type=float,
+        default=AGENT_LATENCY_INTERVAL_SECONDS,
+        help="Seconds between latency bursts (0 disables)",
+    )
+    agent.add_argument(
+        "--jitter", type=float, default=AGENT_JITTER_FRACTION, help="Random +/- fraction applied to each interval"
+    )
+    agent.add_argument("--once", action="store_true", help="Run every job once and exit")
+    agent.add_argument("--metrics-port", type=int, default=METRICS_PORT, help="Serve /metrics on this port (0 disables)")
+    agent.set_defaults(func=_cmd_run_agent)
+
+    probe = subparsers.add_parser("run-probe", help="Run a branch-site probe agent that pushes to a central ingest URL")
+    probe.add_argument("--site-id", default=SITE_ID, help="Branch site name")
+    probe.add_argument("--agent-id", default=AGENT_ID, help="Agent name within the site (default: hostname)")
+    probe.add_argument("--ingest-url", default=INGEST_URL, help="Central /ingest endpoint")
+    probe.add_argument("--spool", default=REMOTE_SPOOL_PATH, help="Local SQLite buffer for unsent results")
+    probe.add_argument("--check-interval", type=float, default=AGENT_CHECK_INTERVAL_SECONDS)
+    probe.add_argument("--speed-interval", type=float, default=AGENT_SPEED_INTERVAL_SECONDS)
+    probe.add_argument("--push-interval", type=float, default=REMOTE_PUSH_INTERVAL_SECONDS)
+    probe.add_argument("--jitter", type=float, default=AGENT_JITTER_FRACTION)
+    probe.add_argument("--once", action="store_true", help="Probe and push once, then exit")
+    probe.add_argument("--metrics-port", type=int, default=METRICS_PORT, help="Serve /metrics on this port (0 disables)")
+    probe.set_defaults(func=_cmd_run_probe)
+
+    ingest = subparsers.add_parser("serve-ingest", help="Serve the central ingest endpoint for probe agents")
+    ingest.add_argument("--host", default="0.0.0.0")
+    ingest.add_argument("--port", type=int, default=8080)
+    ingest.set_defaults(func=_cmd_serve_ingest)
+
+    migrate = subparsers.add_parser("migrate", help="Upgrade the database schema and backfill in chunks")
+    migrate.add_argument("--chunk-rows", type=int, default=MIGRATION_CHUNK_ROWS, help="Rows per backfill transaction")
+    migrate.add_argument(
+        "--pause", type=float, default=MIGRATION_CHUNK_PAUSE_SECONDS, help="Seconds to pause between chunks"
+    )
+    migrate.add_argument(
+        "--no-backfill", action="store_true", help="Only apply schema changes; leave backfill to the running app"
+    )
+    migrate.set_defaults(func=_cmd_migrate)
+
+    compact = subparsers.add_parser("compact", help="Apply retention tiers, downsample and reclaim space")
+    compact.add_argument("--batch-rows", type=int, default=RETENTION_BATCH_ROWS, help="Rows per delete transaction")
+    compact.add_argument("--pause", type=float, default=RETENTION_PAUSE_SECONDS, help="Seconds to pause between chunks")
+    compact.add_argument(
+        "--vacuum",
+        action="store_true",
+        help="Run a one-time full VACUUM to switch an existing database to incremental auto_vacuum",
+    )
+    compact.set_defaults(func=_cmd_compact)
+
+    baselines = subparsers.add_parser(
+        "rebuild-baselines", help="Recompute per-hour anomaly baselines from all stored speed and latency history"
+    )
+    baselines.set_defaults(func=_cmd_rebuild_baselines)
+
+    from netmon.export import EXPORT_FORMATS, EXPORT_TABLES
+
+    export = subparsers.add_parser("export", help="Stream a table as CSV or NDJSON with constant memory")
+    export.add_argument("table", choices=list(EXPORT_TABLES))
+    export.add_argument("--format", choices=list(EXPORT_FORMATS), default="csv")
+    export.add_argument("--since", help="Start time: ISO date/datetime (Riyadh time if naive) or relative, e.g. 7d, 24h")
+    export.add_argument("--until", help="End time (exclusive), same forms as --since")
+    export.add_argument("--output", help="File to write (.gz is compressed); stdout when omitted")
+    export.add_argument("--chunk-rows", type=int, default=EXPORT_CHUNK_ROWS, help="Rows per read")
+    export.set_defaults(func=_cmd_export)
+
+    servers = subparsers.add_parser("servers", help="Rank the speed-test server pool by TCP round-trip time")
+    servers.set_defaults(func=_cmd_servers)
+
+    bench = subparsers.add_parser("bench", help="Benchmark probes, alerts, storage and startup against local stand-ins")
+    bench.add_argument(
+        "--suite",
+        nargs="+",
+        choices=["probes", "alerts", "storage", "startup"],
+        default=["probes", "alerts", "storage", "startup"],
+        help="Benchmark groups to run",
+    )
+    bench.add_argument(
+        "--rows",
+        nargs="+",
+        type=int,
+        default=[10_000, 100_000, 1_000_000, 10_000_000],
+        help="Synthetic results.db sizes (rows in checks) for the storage suite; each is built once and reused",
+    )
+    bench.add_argument("--repeat", type=int, default=5, help="Timed runs per benchmark")
+    bench.add_argument("--workdir", help="Where synthetic databases are built and reused (default: system temp)")
+    bench.add_argument("--output", help="Write the JSON report here instead of stdout")
+    bench.set_defaults(func=_cmd_bench)
+
+    loadtest = subparsers.add_parser(
+        "loadtest", help="Simulate concurrent dashboard sessions and probe writers against one database"
+    )
+    loadtest.add_argument("--sessions", type=int, default=20, help="Concurrent dashboard sessions")
+    loadtest.add_argument("--duration", type=float, default=60, help="Seconds to run")
+    loadtest.add_argument("--think", type=float, default=5, help="Seconds each session waits between renders")
+    loadtest.add_argument(
+        "--check-rate",
+        type=float,
+        default=2,
+        help="record_check calls per second (save_check at half, legacy track_incident_transition at a quarter)",
+    )
+    loadtest.add_argument("--speed-rate", type=float, default=0.2, help="save_speed_check calls per second")
+    loadtest.add_argument("--writer-processes", type=int, default=1, help="Separate processes sharing the write rates")
+    loadtest.add_argument("--rows", type=int, default=100_000, help="Synthetic database size (rows in checks)")
+    loadtest.add_argument("--db", help="Run against a copy you made of an existing database instead")
+    loadtest.add_argument("--workdir", help="Where the synthetic database is built (default: system temp)")
+    loadtest.add_argument("--output", help="Write the JSON report here instead of stdout")
+    loadtest.set_defaults(func=_cmd_loadtest)
+    return parser
+
+
+def main(argv: list[str] | None = None) -> None:
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
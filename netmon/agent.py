@@ -0,0 +1,154 @@
+import logging
+import random
+import threading
+import time
+from collections.abc import Callable
+
+from netmon.alerts import start_alert_dispatcher
+from netmon.config import (
+    AGENT_CHECK_INTERVAL_SECONDS,
+    AGENT_COMPACTION_INTERVAL_SECONDS,
+    AGENT_JITTER_FRACTION,
+    AGENT_LATENCY_INTERVAL_SECONDS,
+    AGENT_LOCK_PATH,
+    AGENT_SPEED_INTERVAL_SECONDS,
+)
+from netmon.db import init_db
+from netmon.jobs import run_auto_quick_job, run_connectivity_job, run_latency_job
+from netmon.metrics import counter, histogram
+from netmon.retention import compact
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+JOB_SECONDS = histogram("netmon_agent_job_seconds", "Duration of scheduled agent jobs")
+JOB_FAILURES = counter("netmon_agent_job_failures_total", "Scheduled agent jobs that raised")
+
+
+class ScheduledJob:
+    def __init__(self, name: str, func: Callable[[], object], interval: float, jitter_fraction: float):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.jitter_fraction = jitter_fraction
+        self.next_due = time.monotonic()
+        self.thread: threading.Thread | None = None
+
+    def schedule_next(self, now: float) -> None:
+        jitter = random.uniform(-self.jitter_fraction, self.jitter_fraction) * self.interval
+        self.next_due = now + max(1.0, self.interval + jitter)
+
+    def run(self) -> None:
+        started = time.monotonic()
+        try:
+            result = self.func()
+            logger.info("%s finished in %.1fs: %s", self.name, time.monotonic() - started, _summarize(result))
+        except Exception:
+            JOB_FAILURES.inc(job=self.name)
+            logger.exception("%s failed", self.name)
+        finally:
+            JOB_SECONDS.observe(time.monotonic() - started, job=self.name)
+
+
+def _summarize(result: object) -> str:
+    if result is None:
+        return "skipped"
+    if isinstance(result, list):
+        return ", ".join(
+            f"{item['target']}: p50 "
+            + ("-" if item["p50_ms"] is None else f"{item['p50_ms']:.1f} ms")
+            + f", loss {item['loss_pct']:.0f}%"
+            for item in result
+        )
+    if not isinstance(result, dict):
+        return str(result)
+    if "status" in result:
+        return result["status"]
+    download_mbps = (result.get("result") or {}).get("download_mbps")
+    return f"{download_mbps:.2f} Mbps" if download_mbps is not None else "no throughput"
+
+
+def acquire_instance_lock(path: str):
+    if fcntl is None:
+        return None
+    handle = open(path, "a+")
+    try:
+        fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        handle.close()
+        raise SystemExit(f"Another agent already holds {path}")
+    return handle
+
+
+def build_jobs(
+    check_interval: float = AGENT_CHECK_INTERVAL_SECONDS,
+    speed_interval: float = AGENT_SPEED_INTERVAL_SECONDS,
+    jitter_fraction: float = AGENT_JITTER_FRACTION,
+    compaction_interval: float = AGENT_COMPACTION_INTERVAL_SECONDS,
+    latency_interval: float = AGENT_LATENCY_INTERVAL_SECONDS,
+) -> list[ScheduledJob]:
+    jobs = []
+    if check_interval > 0:
+        jobs.append(ScheduledJob("connectivity", run_connectivity_job, check_interval, jitter_fraction))
+    if speed_interval > 0:
+        # الاختبار اليدوي من اللوحة يؤجل الاختبار المجدول بدل أن يتكرر فوقه
+        jobs.append(
+            ScheduledJob(
+                "speed",
+                lambda: run_auto_quick_job(int(speed_interval * (1 - jitter_fraction))),
+                speed_interval,
+                jitter_fraction,
+            )
+        )
+    if latency_interval > 0:
+        jobs.append(ScheduledJob("latency", run_latency_job, latency_interval, jitter_fraction))
+    if compaction_interval > 0:
+        jobs.append(ScheduledJob("compaction", compact, compaction_interval, jitter_fraction))
+    return jobs
+
+
+def run_schedule(jobs: list[ScheduledJob], once: bool = False, stop_event: threading.Event | None = None) -> None:
+    stop_event = stop_event or threading.Event()
+    logger.info("Agent started with jobs: %s", ", ".join(f"{job.name}/{job.interval:g}s" for job in jobs))
+
+    try:
+        if once:
+            for job in jobs:
+                job.run()
+            return
+
+        while not stop_event.is_set():
+            now = time.monotonic()
+            for job in jobs:
+                if now < job.next_due:
+                    continue
+                # حماية من التداخل: لا تبدأ دورة جديدة والسابقة ما زالت تعمل
+                if job.thread is not None and job.thread.is_alive():
+                    logger.warning("%s still running, skipping this cycle", job.name)
+                else:
+                    job.thread = threading.Thread(target=job.run, name=f"agent-{job.name}", daemon=True)
+                    job.thread.start()
+                job.schedule_next(now)
+            next_due = min((job.next_due for job in jobs), default=now + 60)
+            stop_event.wait(max(0.1, next_due - time.monotonic()))
+    finally:
+        for job in jobs:
+            if job.thread is not None:
+                job.thread.join(timeout=30)
+        logger.info("Agent stopped")
+
+
+def run_agent(jobs: list[ScheduledJob], once: bool = False, stop_event: threading.Event | None = None) -> None:
+    lock_handle = acquire_instance_lock(AGENT_LOCK_PATH)
+    try:
+        init_db()
+        # يرسل ما تبقّى في صندوق التنبيهات من تشغيل سابق
+        start_alert_dispatcher()
+        run_schedule(jobs, once=once, stop_event=stop_event)
+    finally:
+        if lock_handle is not None:
+            lock_handle.close()
@@ -0,0 +1,263 @@
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections.abc import Callable
+
+import requests
+
+from netmon import config
+from netmon.config import (
+    ALERT_BACKOFF_BASE_SECONDS,
+    ALERT_BACKOFF_MAX_SECONDS,
+    ALERT_COALESCE_SECONDS,
+    ALERT_LEASE_SECONDS,
+    ALERT_MAX_ATTEMPTS,
+    ALERT_RATE_LIMIT_SECONDS,
+    ALERT_SEND_TIMEOUT_SECONDS,
+)
+from netmon.engine import read_connection, write
+from netmon.httpclient import get_http_session
+from netmon.metrics import counter, gauge, histogram
+from netmon.utils import format_duration
+
+logger = logging.getLogger(__name__)
+
+IDLE_WAIT_SECONDS = 60
+
+ALERT_SEND_SECONDS = histogram("netmon_alert_send_seconds", "Duration of alert API calls")
+ALERT_DELIVERIES = counter("netmon_alert_deliveries_total", "Outbox delivery attempts by outcome")
+
+
+# تُقرأ من config وقت الإرسال، فيمكن توجيهها إلى خادم محلي في القياسات
+def _telegram_configured() -> bool:
+    return bool(config.TELEGRAM_BOT_TOKEN and config.TELEGRAM_CHAT_ID)
+
+
+@ALERT_SEND_SECONDS.time(channel="telegram")
+def _post_telegram(message: str) -> None:
+    response = get_http_session().post(
+        f"{config.TELEGRAM_API_BASE}/bot{config.TELEGRAM_BOT_TOKEN}/sendMessage",
+        json={"chat_id": config.TELEGRAM_CHAT_ID, "text": message},
+        timeout=ALERT_SEND_TIMEOUT_SECONDS,
+    )
+    response.raise_for_status()
+
+
+def send_telegram_alert(message: str) -> bool:
+    if not _telegram_configured():
+        return False
+    try:
+        _post_telegram(message)
+        return True
+    except requests.RequestException:
+        return False
+
+
+# القناة -> (هل هي مهيأة، دالة إرسال ترفع استثناء عند الفشل)
+CHANNELS: dict[str, tuple[Callable[[], bool], Callable[[str], None]]] = {
+    "telegram": (_telegram_configured, _post_telegram),
+}
+
+
+# ------------------ صندوق التنبيهات ------------------
+# مسار الفحص يكتب التنبيه في alert_outbox ويعود فورًا؛ عامل خلفي يرسله مع إعادة المحاولة
+# بتراجع أُسّي. التنبيهات من النوع نفسه خلال ALERT_COALESCE_SECONDS تُدمج في رسالة واحدة.
+def enqueue_alert(message: str, kind: str | None = None, channel: str = "telegram") -> bool:
+    configured, _ = CHANNELS[channel]
+    if not configured():
+        return False
+    now = int(time.time())
+
+    def enqueue(conn: sqlite3.Connection) -> bool:
+        next_attempt = now
+        if kind is not None:
+            pending = conn.execute(
+                """
+                SELECT id FROM alert_outbox
+                WHERE status = 'pending' AND channel = ? AND kind = ? AND created_ts >= ?
+                ORDER BY id DESC LIMIT 1
+                """,
+                (channel, kind, now - ALERT_COALESCE_SECONDS),
+            ).fetchone()
+            if pending is not None:
+                conn.execute(
+                    "UPDATE alert_outbox SET message = ?, coalesced = coalesced + 1 WHERE id = ?",
+                    (message, pending[0]),
+                )
+                return True
+            # الأول في النافذة يُرسل فورًا، وما بعده يُجمع في رسالة واحدة تُرسل عند نهايتها
+            previous = conn.execute(
+                """
+                SELECT MAX(created_ts) FROM alert_outbox
+                WHERE channel = ? AND kind = ? AND created_ts >= ?
+                """,
+                (channel, kind, now - ALERT_COALESCE_SECONDS),
+            ).fetchone()[0]
+            if previous is not None:
+                next_attempt = previous + ALERT_COALESCE_SECONDS
+        conn.execute(
+            """
+            INSERT INTO alert_outbox (channel, kind, message, created_ts, next_attempt_ts)
+            VALUES (?, ?, ?, ?, ?)
+            """,
+            (channel, kind, message, now, next_attempt),
+        )
+        return True
+
+    queued = bool(write(enqueue))
+    if queued:
+        start_alert_dispatcher().wake.set()
+    return queued
+
+
+def _claim_due(conn: sqlite3.Connection, channels: list[str], now: int) -> list[tuple]:
+    # حالة sending مع مهلة: إن ماتت العملية أثناء الإرسال يعود التنبيه مستحقًا بعد انتهائها
+    claimed = []
+    for channel in channels:
+        row = conn.execute(
+            """
+            SELECT id, kind, message, coalesced, attempts FROM alert_outbox
+            WHERE status IN ('pending', 'sending') AND channel = ? AND next_attempt_ts <= ?
+            ORDER BY id LIMIT 1
+            """,
+            (channel, now),
+        ).fetchone()
+        if row is None:
+            continue
+        conn.execute(
+            "UPDATE alert_outbox SET status = 'sending', attempts = attempts + 1, next_attempt_ts = ? WHERE id = ?",
+            (now + ALERT_LEASE_SECONDS, row[0]),
+        )
+        claimed.append((channel, *row))
+    return claimed
+
+
+def _backoff_seconds(attempts: int) -> float:
+    delay = min(ALERT_BACKOFF_BASE_SECONDS * 2 ** (attempts - 1), ALERT_BACKOFF_MAX_SECONDS)
+    return delay * random.uniform(0.8, 1.2)
+
+
+def _format_message(message: str, coalesced: int) -> str:
+    if coalesced <= 1:
+        return message
+    return f"{message}\n(+{coalesced - 1} similar alerts within {format_duration(ALERT_COALESCE_SECONDS)})"
+
+
+class AlertDispatcher(threading.Thread):
+    def __init__(self) -> None:
+        super().__init__(name="alert-dispatcher", daemon=True)
+        self.wake = threading.Event()
+        self.stop_event = threading.Event()
+        self._last_sent: dict[str, float] = {}
+        self._deliver_lock = threading.Lock()
+
+    def run(self) -> None:
+        while not self.stop_event.is_set():
+            try:
+                delay = self.deliver_due()
+            except Exception:
+                logger.exception("Alert delivery failed")
+                delay = IDLE_WAIT_SECONDS
+            self.wake.wait(delay)
+            self.wake.clear()
+
+    def deliver_due(self) -> float:
+        with self._deliver_lock:
+            now = time.time()
+            ready = [
+                channel
+                for channel, (configured, _) in CHANNELS.items()
+                if configured() and now - self._last_sent.get(channel, 0.0) >= ALERT_RATE_LIMIT_SECONDS
+            ]
+            for channel, alert_id, kind, message, coalesced, attempts in write(
+                lambda conn: _claim_due(conn, ready, int(now))
+            ) or []:
+                self._deliver(channel, alert_id, kind, message, coalesced, attempts)
+            return self._next_delay()
+
+    def _deliver(self, channel: str, alert_id: int, kind: str | None, message: str, coalesced: int, attempts: int):
+        _, send = CHANNELS[channel]
+        self._last_sent[channel] = time.time()
+        try:
+            send(_format_message(message, coalesced))
+        except requests.RequestException as exc:
+            error = str(exc)[:500]
+            attempts += 1
+            if attempts >= ALERT_MAX_ATTEMPTS:
+                logger.error("Giving up on %s alert %d after %d attempts: %s", channel, alert_id, attempts, error)
+                status, next_attempt = "failed", int(time.time())
+                ALERT_DELIVERIES.inc(channel=channel, result="failed")
+            else:
+                logger.warning("Delivering %s alert %d failed (attempt %d): %s", channel, alert_id, attempts, error)
+                status, next_attempt = "pending", int(time.time() + _backoff_seconds(attempts))
+                ALERT_DELIVERIES.inc(channel=channel, result="retry")
+            write(
+                lambda conn: conn.execute(
+                    "UPDATE alert_outbox SET status = ?, next_attempt_ts = ?, last_error = ? WHERE id = ?",
+                    (status, next_attempt, error, alert_id),
+                )
+            )
+            return
+        write(
+            lambda conn: conn.execute(
+                "UPDATE alert_outbox SET status = 'sent', sent_ts = ?, last_error = NULL WHERE id = ?",
+                (int(time.time()), alert_id),
+            )
+        )
+        ALERT_DELIVERIES.inc(channel=channel, result="sent")
+        logger.info("Delivered %s alert %d (%s)", channel, alert_id, kind or "event")
+
+    def _next_delay(self) -> float:
+        with read_connection() as conn:
+            if conn is None:
+                return IDLE_WAIT_SECONDS
+            rows = conn.execute(
+                """
+                SELECT channel, MIN(next_attempt_ts) FROM alert_outbox
+                WHERE status IN ('pending', 'sending') GROUP BY channel
+                """
+            ).fetchall()
+        now = time.time()
+        delays = [IDLE_WAIT_SECONDS]
+        for channel, next_attempt in rows:
+            rate_ready = self._last_sent.get(channel, 0.0) + ALERT_RATE_LIMIT_SECONDS
+            delays.append(max(next_attempt, rate_ready) - now)
+        return max(min(delays), 0.05)
+
+
+def _pending_alerts() -> int | None:
+    with read_connection() as conn:
+        if conn is None:
+            return None
+        return conn.execute("SELECT COUNT(*) FROM alert_outbox WHERE status IN ('pending', 'sending')").fetchone()[0]
+
+
+gauge("netmon_alert_outbox_pending", "Alerts waiting in the outbox", _pending_alerts)
+
+_dispatcher: AlertDispatcher | None = None
+_dispatcher_pid: int | None = None
+_dispatcher_lock = threading.Lock()
+
+
+def start_alert_dispatcher() -> AlertDispatcher:
+    global _dispatcher, _dispatcher_pid
+    with _dispatcher_lock:
+        if _dispatcher is None or _dispatcher_pid != os.getpid() or not _dispatcher.is_alive():
+            _dispatcher = AlertDispatcher()
+            _dispatcher_pid = os.getpid()
+            _dispatcher.start()
+        return _dispatcher
+
+
+def drain_alerts(timeout: float = ALERT_SEND_TIMEOUT_SECONDS) -> None:
+    # تُستدعى قبل خروج العمليات القصيرة (run-agent --once) حتى لا تنتظر التنبيهات التشغيل التالي
+    dispatcher = start_alert_dispatcher()
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        delay = dispatcher.deliver_due()
+        if delay > deadline - time.monotonic():
+            break
+        time.sleep(delay)
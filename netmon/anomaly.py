@@ -0,0 +1,229 @@
+import json
+import math
+import sqlite3
+import statistics
+import threading
+from collections import deque
+from datetime import datetime
+
+from netmon.config import (
+    ANOMALY_EWMA_ALPHA,
+    ANOMALY_MIN_SAMPLES,
+    ANOMALY_MIN_SPREAD_FRACTION,
+    ANOMALY_WINDOW,
+    ANOMALY_Z_THRESHOLD,
+    SPEED_DROP_THRESHOLD_MBPS,
+)
+from netmon.utils import TZ
+
+ALL_HOURS = -1
+# اتجاه الشذوذ لكل مقياس: -1 الانخفاض شذوذ (السرعة)، 1 الارتفاع شذوذ (أزمنة الاستجابة)
+SPEED_METRICS = {"download_mbps": -1, "latency_ms": 1}
+LATENCY_METRIC_PREFIX = "p50_ms:"
+_MAD_TO_SIGMA = 1.4826
+
+
+def hour_of_day(ts: float) -> int:
+    return datetime.fromtimestamp(ts, TZ).hour
+
+
+def metric_direction(metric: str) -> int:
+    return SPEED_METRICS.get(metric, 1)
+
+
+# ------------------ خطوط الأساس ------------------
+# لكل مقياس وساعة من اليوم: آخر ANOMALY_WINDOW قيمة (الوسيط و MAD) ومتوسط/تباين أسّي (EWMA).
+# كل عينة جديدة تحدّث حالة ساعتها وحالة "كل الساعات" بعمل ثابت لا يكبر مع التاريخ.
+class Baseline:
+    def __init__(self, samples: int = 0, ewma: float | None = None, ewvar: float = 0.0, window: list | None = None):
+        self.samples = samples
+        self.ewma = ewma
+        self.ewvar = ewvar
+        self.window: deque[float] = deque(window or [], maxlen=ANOMALY_WINDOW)
+
+    def update(self, value: float) -> None:
+        self.samples += 1
+        self.window.append(value)
+        if self.ewma is None:
+            self.ewma, self.ewvar = value, 0.0
+            return
+        diff = value - self.ewma
+        increment = ANOMALY_EWMA_ALPHA * diff
+        self.ewma += increment
+        self.ewvar = (1 - ANOMALY_EWMA_ALPHA) * (self.ewvar + diff * increment)
+
+    def robust(self) -> tuple[float, float] | None:
+        if not self.window:
+            return None
+        median = statistics.median(self.window)
+        return median, statistics.median(abs(value - median) for value in self.window)
+
+
+def evaluate(metric: str, value: float | None, hourly: Baseline | None, overall: Baseline | None) -> dict:
+    # المتوقع ونطاقه من وسيط الساعة و MAD متى توفرت عينات كافية لها، وإلا من EWMA لكل الساعات.
+    # النطاق لا يقل عن ANOMALY_MIN_SPREAD_FRACTION من المتوقع، فخط ثابت القراءة لا يُنذر بتذبذب صغير.
+    # قبل تجمع أي خط أساس تبقى السرعة على العتبة الثابتة القديمة
+    direction = metric_direction(metric)
+    expected = spread = None
+    basis = None
+    if hourly is not None and len(hourly.window) >= ANOMALY_MIN_SAMPLES:
+        expected, mad = hourly.robust()
+        spread, basis = _MAD_TO_SIGMA * mad, "hour"
+    elif overall is not None and overall.samples >= ANOMALY_MIN_SAMPLES:
+        expected, spread, basis = overall.ewma, math.sqrt(overall.ewvar), "ewma"
+
+    if expected is None:
+        threshold = SPEED_DROP_THRESHOLD_MBPS if metric == "download_mbps" else None
+        basis = "fixed" if threshold is not None else None
+        score = None
+    else:
+        spread = max(spread, ANOMALY_MIN_SPREAD_FRACTION * abs(expected))
+        threshold = max(0.0, expected + direction * ANOMALY_Z_THRESHOLD * spread)
+        score = None if value is None else (value - expected) / spread
+    anomaly = value is not None and threshold is not None and (value - threshold) * direction > 0
+    return {
+        "metric": metric,
+        "value": value,
+        "expected": expected,
+        "threshold": threshold,
+        "score": score,
+        "basis": basis,
+        "anomaly": anomaly,
+    }
+
+
+def describe(verdict: dict) -> str:
+    if verdict["basis"] == "fixed":
+        return f"< {verdict['threshold']:.1f} Mbps"
+    usual = "usual for this hour" if verdict["basis"] == "hour" else "recent average"
+    return f"< {verdict['threshold']:.1f} Mbps; {usual} {verdict['expected']:.1f} Mbps"
+
+
+class AnomalyDetector:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.baselines: dict[tuple[str, int], Baseline] = {}
+        # (مسار القاعدة، مجموع العينات)؛ أي اختلاف يعني كاتبًا آخر أو إعادة بناء فتُقرأ الحالة من جديد
+        self._synced: tuple[str, int] | None = None
+
+    def _total(self) -> int:
+        return sum(baseline.samples for baseline in self.baselines.values())
+
+    def sync(self, conn: sqlite3.Connection, path: str) -> None:
+        total = conn.execute("SELECT COALESCE(SUM(samples), 0) FROM baselines").fetchone()[0]
+        if self._synced != (path, total):
+            self.reload(conn, path)
+
+    def reload(self, conn: sqlite3.Connection, path: str) -> None:
+        self._load(conn)
+        self._synced = (path, self._total())
+
+    def _load(self, conn: sqlite3.Connection) -> None:
+        self.baselines = {
+            (metric, hour): Baseline(samples, ewma, ewvar, json.loads(window))
+            for metric, hour, samples, ewma, ewvar, window in conn.execute(
+                "SELECT metric, hour, samples, ewma, ewvar, window FROM baselines"
+            )
+        }
+
+    def observe(self, conn: sqlite3.Connection, path: str, metric: str, value: float | None, ts: float) -> dict:
+        # العينة تُقارن بخط الأساس قبل أن تدخل فيه، ثم تُضاف ولو كانت شاذة: هبوط دائم
+        # (تغيير الباقة مثلًا) يصبح المعتاد الجديد بعد نصف نافذة بدل أن ينذر إلى الأبد
+        hour = hour_of_day(ts)
+        verdict = evaluate(metric, value, self.baselines.get((metric, hour)), self.baselines.get((metric, ALL_HOURS)))
+        if value is None:
+            return verdict
+        self._synced = None
+        for key in ((metric, hour), (metric, ALL_HOURS)):
+            baseline = self.baselines.setdefault(key, Baseline())
+            baseline.update(value)
+            _upsert(conn, key, baseline, ts)
+        self._synced = (path, self._total())
+        return verdict
+
+
+def _upsert(conn: sqlite3.Connection, key: tuple[str, int], baseline: Baseline, ts: float) -> None:
+    conn.execute(
+        """
+        INSERT OR REPLACE INTO baselines (metric, hour, samples, ewma, ewvar, window, updated_ts)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        """,
+        (*key, baseline.samples, baseline.ewma, baseline.ewvar, json.dumps(list(baseline.window)), int(ts)),
+    )
+
+
+# ------------------ إعادة البناء من التاريخ ------------------
+# الحالة نفسها التي يصل إليها التحديث التدريجي، محسوبة دفعة واحدة بـ pandas: آخر النافذة لكل ساعة،
+# و ewm(adjust=False) يطابق معادلة التحديث أعلاه عينةً بعينة. الحساب يجري على اتصال قراءة حتى id
+# محدد، فلا ينتظر الكاتب إلا استبدال الصفوف وإعادة ما أُضيف بعد ذلك الحد.
+def compute_baselines(conn: sqlite3.Connection) -> tuple[list[tuple], int, int]:
+    import pandas as pd
+
+    last_speed_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM speed_checks").fetchone()[0]
+    last_latency_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM latency_probes").fetchone()[0]
+    speed = pd.read_sql_query(
+        "SELECT ts, download_mbps, latency_ms FROM speed_checks WHERE ts IS NOT NULL AND id <= ? ORDER BY id",
+        conn,
+        params=(last_speed_id,),
+    ).melt(id_vars="ts", var_name="metric")
+    latency = pd.read_sql_query(
+        "SELECT ts, target, p50_ms AS value FROM latency_probes WHERE ts IS NOT NULL AND id <= ? ORDER BY id",
+        conn,
+        params=(last_latency_id,),
+    )
+    latency["metric"] = LATENCY_METRIC_PREFIX + latency.pop("target")
+    # melt يضع المقاييس متتالية؛ الترتيب الزمني داخل كل مقياس محفوظ لأن الترتيب المستقر يحترمه
+    samples = pd.concat([speed, latency], ignore_index=True).dropna(subset=["value"])
+    samples = samples.sort_values(["metric", "ts"], kind="stable")
+    hours = pd.to_datetime(samples["ts"], unit="s", utc=True).dt.tz_convert(TZ).dt.hour
+
+    rows = []
+    for frame in (samples.assign(hour=hours), samples.assign(hour=ALL_HOURS)):
+        grouped = frame.groupby(["metric", "hour"], sort=False)["value"]
+        ewm = grouped.ewm(alpha=ANOMALY_EWMA_ALPHA, adjust=False)
+        summary = pd.DataFrame(
+            {
+                "samples": grouped.size(),
+                "ewma": ewm.mean().groupby(level=[0, 1]).last(),
+                "ewvar": ewm.var(bias=True).fillna(0.0).groupby(level=[0, 1]).last(),
+                "window": grouped.apply(lambda values: json.dumps(values.tail(ANOMALY_WINDOW).tolist())),
+                "updated_ts": frame.groupby(["metric", "hour"], sort=False)["ts"].max(),
+            }
+        )
+        rows.extend(
+            (metric, int(hour), int(row.samples), float(row.ewma), float(row.ewvar), row.window, int(row.updated_ts))
+            for (metric, hour), row in summary.iterrows()
+        )
+    return rows, last_speed_id, last_latency_id
+
+
+def replace_baselines(
+    detector: AnomalyDetector,
+    conn: sqlite3.Connection,
+    path: str,
+    rows: list[tuple],
+    last_speed_id: int,
+    last_latency_id: int,
+) -> None:
+    conn.execute("DELETE FROM baselines")
+    conn.executemany(
+        """
+        INSERT INTO baselines (metric, hour, samples, ewma, ewvar, window, updated_ts)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        """,
+        rows,
+    )
+    detector.reload(conn, path)
+    newer_speed = conn.execute(
+        "SELECT ts, download_mbps, latency_ms FROM speed_checks WHERE id > ? AND ts IS NOT NULL ORDER BY id",
+        (last_speed_id,),
+    ).fetchall()
+    for ts, download_mbps, latency_ms in newer_speed:
+        detector.observe(conn, path, "download_mbps", download_mbps, ts)
+        detector.observe(conn, path, "latency_ms", latency_ms, ts)
+    newer_latency = conn.execute(
+        "SELECT ts, target, p50_ms FROM latency_probes WHERE id > ? AND ts IS NOT NULL ORDER BY id",
+        (last_latency_id,),
+    ).fetchall()
+    for ts, target, p50_ms in newer_latency:
+        detector.observe(conn, path, LATENCY_METRIC_PREFIX + target, p50_ms, ts)
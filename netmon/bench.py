@@ -0,0 +1,454 @@
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from collections.abc import Callable
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+from netmon import config
+from netmon.utils import get_now
+
+DOWNLOAD_CHUNK_BYTES = 64 * 1024
+
+
+# ------------------ خادم بديل للشبكة ------------------
+# كل سلوك يُحدَّد من معاملات الرابط نفسه، فلكل هدف تأخيره وسقف سرعته وأخطاؤه:
+#   /probe?delay_ms=50&status=503      استجابة بعد تأخير وبرمز معيّن
+#   /probe?hang=1                       لا يرد أبدًا (لاختبار المهلة)
+#   /download?size=10000000&rate_mbps=40   ملف بسقف سرعة لكل اتصال، ويدعم Range
+#   POST /bot<token>/sendMessage        بديل Telegram API
+# ولعملاء يبنون المسار بأنفسهم تُمرَّر المعاملات كبادئة: /_/delay_ms=250/bot<token>/sendMessage
+class _StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+    def _params(self) -> dict:
+        parsed = urlparse(self.path)
+        query = parsed.query
+        if parsed.path.startswith("/_/"):
+            query = f"{parsed.path.split('/')[2]}&{query}"
+        return {key: values[-1] for key, values in parse_qs(query).items()}
+
+    def _delay(self, params: dict) -> bool:
+        if params.get("hang"):
+            self.server.stop_event.wait(float(params.get("hang_seconds", 30)))
+            return False
+        time.sleep(float(params.get("delay_ms", 0)) / 1000)
+        return True
+
+    def _reply(self, status: int, body: bytes, content_type: str = "text/plain") -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        params = self._params()
+        if not self._delay(params):
+            self.close_connection = True
+            return
+        path = urlparse(self.path).path
+        if path == "/download":
+            self._download(params)
+        else:
+            self._reply(int(params.get("status", 200)), b"ok")
+
+    def do_POST(self) -> None:
+        params = self._params()
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if not self._delay(params):
+            self.close_connection = True
+            return
+        status = int(params.get("status", 200))
+        self._reply(status, b'{"ok": %s}' % (b"true" if status == 200 else b"false"), "application/json")
+
+    def _download(self, params: dict) -> None:
+        size = int(params.get("size", 10_000_000))
+        rate_bytes = float(params.get("rate_mbps", 0)) * 1_000_000 / 8
+        start, end = 0, size - 1
+        range_header = self.headers.get("Range")
+        if range_header and range_header.startswith("bytes="):
+            first, _, last = range_header[6:].partition("-")
+            start, end = int(first), min(int(last) if last else size - 1, size - 1)
+            if start >= size:
+                self._reply(416, b"")
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        else:
+            self.send_response(200)
+        length = end - start + 1
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(length))
+        self.end_headers()
+
+        chunk = b"\0" * DOWNLOAD_CHUNK_BYTES
+        sent = 0
+        started = time.perf_counter()
+        try:
+            while sent < length:
+                piece = chunk[: min(DOWNLOAD_CHUNK_BYTES, length - sent)]
+                self.wfile.write(piece)
+                sent += len(piece)
+                if rate_bytes:
+                    ahead = sent / rate_bytes - (time.perf_counter() - started)
+                    if ahead > 0:
+                        time.sleep(ahead)
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+
+class StandInServer:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self._server = ThreadingHTTPServer((host, port), _StandInHandler)
+        self._server.daemon_threads = True
+        self._server.stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._server.serve_forever, name="bench-standin", daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def url(self, path: str, **params) -> str:
+        return f"{self.base_url}{path}" + (f"?{urlencode(params)}" if params else "")
+
+    def prefix(self, **params) -> str:
+        return f"{self.base_url}/_/{urlencode(params)}"
+
+    def __enter__(self) -> "StandInServer":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._server.stop_event.set()
+        self._server.shutdown()
+        self._server.server_close()
+
+
+# ------------------ القياس ------------------
+def _timeit(func: Callable[[], object], repeat: int, warmup: int = 1) -> tuple[dict, object]:
+    result = None
+    for _ in range(warmup):
+        result = func()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return _stats(samples), result
+
+
+def _stats(samples: list[float]) -> dict:
+    samples = sorted(samples)
+    return {
+        "runs": len(samples),
+        "min_ms": round(samples[0], 3),
+        "median_ms": round(statistics.median(samples), 3),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+        "mean_ms": round(statistics.fmean(samples), 3),
+        "max_ms": round(samples[-1], 3),
+    }
+
+
+def bench_probes(server: StandInServer, repeat: int) -> dict:
+    from netmon.httpclient import timed_get
+    from netmon.probes import check_connection, run_latency_burst, run_speed_test
+
+    targets = [
+        server.url("/probe", delay_ms=10),
+        server.url("/probe", delay_ms=50),
+        server.url("/probe", delay_ms=200),
+        server.url("/probe", status=503),
+        server.url("/probe", hang=1),
+    ]
+    timeout = 1.0
+    results = {}
+    for name, quorum in (("check_connection_quorum_1", 1), ("check_connection_quorum_3", 3)):
+        stats, outcome = _timeit(lambda: check_connection(targets, quorum=quorum, timeout=timeout), repeat)
+        results[name] = {**stats, "status": outcome["status"], "targets": len(targets), "timeout_s": timeout}
+    stats, outcome = _timeit(lambda: check_connection(targets[3:], quorum=1, timeout=timeout), repeat)
+    results["check_connection_all_down"] = {**stats, "status": outcome["status"], "timeout_s": timeout}
+
+    # الاتصال المجمّع فُتح بمهلة أطول؛ الطلب التالي عليه يجب أن ينقضي عند مهلته هو لا عند hang_seconds
+    def reused_timeout() -> dict:
+        timed_get(server.url("/probe"), timeout=10)
+        return timed_get(server.url("/probe", hang=1, hang_seconds=4), timeout=timeout / 2)
+
+    stats, outcome = _timeit(reused_timeout, repeat)
+    results["timed_get_reused_connection_timeout"] = {
+        **stats,
+        "error": outcome["error"],
+        "timeout_s": timeout / 2,
+        "honours_timeout": stats["max_ms"] < timeout * 1000,
+    }
+
+    burst_targets = [server.url("/probe", delay_ms=5), server.url("/probe", delay_ms=20)]
+    stats, outcome = _timeit(lambda: run_latency_burst(burst_targets, count=20, interval_ms=10), repeat)
+    results["run_latency_burst_2x20"] = {**stats, "p95_ms": [summary["p95_ms"] for summary in outcome]}
+
+    latency_url = server.url("/probe", delay_ms=20)
+    for name, params in (
+        ("run_speed_test_quick_uncapped", {}),
+        ("run_speed_test_quick_40mbps_per_stream", {"rate_mbps": 40}),
+        ("run_speed_test_adaptive_40mbps_per_stream", {"rate_mbps": 40}),
+    ):
+        urls = [server.url("/download", size=50_000_000, **params)]
+        mode = "adaptive" if "adaptive" in name else "quick"
+        stats, outcome = _timeit(
+            lambda: run_speed_test(mode, urls=urls, latency_url=latency_url), max(1, repeat // 2), warmup=0
+        )
+        results[name] = {
+            **stats,
+            "download_mbps": outcome["download_mbps"],
+            "latency_ms": outcome["latency_ms"],
+            "bytes": outcome["bytes"],
+            "sample_count": outcome["sample_count"],
+            "ci_mbps": outcome["ci_mbps"],
+            "stop_reason": outcome["stop_reason"],
+        }
+    return results
+
+
+def bench_alerts(server: StandInServer, repeat: int) -> dict:
+    from netmon.alerts import send_telegram_alert
+
+    saved = (config.TELEGRAM_API_BASE, config.TELEGRAM_BOT_TOKEN, config.TELEGRAM_CHAT_ID)
+    results = {}
+    try:
+        config.TELEGRAM_BOT_TOKEN, config.TELEGRAM_CHAT_ID = "bench-token", "0"
+        for name, api_base in (
+            ("send_telegram_alert", server.base_url),
+            ("send_telegram_alert_slow_api", server.prefix(delay_ms=250)),
+            ("send_telegram_alert_api_error", server.prefix(status=502)),
+        ):
+            config.TELEGRAM_API_BASE = api_base
+            stats, delivered = _timeit(lambda: send_telegram_alert("bench"), repeat)
+            results[name] = {**stats, "delivered": delivered}
+    finally:
+        config.TELEGRAM_API_BASE, config.TELEGRAM_BOT_TOKEN, config.TELEGRAM_CHAT_ID = saved
+    return results
+
+
+# ------------------ قواعد اصطناعية ------------------
+# فحص كل 60 ثانية حتى الآن (كما يفعل الوكيل)، واختبار سرعة لكل عشرة فحوص،
+# وحادثة لكل ألف، ثم تُطوى كلها في جداول التجميع كما في الترحيل.
+def build_synthetic_db(path: str, rows: int) -> None:
+    from netmon.db import init_db
+    from netmon.engine import close_engine
+    from netmon.rollups import fold_rows_into_rollups
+
+    saved_path = config.DB_PATH
+    config.DB_PATH = path
+    try:
+        init_db(background_backfill=False)
+    finally:
+        close_engine()
+        config.DB_PATH = saved_path
+
+    end = int(get_now().timestamp())
+    start = end - rows * 60
+    conn = sqlite3.connect(path, isolation_level=None)
+    try:
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.execute("BEGIN")
+        conn.execute(
+            """
+            WITH RECURSIVE seq(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM seq WHERE i < ?)
+            INSERT INTO checks (status, timestamp, ts)
+            SELECT CASE WHEN abs(random()) % 100 < 2 THEN 'DOWN' ELSE 'UP' END,
+                   strftime('%Y-%m-%dT%H:%M:%S+03:00', ? + i * 60 + 10800, 'unixepoch'), ? + i * 60
+            FROM seq
+            """,
+            (rows, start, start),
+        )
+        conn.execute(
+            """
+            INSERT INTO check_targets (check_id, target, status_code, latency_ms, error, timestamp, ts, ttfb_ms)
+            SELECT id, 'https://www.google.com', CASE status WHEN 'UP' THEN 200 END,
+                   20 + abs(random()) % 80, CASE status WHEN 'UP' THEN NULL ELSE 'ConnectTimeout' END,
+                   timestamp, ts, 20 + abs(random()) % 80
+            FROM checks
+            """
+        )
+        conn.execute(
+            """
+            INSERT INTO speed_checks (mode, download_mbps, latency_ms, drop_detected, threshold_mbps, timestamp, ts)
+            SELECT 'quick', 5 + abs(random()) % 95, 20 + abs(random()) % 80, 0, ?, timestamp, ts
+            FROM checks WHERE id % 10 = 0
+            """,
+            (config.SPEED_DROP_THRESHOLD_MBPS,),
+        )
+        conn.execute(
+            """
+            INSERT INTO incidents (started_at, ended_at, duration_seconds, start_reason, end_reason, started_ts, ended_ts)
+            SELECT timestamp, timestamp, 120, 'Connectivity check reported DOWN', 'Connectivity restored', ts, ts + 120
+            FROM checks WHERE id % 1000 = 0
+            """
+        )
+        conn.execute(
+            """
+            INSERT INTO latency_probes (target, sent, received, loss_pct, min_ms, p50_ms, p95_ms, p99_ms, max_ms,
+                                        mean_ms, jitter_ms, timestamp, ts)
+            SELECT target, 20, 20 - (abs(random()) % 100 < 5), 0, 15, 20 + abs(random()) % 30,
+                   50 + abs(random()) % 60, 120, 150, 30, 4, timestamp, ts
+            FROM checks, (SELECT 'https://www.google.com' AS target UNION ALL SELECT 'https://1.1.1.1')
+            WHERE id % 5 = 0
+            """
+        )
+        for source in ("checks", "speed_checks", "incidents"):
+            last_id = conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {source}").fetchone()[0]
+            fold_rows_into_rollups(conn, source, 0, last_id)
+        conn.execute("COMMIT")
+        conn.execute("ANALYZE")
+    finally:
+        conn.close()
+
+
+def _synthetic_db(workdir: str, rows: int) -> str:
+    path = os.path.join(workdir, f"bench-{rows}.db")
+    if os.path.exists(path):
+        conn = sqlite3.connect(path)
+        try:
+            existing = conn.execute("SELECT MAX(id) FROM checks").fetchone()[0]
+        except sqlite3.Error:
+            existing = None
+        finally:
+            conn.close()
+        if existing == rows:
+            return path
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+    build_synthetic_db(path, rows)
+    return path
+
+
+def bench_storage(sizes: list[int], repeat: int, workdir: str) -> dict:
+    from netmon import db
+    from netmon.cache import clear_cache
+    from netmon.engine import close_engine
+
+    readers = {
+        "compute_sla_24h": (db.compute_sla, (24,)),
+        "compute_sla_30d": (db.compute_sla, (720,)),
+        "get_recent_checks": (db.get_recent_checks, ()),
+        "get_recent_speed_checks": (db.get_recent_speed_checks, ()),
+        "get_incidents": (db.get_incidents, ()),
+        # اللوحات الحية: الملء الأول، ثم دورة بلا جديد (المؤشر عند آخر id)
+        "live_checks_first_poll": (db.get_rows_since, ("checks", 0, 20)),
+        "live_checks_idle_poll": (db.get_rows_since, ("checks", 2**62, 20)),
+        "get_rollup_series_24h": (db.get_rollup_series, (24,)),
+        "get_rollup_series_1y": (db.get_rollup_series, (24 * 365,)),
+        "get_latency_series_7d": (db.get_latency_series, (24 * 7,)),
+    }
+    saved_path = config.DB_PATH
+    results = {}
+    try:
+        for rows in sizes:
+            started = time.perf_counter()
+            path = _synthetic_db(workdir, rows)
+            size_results = {"build_s": round(time.perf_counter() - started, 3), "file_bytes": os.path.getsize(path)}
+            config.DB_PATH = path
+            clear_cache()
+            for name, (reader, args) in readers.items():
+                # __wrapped__ يتجاوز ذاكرة القراءة فيقيس الاستعلام نفسه
+                uncached = getattr(reader, "__wrapped__", reader)
+                size_results[name], _ = _timeit(lambda: uncached(*args), repeat)
+                size_results[f"{name}_cached"], _ = _timeit(lambda: reader(*args), repeat)
+            results[str(rows)] = size_results
+            close_engine()
+    finally:
+        config.DB_PATH = saved_path
+    return results
+
+
+# ------------------ زمن الإقلاع وإعادة التشغيل ------------------
+# الاستيراد يُقاس في عملية جديدة في كل مرة؛ شاشة الدخول تحتاج netmon.db فقط، ولوحة التحكم
+# تضيف المهام والرسوم (pandas، requests، numpy، plotly).
+STARTUP_IMPORTS = {
+    "login": ["netmon.db"],
+    "dashboard": ["netmon.db", "netmon.jobs", "netmon.charts"],
+}
+_HEAVY_MODULES = ["pandas", "numpy", "requests", "plotly"]
+
+
+def _cold_import(modules: list[str]) -> tuple[float, list[str]]:
+    code = (
+        "import importlib, json, sys, time\n"
+        "started = time.perf_counter()\n"
+        f"for name in {modules!r}: importlib.import_module(name)\n"
+        "elapsed = (time.perf_counter() - started) * 1000\n"
+        f"print(json.dumps([elapsed, [name for name in {_HEAVY_MODULES!r} if name in sys.modules]]))"
+    )
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    completed = subprocess.run([sys.executable, "-c", code], cwd=root, capture_output=True, text=True, check=True)
+    elapsed, loaded = json.loads(completed.stdout.strip().splitlines()[-1])
+    return elapsed, loaded
+
+
+def bench_startup(repeat: int, workdir: str) -> dict:
+    from netmon.db import _seed_users, init_db
+    from netmon.engine import close_engine, write
+    from netmon.migrations import migrate
+
+    results = {}
+    for view, modules in STARTUP_IMPORTS.items():
+        runs = [_cold_import(modules) for _ in range(repeat)]
+        results[f"import_{view}"] = {**_stats([elapsed for elapsed, _ in runs]), "heavy_modules": runs[-1][1]}
+
+    path = os.path.join(workdir, "bench-startup.db")
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    saved_path = config.DB_PATH
+    config.DB_PATH = path
+    try:
+        results["init_db_new_database"], _ = _timeit(lambda: init_db(background_backfill=False), 1, warmup=0)
+        # عملية جديدة على قاعدة محدَّثة: محرك جديد، فيُعاد فحص الإصدار والمستخدمين
+        samples = []
+        for _ in range(repeat):
+            close_engine()
+            started = time.perf_counter()
+            init_db(background_backfill=False)
+            samples.append((time.perf_counter() - started) * 1000)
+        results["init_db_new_process"] = _stats(samples)
+        results["init_db_rerun"], _ = _timeit(lambda: init_db(background_backfill=False), repeat)
+        # ما كان يجري مع كل إعادة تشغيل قبل حصر الإعداد في مرة واحدة لكل عملية
+        results["legacy_init_rerun"], _ = _timeit(lambda: (migrate(), write(_seed_users)), repeat)
+    finally:
+        close_engine()
+        config.DB_PATH = saved_path
+    return results
+
+
+def run_benchmarks(sizes: list[int], repeat: int, suites: list[str], workdir: str) -> dict:
+    report = {
+        "meta": {
+            "started_at": get_now().isoformat(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "repeat": repeat,
+        }
+    }
+    if "probes" in suites or "alerts" in suites:
+        with StandInServer() as server:
+            if "probes" in suites:
+                report["probes"] = bench_probes(server, repeat)
+            if "alerts" in suites:
+                report["alerts"] = bench_alerts(server, repeat)
+    if "storage" in suites:
+        report["storage"] = bench_storage(sizes, repeat, workdir)
+    if "startup" in suites:
+        report["startup"] = bench_startup(repeat, workdir)
+    return report
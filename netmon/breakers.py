@@ -0,0 +1,181 @@
+import threading
+import time
+from collections import deque
+
+from netmon.config import (
+    BREAKER_FAILURE_THRESHOLD,
+    BREAKER_LATENCY_WINDOW,
+    BREAKER_MAX_OPEN_SECONDS,
+    BREAKER_MIN_SAMPLES,
+    BREAKER_MIN_TIMEOUT_FRACTION,
+    BREAKER_MIN_TIMEOUT_SECONDS,
+    BREAKER_OPEN_SECONDS,
+    BREAKER_TIMEOUT_MULTIPLIER,
+)
+from netmon.metrics import gauge
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+def _percentile(ordered: list[float], fraction: float) -> float:
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+# ------------------ قواطع الدائرة لكل هدف ------------------
+# closed: يُفحص الهدف عاديًا. بعد BREAKER_FAILURE_THRESHOLD فشلًا متتاليًا يصبح open فيُتخطى
+# حتى open_until، ثم half_open: محاولة تجريبية واحدة؛ نجاحها يغلقه وفشلها يعيد فتحه بمدة مضاعفة
+# حتى BREAKER_MAX_OPEN_SECONDS. المهلة تتكيف مع زمن الهدف: p95 × المضاعف ضمن [الأدنى، الافتراضي]،
+# والأدنى نسبة من الافتراضي أيضًا. هي مهلة الاتصال وأول استجابة فقط، لا مهلة نقل البيانات.
+class CircuitBreaker:
+    def __init__(self, kind: str, target: str):
+        self.kind = kind
+        self.target = target
+        self.state = CLOSED
+        self.failures = 0
+        self.reopen_count = 0
+        self.open_until = 0.0
+        self.trial_in_flight = False
+        self.last_error: str | None = None
+        self.learned_timeout: float | None = None
+        self.latencies: deque[float] = deque(maxlen=BREAKER_LATENCY_WINDOW)
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.time() >= self.open_until:
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            return False
+
+    def force_trial(self) -> None:
+        # يُستدعى حين لا يبقى ما يكفي من الأهداف المغلقة لبلوغ النصاب
+        with self._lock:
+            if self.state != CLOSED:
+                self.state = HALF_OPEN
+                self.trial_in_flight = True
+
+    def cancel_trial(self) -> None:
+        with self._lock:
+            self.trial_in_flight = False
+
+    def record_success(self, latency_ms: float | None) -> None:
+        with self._lock:
+            if latency_ms is not None:
+                self.latencies.append(latency_ms)
+            self.state = CLOSED
+            self.failures = 0
+            self.reopen_count = 0
+            self.trial_in_flight = False
+            self.last_error = None
+
+    def record_failure(self, error: str | None) -> None:
+        with self._lock:
+            self.failures += 1
+            self.last_error = error
+            self.trial_in_flight = False
+            if self.state == HALF_OPEN:
+                self.reopen_count += 1
+            if self.state == HALF_OPEN or self.failures >= BREAKER_FAILURE_THRESHOLD:
+                self.state = OPEN
+                self.open_until = time.time() + min(
+                    BREAKER_OPEN_SECONDS * 2**self.reopen_count, BREAKER_MAX_OPEN_SECONDS
+                )
+
+    def percentiles(self) -> tuple[float | None, float | None]:
+        with self._lock:
+            ordered = sorted(self.latencies)
+        if not ordered:
+            return None, None
+        return _percentile(ordered, 0.5), _percentile(ordered, 0.95)
+
+    def adaptive_timeout(self) -> float | None:
+        if len(self.latencies) < BREAKER_MIN_SAMPLES:
+            return self.learned_timeout
+        _, p95 = self.percentiles()
+        return max(BREAKER_MIN_TIMEOUT_SECONDS, p95 / 1000 * BREAKER_TIMEOUT_MULTIPLIER)
+
+    def timeout(self, default: float) -> float:
+        adaptive = self.adaptive_timeout()
+        if adaptive is None:
+            return default
+        return min(default, max(adaptive, default * BREAKER_MIN_TIMEOUT_FRACTION))
+
+    def snapshot(self) -> dict:
+        p50, p95 = self.percentiles()
+        return {
+            "kind": self.kind,
+            "target": self.target,
+            "state": self.state,
+            "failures": self.failures,
+            "reopen_count": self.reopen_count,
+            "open_until_ts": self.open_until if self.state != CLOSED else None,
+            "p50_ms": p50,
+            "p95_ms": p95,
+            "timeout_s": self.adaptive_timeout(),
+            "last_error": self.last_error,
+        }
+
+    def restore(self, row: dict) -> None:
+        # المهلة المحفوظة تُستخدم حتى تتجمع عينات كافية في هذه العملية
+        with self._lock:
+            self.state = row["state"] if row["state"] in (CLOSED, OPEN) else OPEN
+            self.failures = row["failures"] or 0
+            self.reopen_count = row["reopen_count"] or 0
+            self.open_until = row["open_until_ts"] or 0.0
+            self.last_error = row["last_error"]
+            self.learned_timeout = row["timeout_s"]
+
+
+class BreakerRegistry:
+    def __init__(self):
+        self._breakers: dict[tuple[str, str], CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def get(self, kind: str, target: str) -> CircuitBreaker:
+        with self._lock:
+            breaker = self._breakers.get((kind, target))
+            if breaker is None:
+                breaker = self._breakers[(kind, target)] = CircuitBreaker(kind, target)
+            return breaker
+
+    def select(self, kind: str, targets: list[str], minimum: int, limit: int | None = None) -> list[str]:
+        # الأهداف المسموح بها، مع فرض محاولات على أقربها انتهاءً حتى يبقى minimum على الأقل:
+        # أثناء انقطاع حقيقي تنفتح كل القواطع، ولا يجوز أن يتأخر اكتشاف العودة بسببها.
+        # limit يأخذ أول المسموح بها بالترتيب، ولا يُسأل ما بعدها حتى لا تُحجز محاولة لن تُجرى
+        allowed = []
+        for url in targets:
+            if limit is not None and len(allowed) >= limit:
+                break
+            if self.get(kind, url).allow():
+                allowed.append(url)
+        if len(allowed) < minimum:
+            blocked = sorted(
+                (url for url in targets if url not in allowed), key=lambda url: self.get(kind, url).open_until
+            )
+            for url in blocked[: minimum - len(allowed)]:
+                self.get(kind, url).force_trial()
+                allowed.append(url)
+        return [url for url in targets if url in allowed]
+
+    def snapshot(self) -> list[dict]:
+        with self._lock:
+            breakers = list(self._breakers.values())
+        return [breaker.snapshot() for breaker in breakers]
+
+    def restore(self, rows: list[dict]) -> None:
+        for row in rows:
+            self.get(row["kind"], row["target"]).restore(row)
+
+    def open_count(self) -> int:
+        with self._lock:
+            return sum(breaker.state != CLOSED for breaker in self._breakers.values())
+
+
+BREAKERS = BreakerRegistry()
+gauge("netmon_open_circuit_breakers", "Probe targets skipped by an open or half-open breaker", BREAKERS.open_count)
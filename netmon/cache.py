@@ -0,0 +1,100 @@
+import copy
+import functools
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+from typing import TypeVar
+
+from netmon.config import CACHE_ENABLED, CACHE_MAX_ENTRIES, CACHE_TTL_SECONDS
+from netmon.engine import data_version
+from netmon.metrics import counter
+
+T = TypeVar("T")
+
+# ------------------ ذاكرة القراءة ------------------
+# نتيجة كل قارئ تُحفظ مع "جيل البيانات" وقت حسابها، وتبقى صالحة حتى يتغير الجيل
+# (كتابة في هذه العملية أو التزام من عملية أخرى كالوكيل) أو تنقضي CACHE_TTL_SECONDS.
+_generation = itertools.count(1)
+_local_generation = 0
+_entries: OrderedDict[tuple, tuple[tuple, float, object]] = OrderedDict()
+_inflight: dict[tuple, threading.Event] = {}
+_lock = threading.Lock()
+stats = {"hits": 0, "misses": 0, "evictions": 0}
+CACHE_REQUESTS = counter("netmon_read_cache_requests_total", "Cached dashboard reads by result")
+
+
+def bump_generation() -> None:
+    global _local_generation
+    _local_generation = next(_generation)
+
+
+def current_generation() -> tuple:
+    return _local_generation, data_version()
+
+
+def clear_cache() -> None:
+    with _lock:
+        _entries.clear()
+
+
+def _lookup(key: tuple, generation: tuple) -> tuple[bool, object]:
+    entry = _entries.get(key)
+    if entry is None:
+        return False, None
+    entry_generation, stored_at, value = entry
+    if entry_generation != generation or time.monotonic() - stored_at > CACHE_TTL_SECONDS:
+        return False, None
+    _entries.move_to_end(key)
+    return True, value
+
+
+def cached_reader(func: Callable[..., T]) -> Callable[..., T]:
+    if not CACHE_ENABLED:
+        return func
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs) -> T:
+        key = (func.__qualname__, args, tuple(sorted(kwargs.items())))
+        generation = current_generation()
+
+        with _lock:
+            hit, value = _lookup(key, generation)
+            if hit:
+                stats["hits"] += 1
+                CACHE_REQUESTS.inc(result="hit")
+                return copy.copy(value)
+            # جلسات كثيرة تطلب المفتاح نفسه معًا: واحدة تستعلم والبقية تنتظر نتيجتها
+            event = _inflight.get(key)
+            owner = event is None
+            if owner:
+                event = _inflight[key] = threading.Event()
+
+        if not owner:
+            event.wait(timeout=CACHE_TTL_SECONDS)
+            with _lock:
+                hit, value = _lookup(key, generation)
+                if hit:
+                    stats["hits"] += 1
+                    CACHE_REQUESTS.inc(result="hit")
+                    return copy.copy(value)
+
+        try:
+            value = func(*args, **kwargs)
+            with _lock:
+                stats["misses"] += 1
+                CACHE_REQUESTS.inc(result="miss")
+                _entries[key] = (generation, time.monotonic(), value)
+                _entries.move_to_end(key)
+                while len(_entries) > CACHE_MAX_ENTRIES:
+                    _entries.popitem(last=False)
+                    stats["evictions"] += 1
+        finally:
+            if owner:
+                with _lock:
+                    _inflight.pop(key, None)
+                event.set()
+        return copy.copy(value)
+
+    return wrapper
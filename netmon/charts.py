@@ -0,0 +1,84 @@
+import pandas as pd
+import plotly.graph_objects as go
+
+CHART_RANGES = {
+    "1h": 1,
+    "6h": 6,
+    "24h": 24,
+    "7d": 24 * 7,
+    "30d": 24 * 30,
+    "90d": 24 * 90,
+    "1y": 24 * 365,
+}
+
+_LAYOUT = {
+    "height": 320,
+    "margin": {"l": 10, "r": 10, "t": 30, "b": 10},
+    "hovermode": "x unified",
+    "legend": {"orientation": "h", "y": -0.2},
+}
+
+
+# ------------------ الرسوم التفاعلية ------------------
+# السلاسل تصل مجمّعة مسبقًا من قاعدة البيانات (بضع مئات من النقاط)، فالرسم هنا فقط
+# يحوّلها إلى أشكال plotly دون أي معالجة على عدد الصفوف الخام.
+def uptime_figure(series: pd.DataFrame) -> go.Figure:
+    figure = go.Figure(
+        go.Scatter(
+            x=series["time"],
+            y=series["uptime_pct"],
+            mode="lines",
+            line={"shape": "hv", "color": "#2e7d32"},
+            name="Uptime %",
+            customdata=series["checks"],
+            hovertemplate="%{y:.2f}% of %{customdata} checks",
+        )
+    )
+    figure.update_layout(title="Uptime", yaxis={"range": [0, 101], "ticksuffix": "%"}, **_LAYOUT)
+    return figure
+
+
+def speed_figure(series: pd.DataFrame, threshold_mbps: float | None = None) -> go.Figure:
+    series = series.dropna(subset=["speed_avg"])
+    figure = go.Figure()
+    # نطاق الحد الأدنى/الأعلى لكل فئة حتى تبقى الانخفاضات القصيرة ظاهرة بعد التجميع
+    figure.add_trace(
+        go.Scatter(x=series["time"], y=series["speed_max"], mode="lines", line={"width": 0}, name="Max", showlegend=False)
+    )
+    figure.add_trace(
+        go.Scatter(
+            x=series["time"],
+            y=series["speed_min"],
+            mode="lines",
+            line={"width": 0},
+            fill="tonexty",
+            fillcolor="rgba(21, 101, 192, 0.2)",
+            name="Min–max",
+        )
+    )
+    figure.add_trace(
+        go.Scatter(x=series["time"], y=series["speed_avg"], mode="lines+markers", line={"color": "#1565c0"}, name="Avg")
+    )
+    if threshold_mbps is not None:
+        figure.add_hline(y=threshold_mbps, line={"dash": "dot", "color": "#c62828"}, annotation_text="Drop threshold")
+    figure.update_layout(title="Download speed (Mbps)", **_LAYOUT)
+    return figure
+
+
+def latency_figure(series: pd.DataFrame) -> go.Figure:
+    figure = go.Figure()
+    for target, rows in series.groupby("target", sort=False):
+        figure.add_trace(go.Scatter(x=rows["time"], y=rows["p50_ms"], mode="lines", name=f"{target} p50"))
+        figure.add_trace(
+            go.Scatter(
+                x=rows["time"],
+                y=rows["p95_ms"],
+                mode="lines",
+                line={"dash": "dot"},
+                name=f"{target} p95",
+                customdata=rows["loss_pct"],
+                hovertemplate="%{y:.1f} ms (loss %{customdata:.1f}%)",
+            )
+        )
+    figure.update_layout(title="Latency (ms)", **_LAYOUT)
+    return figure
@@ -0,0 +1,174 @@
+import os
+import socket
+
+DB_PATH = os.getenv("DB_PATH", "results.db")
+DB_READ_POOL_SIZE = int(os.getenv("DB_READ_POOL_SIZE", "8"))
+DB_WRITE_BATCH_SIZE = int(os.getenv("DB_WRITE_BATCH_SIZE", "256"))
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+DB_CACHE_KIB = int(os.getenv("DB_CACHE_KIB", "16384"))
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "1") == "1"
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", "30"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "256"))
+CHART_MAX_POINTS = int(os.getenv("CHART_MAX_POINTS", "500"))
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "5000"))
+MIGRATION_CHUNK_ROWS = int(os.getenv("MIGRATION_CHUNK_ROWS", "5000"))
+MIGRATION_CHUNK_PAUSE_SECONDS = float(os.getenv("MIGRATION_CHUNK_PAUSE_SECONDS", "0.05"))
+RETENTION_RAW_DAYS = float(os.getenv("RETENTION_RAW_DAYS", "14"))
+RETENTION_MINUTE_ROLLUP_DAYS = float(os.getenv("RETENTION_MINUTE_ROLLUP_DAYS", "14"))
+RETENTION_5MIN_ROLLUP_DAYS = float(os.getenv("RETENTION_5MIN_ROLLUP_DAYS", "365"))
+RETENTION_INCIDENT_DAYS = float(os.getenv("RETENTION_INCIDENT_DAYS", "365"))
+RETENTION_BATCH_ROWS = int(os.getenv("RETENTION_BATCH_ROWS", "2000"))
+RETENTION_PAUSE_SECONDS = float(os.getenv("RETENTION_PAUSE_SECONDS", "0.05"))
+RETENTION_VACUUM_PAGES = int(os.getenv("RETENTION_VACUUM_PAGES", "2000"))
+DB_MMAP_BYTES = int(os.getenv("DB_MMAP_BYTES", str(64 * 1024 * 1024)))
+DEFAULT_ADMIN_USERNAME = os.getenv("ADMIN_USERNAME", "admin")
+DEFAULT_ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD", "admin123")
+DEFAULT_MANAGER_USERNAME = os.getenv("MANAGER_USERNAME", "manager")
+DEFAULT_MANAGER_PASSWORD = os.getenv("MANAGER_PASSWORD", "manager123")
+DEFAULT_TECH_USERNAME = os.getenv("TECHNICIAN_USERNAME", "technician")
+DEFAULT_TECH_PASSWORD = os.getenv("TECHNICIAN_PASSWORD", "tech123")
+DEFAULT_CLIENT_USERNAME = os.getenv("CLIENT_USERNAME", "client")
+DEFAULT_CLIENT_PASSWORD = os.getenv("CLIENT_PASSWORD", "client123")
+APP_RELEASE_TAG = os.getenv("APP_RELEASE_TAG", "speed-monitor-v3")
+SPEED_DROP_THRESHOLD_MBPS = float(os.getenv("SPEED_DROP_THRESHOLD_MBPS", "20"))
+# كشف الهبوط بخط أساس لكل ساعة من اليوم: آخر ANOMALY_WINDOW قيمة لكل ساعة (الوسيط و MAD)، وEWMA
+# لكل الساعات حتى تتجمع ANOMALY_MIN_SAMPLES للساعة. الهبوط = أبعد من ANOMALY_Z_THRESHOLD انحرافًا
+# عن المعتاد. SPEED_DROP_THRESHOLD_MBPS يبقى للبداية قبل تجمع العينات ولوكلاء الفروع
+ANOMALY_WINDOW = int(os.getenv("ANOMALY_WINDOW", "30"))
+ANOMALY_MIN_SAMPLES = int(os.getenv("ANOMALY_MIN_SAMPLES", "8"))
+ANOMALY_Z_THRESHOLD = float(os.getenv("ANOMALY_Z_THRESHOLD", "3.5"))
+ANOMALY_MIN_SPREAD_FRACTION = float(os.getenv("ANOMALY_MIN_SPREAD_FRACTION", "0.05"))
+ANOMALY_EWMA_ALPHA = float(os.getenv("ANOMALY_EWMA_ALPHA", "0.05"))
+QUICK_TEST_INTERVAL_SECONDS = int(os.getenv("QUICK_TEST_INTERVAL_SECONDS", "300"))
+# وضع العرض الحي (شاشة غرفة العمليات): تحديث لوحات الحالة والجداول الأخيرة كل LIVE_REFRESH_SECONDS
+LIVE_REFRESH_SECONDS = float(os.getenv("LIVE_REFRESH_SECONDS", "5"))
+DASHBOARD_READ_ONLY = os.getenv("DASHBOARD_READ_ONLY", "0") == "1"
+# فحوص متتالية قبل فتح حادثة أو إغلاقها، حتى لا يفتح خط متذبذب حادثة وتنبيهًا مع كل انقلاب
+INCIDENT_OPEN_AFTER_FAILURES = int(os.getenv("INCIDENT_OPEN_AFTER_FAILURES", "2"))
+INCIDENT_CLOSE_AFTER_SUCCESSES = int(os.getenv("INCIDENT_CLOSE_AFTER_SUCCESSES", "2"))
+AGENT_CHECK_INTERVAL_SECONDS = int(os.getenv("AGENT_CHECK_INTERVAL_SECONDS", "60"))
+AGENT_SPEED_INTERVAL_SECONDS = int(os.getenv("AGENT_SPEED_INTERVAL_SECONDS", str(QUICK_TEST_INTERVAL_SECONDS)))
+AGENT_LATENCY_INTERVAL_SECONDS = float(os.getenv("AGENT_LATENCY_INTERVAL_SECONDS", "300"))
+AGENT_COMPACTION_INTERVAL_SECONDS = int(os.getenv("AGENT_COMPACTION_INTERVAL_SECONDS", "3600"))
+AGENT_JITTER_FRACTION = float(os.getenv("AGENT_JITTER_FRACTION", "0.1"))
+AGENT_LOCK_PATH = os.getenv("AGENT_LOCK_PATH", "agent.lock")
+CONNECTIVITY_QUORUM = int(os.getenv("CONNECTIVITY_QUORUM", "1"))
+CONNECTIVITY_TIMEOUT_SECONDS = float(os.getenv("CONNECTIVITY_TIMEOUT_SECONDS", "3"))
+SPEED_TEST_TIMEOUT_SECONDS = float(os.getenv("SPEED_TEST_TIMEOUT_SECONDS", "10"))
+# قواطع الدائرة: فشل متتالٍ قبل تخطي الهدف، ومدة التخطي الأولى وسقفها بعد المضاعفة،
+# والمهلة المتكيفة = p95 × المضاعف بعد BREAKER_MIN_SAMPLES نجاحًا، لا أقل من الحد الأدنى
+# ولا أقل من BREAKER_MIN_TIMEOUT_FRACTION من المهلة المضبوطة، فلا تقلّصها سلسلة عينات سريعة
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "3"))
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", "60"))
+BREAKER_MAX_OPEN_SECONDS = float(os.getenv("BREAKER_MAX_OPEN_SECONDS", "1800"))
+BREAKER_TIMEOUT_MULTIPLIER = float(os.getenv("BREAKER_TIMEOUT_MULTIPLIER", "4"))
+BREAKER_MIN_TIMEOUT_SECONDS = float(os.getenv("BREAKER_MIN_TIMEOUT_SECONDS", "1"))
+BREAKER_MIN_TIMEOUT_FRACTION = float(os.getenv("BREAKER_MIN_TIMEOUT_FRACTION", "0.5"))
+BREAKER_MIN_SAMPLES = int(os.getenv("BREAKER_MIN_SAMPLES", "5"))
+BREAKER_LATENCY_WINDOW = int(os.getenv("BREAKER_LATENCY_WINDOW", "50"))
+SITE_ID = os.getenv("SITE_ID", "")
+AGENT_ID = os.getenv("AGENT_ID", socket.gethostname())
+INGEST_URL = os.getenv("INGEST_URL", "")
+INGEST_TOKEN = os.getenv("INGEST_TOKEN", "")
+INGEST_MAX_BATCH_BYTES = int(os.getenv("INGEST_MAX_BATCH_BYTES", str(8 * 1024 * 1024)))
+REMOTE_SPOOL_PATH = os.getenv("REMOTE_SPOOL_PATH", "spool.db")
+REMOTE_SPOOL_MAX_ROWS = int(os.getenv("REMOTE_SPOOL_MAX_ROWS", "100000"))
+REMOTE_PUSH_INTERVAL_SECONDS = float(os.getenv("REMOTE_PUSH_INTERVAL_SECONDS", "30"))
+REMOTE_PUSH_BATCH_ROWS = int(os.getenv("REMOTE_PUSH_BATCH_ROWS", "500"))
+REMOTE_PUSH_TIMEOUT_SECONDS = float(os.getenv("REMOTE_PUSH_TIMEOUT_SECONDS", "10"))
+REMOTE_PUSH_BACKOFF_MAX_SECONDS = float(os.getenv("REMOTE_PUSH_BACKOFF_MAX_SECONDS", "600"))
+TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "")
+TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID", "")
+TELEGRAM_API_BASE = os.getenv("TELEGRAM_API_BASE", "https://api.telegram.org").rstrip("/")
+ALERT_SEND_TIMEOUT_SECONDS = float(os.getenv("ALERT_SEND_TIMEOUT_SECONDS", "8"))
+ALERT_MAX_ATTEMPTS = int(os.getenv("ALERT_MAX_ATTEMPTS", "8"))
+ALERT_BACKOFF_BASE_SECONDS = float(os.getenv("ALERT_BACKOFF_BASE_SECONDS", "5"))
+ALERT_BACKOFF_MAX_SECONDS = float(os.getenv("ALERT_BACKOFF_MAX_SECONDS", "900"))
+ALERT_COALESCE_SECONDS = int(os.getenv("ALERT_COALESCE_SECONDS", "300"))
+ALERT_RATE_LIMIT_SECONDS = float(os.getenv("ALERT_RATE_LIMIT_SECONDS", "3"))
+ALERT_LEASE_SECONDS = int(os.getenv("ALERT_LEASE_SECONDS", "60"))
+
+ROLE_LABELS = {
+    "admin": "مدير النظام",
+    "manager": "المدير",
+    "technician": "الفني",
+    "client": "العميل",
+}
+
+DEFAULT_USERS = [
+    (DEFAULT_ADMIN_USERNAME, DEFAULT_ADMIN_PASSWORD, "admin"),
+    (DEFAULT_MANAGER_USERNAME, DEFAULT_MANAGER_PASSWORD, "manager"),
+    (DEFAULT_TECH_USERNAME, DEFAULT_TECH_PASSWORD, "technician"),
+    (DEFAULT_CLIENT_USERNAME, DEFAULT_CLIENT_PASSWORD, "client"),
+]
+
+TARGETS = [
+    "https://www.google.com",
+    "https://1.1.1.1",
+    "https://www.cloudflare.com",
+    "https://n-pns.com",
+]
+
+SPEED_TEST_URLS = [
+    url.strip()
+    for url in os.getenv(
+        "SPEED_TEST_URLS", "https://speed.hetzner.de/10MB.bin,https://proof.ovh.net/files/10Mb.dat"
+    ).split(",")
+    if url.strip()
+]
+# مجموعة خوادم السرعة: ملف بسطر لكل خادم "url [الاسم]" يحل محل SPEED_TEST_URLS ويُعاد تحميله عند تعديله.
+# الخوادم تُرتَّب بزمن اتصال TCP، والاختبار يستخدم أقرب SPEED_TEST_SERVER_COUNT منها فقط
+SPEED_SERVERS_FILE = os.getenv("SPEED_SERVERS_FILE", "")
+SPEED_TEST_SERVER_COUNT = int(os.getenv("SPEED_TEST_SERVER_COUNT", "1"))
+SPEED_SERVER_RANK_TTL_SECONDS = float(os.getenv("SPEED_SERVER_RANK_TTL_SECONDS", "3600"))
+SPEED_SERVER_PING_COUNT = int(os.getenv("SPEED_SERVER_PING_COUNT", "3"))
+SPEED_SERVER_PING_TIMEOUT_SECONDS = float(os.getenv("SPEED_SERVER_PING_TIMEOUT_SECONDS", "1"))
+
+# عدد الاتصالات لكل خادم، والميزانية الزمنية، وسقف البايتات الإجمالي (0 = بلا سقف).
+# converge: يتوقف الاختبار مبكرًا حين تستقر القراءة ضمن SPEED_CONVERGENCE_TOLERANCE
+SPEED_TEST_PROFILES = {
+    "quick": {
+        "streams": int(os.getenv("QUICK_TEST_STREAMS", "2")),
+        "seconds": float(os.getenv("QUICK_TEST_SECONDS", "3")),
+        "max_bytes": int(os.getenv("QUICK_TEST_MAX_BYTES", str(8 * 1024 * 1024))),
+    },
+    "full": {
+        "streams": int(os.getenv("FULL_TEST_STREAMS", "6")),
+        "seconds": float(os.getenv("FULL_TEST_SECONDS", "10")),
+        "max_bytes": int(os.getenv("FULL_TEST_MAX_BYTES", "0")),
+    },
+    "adaptive": {
+        "streams": int(os.getenv("ADAPTIVE_TEST_STREAMS", "4")),
+        "seconds": float(os.getenv("ADAPTIVE_TEST_MAX_SECONDS", "15")),
+        "max_bytes": int(os.getenv("ADAPTIVE_TEST_MAX_BYTES", str(200 * 1024 * 1024))),
+        "converge": True,
+    },
+}
+SPEED_SAMPLE_INTERVAL_SECONDS = float(os.getenv("SPEED_SAMPLE_INTERVAL_SECONDS", "0.25"))
+SPEED_RAMP_MIN_SECONDS = float(os.getenv("SPEED_RAMP_MIN_SECONDS", "1"))
+SPEED_CONVERGENCE_WINDOW = int(os.getenv("SPEED_CONVERGENCE_WINDOW", "8"))
+SPEED_CONVERGENCE_TOLERANCE = float(os.getenv("SPEED_CONVERGENCE_TOLERANCE", "0.05"))
+SPEED_TEST_RANGE_CHUNK_BYTES = int(os.getenv("SPEED_TEST_RANGE_CHUNK_BYTES", "0"))
+# اختبار سرعة واحد في كل لحظة عبر الجلسات والعمليات؛ المتأخر ينضم وينتظر النتيجة نفسها.
+# sqlite يكفي لعمليات تشارك results.db، و redis للعمّال على أكثر من جهاز
+SINGLEFLIGHT_BACKEND = os.getenv("SINGLEFLIGHT_BACKEND", "sqlite")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+SPEED_TEST_LEASE_SECONDS = float(os.getenv("SPEED_TEST_LEASE_SECONDS", "120"))
+SINGLEFLIGHT_POLL_SECONDS = float(os.getenv("SINGLEFLIGHT_POLL_SECONDS", "0.25"))
+LATENCY_PROBE_URL = os.getenv("LATENCY_PROBE_URL", "https://www.google.com/generate_204")
+LATENCY_BURST_TARGETS = [
+    url.strip()
+    for url in os.getenv(
+        "LATENCY_BURST_TARGETS", f"{LATENCY_PROBE_URL},https://1.1.1.1/cdn-cgi/trace,https://www.cloudflare.com/cdn-cgi/trace"
+    ).split(",")
+    if url.strip()
+]
+LATENCY_BURST_COUNT = int(os.getenv("LATENCY_BURST_COUNT", "20"))
+LATENCY_BURST_INTERVAL_MS = float(os.getenv("LATENCY_BURST_INTERVAL_MS", "50"))
+LATENCY_BURST_TIMEOUT_SECONDS = float(os.getenv("LATENCY_BURST_TIMEOUT_SECONDS", "2"))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "32"))
+
+PHASE_COLUMNS = ["dns_ms", "connect_ms", "tls_ms", "ttfb_ms", "transfer_ms"]
+LATENCY_STAT_COLUMNS = ["min_ms", "p50_ms", "p95_ms", "p99_ms", "max_ms", "mean_ms", "jitter_ms"]
@@ -0,0 +1,755 @@
+import json
+import sqlite3
+import threading
+import warnings
+from datetime import datetime
+from typing import TYPE_CHECKING
+
+from netmon import config
+from netmon.anomaly import (
+    ALL_HOURS,
+    LATENCY_METRIC_PREFIX,
+    SPEED_METRICS,
+    AnomalyDetector,
+    Baseline,
+    compute_baselines,
+    evaluate,
+    replace_baselines,
+)
+from netmon.breakers import BREAKERS
+from netmon.cache import bump_generation, cached_reader
+from netmon.config import (
+    CHART_MAX_POINTS,
+    DEFAULT_USERS,
+    LATENCY_STAT_COLUMNS,
+    PHASE_COLUMNS,
+)
+from netmon.engine import get_engine, read_connection, write
+from netmon.incidents import IncidentTracker
+from netmon.metrics import gauge, histogram
+from netmon.migrations import SCHEMA_VERSION, migrate, schema_version, start_background_backfill
+from netmon.retention import database_size_bytes
+from netmon.rollups import ROLLUP_COLUMNS, bump_rollups, series_bucket_width, series_sources
+from netmon.utils import TZ, format_duration, get_now, hash_password
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+QUERY_SECONDS = histogram("netmon_db_query_seconds", "Duration of dashboard and probe database calls")
+_init_lock = threading.Lock()
+_incident_tracker = IncidentTracker()
+_anomaly_detector = AnomalyDetector()
+
+
+def _seed_users(conn: sqlite3.Connection) -> None:
+    cur = conn.cursor()
+    for username, password, role in DEFAULT_USERS:
+        cur.execute("SELECT id FROM users WHERE username=?", (username,))
+        user_exists = cur.fetchone()
+        if not user_exists:
+            cur.execute(
+                "INSERT INTO users (username, password, role) VALUES (?, ?, ?)",
+                (username, hash_password(password), role),
+            )
+        else:
+            cur.execute("UPDATE users SET role=? WHERE username=?", (role, username))
+
+
+def _users_in_sync() -> bool:
+    with read_connection() as conn:
+        if conn is None:
+            return False
+        roles = dict(conn.execute("SELECT username, role FROM users").fetchall())
+    return all(roles.get(username) == role for username, _, role in DEFAULT_USERS)
+
+
+def init_db(background_backfill: bool = True) -> None:
+    # Streamlit يعيد تنفيذ السكربت مع كل تفاعل؛ الإعداد يجري مرة واحدة لكل قاعدة في كل عملية،
+    # وعملية جديدة على قاعدة محدَّثة تكتفي بقراءتين دون المرور بخيط الكتابة
+    engine = get_engine()
+    with _init_lock:
+        if "schema" not in engine.initialized:
+            if schema_version() < SCHEMA_VERSION:
+                migrate()
+            if not _users_in_sync():
+                write(_seed_users)
+            BREAKERS.restore(_load_target_health())
+            engine.initialized.add("schema")
+        if background_backfill and "backfill" not in engine.initialized:
+            start_background_backfill()
+            start_baseline_backfill()
+            engine.initialized.add("backfill")
+
+
+@QUERY_SECONDS.time(query="login")
+def login(username: str, password: str) -> dict | None:
+    with read_connection() as conn:
+        if conn is None:
+            return None
+        user = conn.execute(
+            "SELECT id, username, role FROM users WHERE username=? AND password=?",
+            (username, hash_password(password)),
+        ).fetchone()
+
+    if not user:
+        return None
+
+    return {"id": user[0], "username": user[1], "role": user[2] or "client"}
+
+
+@QUERY_SECONDS.time(query="get_last_status")
+def get_last_status() -> str | None:
+    with read_connection() as conn:
+        if conn is None:
+            return None
+        row = conn.execute("SELECT status FROM checks ORDER BY id DESC LIMIT 1").fetchone()
+    return row[0] if row else None
+
+
+def _insert_check(conn: sqlite3.Connection, status: str, target_results: list[dict] | None, now: datetime) -> int:
+    timestamp = now.isoformat()
+    ts = int(now.timestamp())
+    cur = conn.execute(
+        "INSERT INTO checks (status, timestamp, ts) VALUES (?, ?, ?)",
+        (status, timestamp, ts),
+    )
+    bump_rollups(conn, ts, up=int(status == "UP"), total=1)
+    if target_results:
+        conn.executemany(
+            """
+            INSERT INTO check_targets (
+                check_id, target, status_code, latency_ms, error, timestamp, ts,
+                dns_ms, connect_ms, tls_ms, ttfb_ms, transfer_ms
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            [
+                (
+                    cur.lastrowid,
+                    result["target"],
+                    result["status_code"],
+                    result["latency_ms"],
+                    result["error"],
+                    timestamp,
+                    ts,
+                    *(result.get(column) for column in PHASE_COLUMNS),
+                )
+                for result in target_results
+            ],
+        )
+    return cur.lastrowid
+
+
+@QUERY_SECONDS.time(query="save_check")
+def save_check(status: str, target_results: list[dict] | None = None, wait: bool = True) -> None:
+    now = get_now()
+    write(lambda conn: _insert_check(conn, status, target_results, now), wait=wait)
+    bump_generation()
+
+
+@QUERY_SECONDS.time(query="record_check")
+def record_check(status: str, target_results: list[dict] | None = None) -> tuple[bool, bool]:
+    # الفحص وأي فتح/إغلاق لحادثة في مهمة كتابة واحدة؛ الحالة تُبنى من القاعدة عند أول فحص
+    # أو حين يكتب فحصًا كاتبٌ آخر، وإلا تكفي قراءة MAX(id) واحدة
+    now = get_now()
+    path = config.DB_PATH
+
+    def record(conn: sqlite3.Connection) -> tuple[bool, bool]:
+        with _incident_tracker.lock:
+            _incident_tracker.sync(conn, path)
+            check_id = _insert_check(conn, status, target_results, now)
+            return _incident_tracker.observe(conn, path, check_id, status, now)
+
+    transition = write(record) or (False, False)
+    bump_generation()
+    return transition
+
+
+def track_incident_transition(new_status: str) -> tuple[bool, bool]:
+    # الواجهة القديمة قبل record_check: تُستدعى قبل save_check للفحص نفسه، فتُحسب النتيجة في آلة
+    # الحالات دون إدراج فحص. الفحص الذي يُحفظ بعدها يغيّر MAX(id) فتُعاد قراءة السلسلة من القاعدة
+    warnings.warn(
+        "track_incident_transition() is deprecated; use record_check(), which saves the check in the same write",
+        DeprecationWarning,
+        stacklevel=2,
+    )
+    now = get_now()
+    path = config.DB_PATH
+
+    def transition(conn: sqlite3.Connection) -> tuple[bool, bool]:
+        with _incident_tracker.lock:
+            _incident_tracker.sync(conn, path)
+            last_id = conn.execute("SELECT MAX(id) FROM checks").fetchone()[0]
+            return _incident_tracker.observe(conn, path, last_id, new_status, now)
+
+    result = write(transition) or (False, False)
+    if any(result):
+        bump_generation()
+    return result
+
+
+@cached_reader
+@QUERY_SECONDS.time(query="get_recent_checks")
+def get_recent_checks(limit: int = 20) -> "pd.DataFrame":
+    import pandas as pd
+
+    with read_connection() as conn:
+        if conn is None:
+            return pd.DataFrame(columns=["status", "timestamp"])
+        query = "SELECT status, timestamp FROM checks ORDER BY id DESC LIMIT ?"
+        return pd.read_sql_query(query, conn, params=(limit,))
+
+
+@cached_reader
+@QUERY_SECONDS.time(query="get_last_check_targets")
+def get_last_check_targets() -> "pd.DataFrame":
+    import pandas as pd
+
+    query = """
+    SELECT target, status_code, ROUND(latency_ms, 1) AS latency_ms, error,
+           ROUND(dns_ms, 1) AS dns_ms, ROUND(connect_ms, 1) AS connect_ms,
+           ROUND(tls_ms, 1) AS tls_ms, ROUND(ttfb_ms, 1) AS ttfb_ms,
+           ROUND(transfer_ms, 1) AS transfer_ms
+    FROM check_targets
+    WHERE check_id = (SELECT MAX(check_id) FROM check_targets)
+    ORDER BY id
+    """
+    with read_connection() as conn:
+        if conn is None:
+            return pd.DataFrame(columns=["target", "status_code", "latency_ms", "error", *PHASE_COLUMNS])
+        return pd.read_sql_query(query, conn)
+
+
+@cached_reader
+@QUERY_SECONDS.time(query="get_incidents")
+def get_incidents(limit: int = 20) -> "pd.DataFrame":
+    import pandas as pd
+
+    query = """
+    SELECT started_at, ended_at, duration_seconds, start_reason, end_reason
+    FROM incidents
+    ORDER BY id DESC
+    LIMIT ?
+    """
+    with read_connection() as conn:
+        if conn is None:
+            return pd.DataFrame(columns=["started_at", "ended_at", "duration", "start_reason", "end_reason"])
+        df = pd.read_sql_query(query, conn, params=(limit,))
+
+    if not df.empty:
+        df["duration"] = df["duration_seconds"].apply(format_duration)
+        df.drop(columns=["duration_seconds"], inplace=True)
+    return df
+
+
+# ------------------ القراءة التزايدية للوحات الحية ------------------
+# كل لوحة تحتفظ بآخر id رأته وتطلب ما بعده فقط: بحث في مفتاح id يعيد لا شيء في أغلب الدورات.
+# reread: صفوف سبق جلبها وقد تتغير بعده (الحوادث المفتوحة تُغلق بتحديث لا بإدراج)
+LIVE_TABLES = {
+    "checks": "status, timestamp",
+    "speed_checks": """mode, ROUND(download_mbps, 2) AS download_mbps, ROUND(latency_ms, 1) AS latency_ms,
+        ROUND(dns_ms, 1) AS dns_ms, ROUND(connect_ms, 1) AS connect_ms, ROUND(tls_ms, 1) AS tls_ms,
+        sample_count, ROUND(ci_mbps, 2) AS ci_mbps, stop_reason, drop_detected, timestamp""",
+    "incidents": "started_at, ended_at, duration_seconds, start_reason, end_reason",
+}
+
+
+@QUERY_SECONDS.time(query="get_rows_since")
+def get_rows_since(
+    table: str, after_id: int, limit: int, reread: tuple[int, ...] = ()
+) -> tuple[list[str], list[tuple]] | None:
+    if table not in LIVE_TABLES:
+        raise ValueError(f"Unknown live table: {table}")
+    where = "id > ?"
+    if reread:
+        where += f" OR id IN ({', '.join('?' * len(reread))})"
+    query = f"SELECT id, {LIVE_TABLES[table]} FROM {table} WHERE {where} ORDER BY id DESC LIMIT ?"
+    with read_connection() as conn:
+        if conn is None:
+            return None
+        cursor = conn.execute(query, (after_id, *reread, limit + len(reread)))
+        return [description[0] for description in cursor.description], cursor.fetchall()
+
+
+@cached_reader
+@QUERY_SECONDS.time(query="compute_sla")
+def compute_sla(hours: int = 24) -> dict:
+    # الساعات الكاملة من rollup_hour، والأطراف الجزئية من rollup_minute،
+    # أو من rollup_5min إن كانت أقدم من مدة الاحتفاظ بمجاميع الدقيقة
+    now = int(get_now().timestamp())
+    since = now - hours * 3600
+    minute_start = since - since % 60
+    hour_start = minute_start + (-minute_start) % 3600
+    hour_end = max(hour_start, now - now % 3600)
+
+    query = """
+    SELECT COALESCE(SUM(up_count), 0), COALESCE(SUM(total_count), 0),
+           COALESCE(SUM(speed_sum), 0), COALESCE(SUM(speed_count), 0),
+           COALESCE(SUM(incident_count), 0)
+    FROM (
+        SELECT up_count, total_count, speed_sum, speed_count, incident_count
+        FROM rollup_hour WHERE bucket >= ? AND bucket < ?
+        UNION ALL
+        SELECT up_count, total_count, speed_sum, speed_count, incident_count
+        FROM rollup_minute WHERE (bucket >= ? AND bucket < ?) OR bucket >= ?
+        UNION ALL
+        SELECT up_count, total_count, speed_sum, speed_count, incident_count
+        FROM rollup_5min WHERE (bucket >= ? AND bucket < ?) OR bucket >= ?
+    )
+    """
+    with read_connection() as conn:
+        if conn is None:
+            return {"uptime_pct": None, "checks_count": 0, "outages": 0, "avg_speed": None}
+        up_count, checks_count, speed_sum, speed_count, outages = conn.execute(
+            query, (hour_start, hour_end, *(minute_start, hour_start, hour_end) * 2)
+        ).fetchone()
+
+    uptime_pct = None
+    if checks_count > 0:
+        uptime_pct = round((up_count / checks_count) * 100, 2)
+
+    avg_speed = None
+    if speed_count > 0:
+        avg_speed = round(speed_sum / speed_count, 2)
+
+    return {
+        "uptime_pct": uptime_pct,
+        "checks_count": checks_count,
+        "outages": outages,
+        "avg_speed": avg_speed,
+    }
+
+
+def _series_window(hours: float, max_points: int) -> tuple[int, int, int]:
+    # الفئات تُحاذى على منتصف الليل المحلي لا UTC، فتبدأ فئة اليوم عند 00:00 بتوقيت الرياض
+    now = get_now()
+    offset = int(now.utcoffset().total_seconds())
+    span = int(hours * 3600)
+    width = series_bucket_width(span, max_points)
+    since = int(now.timestamp()) - span
+    since -= (since + offset) % width
+    return since, width, offset
+
+
+def _series_times(epochs: "pd.Series") -> "pd.Series":
+    import pandas as pd
+
+    return pd.to_datetime(epochs, unit="s", utc=True).dt.tz_convert(get_now().tzinfo)
+
+
+@cached_reader
+@QUERY_SECONDS.time(query="get_rollup_series")
+def get_rollup_series(hours: float, max_points: int = CHART_MAX_POINTS) -> "pd.DataFrame":
+    import pandas as pd
+
+    columns = ["time", "checks", "uptime_pct", "speed_avg", "speed_min", "speed_max", "incidents"]
+    since, width, offset = _series_window(hours, max_points)
+    source = " UNION ALL ".join(
+        f"SELECT {ROLLUP_COLUMNS} FROM {table} WHERE bucket >= :since" for table in series_sources(width)
+    )
+    query = f"""
+    SELECT (bucket + :offset) - (bucket + :offset) % :width - :offset AS bucket,
+           SUM(up_count) AS up_count, SUM(total_count) AS checks,
+           SUM(speed_sum) AS speed_sum, SUM(speed_count) AS speed_count,
+           MIN(speed_min) AS speed_min, MAX(speed_max) AS speed_max, SUM(incident_count) AS incidents
+    FROM ({source})
+    GROUP BY 1
+    ORDER BY 1
+    """
+    with read_connection() as conn:
+        if conn is None:
+            return pd.DataFrame(columns=columns)
+        df = pd.read_sql_query(query, conn, params={"since": since, "width": width, "offset": offset})
+
+    df["time"] = _series_times(df["bucket"])
+    df["uptime_pct"] = (df["up_count"] * 100 / df["checks"].where(df["checks"] > 0)).round(2)
+    df["speed_avg"] = (df["speed_sum"] / df["speed_count"].where(df["speed_count"] > 0)).round(2)
+    return df[columns]
+
+
+@cached_reader
+@QUERY_SECONDS.time(query="get_latency_series")
+def get_latency_series(hours: float, max_points: int = CHART_MAX_POINTS) -> "pd.DataFrame":
+    import pandas as pd
+
+    # لكل هدف: وسيط متوسط وأسوأ p95 في الفئة، فلا تختفي القمم القصيرة عند التصغير
+    columns = ["time", "target", "p50_ms", "p95_ms", "loss_pct"]
+    since, width, offset = _series_window(hours, max_points)
+    query = """
+    SELECT (ts + :offset) - (ts + :offset) % :width - :offset AS bucket, target,
+           ROUND(AVG(p50_ms), 1) AS p50_ms, ROUND(MAX(p95_ms), 1) AS p95_ms,
+           ROUND(100.0 - SUM(received) * 100.0 / NULLIF(SUM(sent), 0), 2) AS loss_pct
+    FROM latency_probes
+    WHERE ts >= :since
+    GROUP BY target, 1
+    ORDER BY target, 1
+    """
+    with read_connection() as conn:
+        if conn is None:
+            return pd.DataFrame(columns=columns)
+        df = pd.read_sql_query(query, conn, params={"since": since, "width": width, "offset": offset})
+
+    df["time"] = _series_times(df["bucket"])
+    return df[columns]
+
+
+@QUERY_SECONDS.time(query="save_speed_check")
+def save_speed_check(result: dict, drop_detected: bool | None = None, wait: bool = True) -> dict[str, dict] | None:
+    # الحكم على القراءة بخط أساس ساعتها، وتحديث الخط، وحفظ الاختبار في مهمة كتابة واحدة.
+    # drop_detected من الواجهة القديمة يُتجاهل (الحكم يُحسب هنا)؛ و wait=False يعيد None كما كان
+    if drop_detected is not None:
+        warnings.warn(
+            "save_speed_check(drop_detected=...) is deprecated and ignored; the drop verdict is now returned",
+            DeprecationWarning,
+            stacklevel=2,
+        )
+    now = get_now()
+    timestamp = now.isoformat()
+    ts = int(now.timestamp())
+    path = config.DB_PATH
+
+    def insert(conn: sqlite3.Connection) -> dict[str, dict]:
+        with _anomaly_detector.lock:
+            _anomaly_detector.sync(conn, path)
+            verdicts = {
+                metric: _anomaly_detector.observe(conn, path, metric, result[metric], ts) for metric in SPEED_METRICS
+            }
+        drop = verdicts["download_mbps"]
+        cur = conn.execute(
+            """
+            INSERT INTO speed_checks (
+                mode, download_mbps, latency_ms, drop_detected, threshold_mbps, timestamp, ts,
+                dns_ms, connect_ms, tls_ms, ttfb_ms, transfer_ms,
+                sample_count, ci_mbps, converged, stop_reason
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (
+                result["mode"],
+                result["download_mbps"],
+                result["latency_ms"],
+                int(drop["anomaly"]),
+                drop["threshold"],
+                timestamp,
+                ts,
+                *(result.get(column) for column in PHASE_COLUMNS),
+                result.get("sample_count"),
+                result.get("ci_mbps"),
+                None if result.get("converged") is None else int(result["converged"]),
+                result.get("stop_reason"),
+            ),
+        )
+        if result["download_mbps"] is not None:
+            bump_rollups(conn, ts, speed=result["download_mbps"])
+        if result.get("streams"):
+            conn.executemany(
+                """
+                INSERT INTO speed_streams (speed_check_id, server, stream, bytes, seconds, mbps, error)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                [
+                    (
+                        cur.lastrowid,
+                        stat["server"],
+                        stat["stream"],
+                        stat["bytes"],
+                        stat["seconds"],
+                        stat["mbps"],
+                        stat["error"],
+                    )
+                    for stat in result["streams"]
+                ],
+            )
+        return verdicts
+
+    verdicts = write(insert, wait=wait)
+    bump_generation()
+    if not wait:
+        return None
+    if verdicts is None:
+        # تعذّرت الكتابة: حكم بلا خط أساس (العتبة الثابتة) حتى لا يضيع تنبيه الهبوط
+        verdicts = {metric: evaluate(metric, result[metric], None, None) for metric in SPEED_METRICS}
+    return verdicts
+
+
+@cached_reader
+@QUERY_SECONDS.time(query="get_remote_sites")
+def get_remote_sites() -> "pd.DataFrame":
+    import pandas as pd
+
+    query = """
+    SELECT site_id, agent_id, last_status, last_check_ts, ROUND(last_download_mbps, 2) AS download_mbps,
+           last_speed_ts, last_seen_ts
+    FROM remote_sites
+    ORDER BY site_id, agent_id
+    """
+    columns = ["site_id", "agent_id", "last_status", "download_mbps", "last_check", "last_speed_test", "last_seen"]
+    with read_connection() as conn:
+        if conn is None:
+            return pd.DataFrame(columns=columns)
+        df = pd.read_sql_query(query, conn)
+
+    for source, target in (("last_check_ts", "last_check"), ("last_speed_ts", "last_speed_test"), ("last_seen_ts", "last_seen")):
+        df[target] = pd.to_datetime(df.pop(source), unit="s", utc=True).dt.tz_convert(TZ).dt.strftime(
+            "%Y-%m-%d %H:%M:%S"
+        )
+    return df[columns]
+
+
+@cached_reader
+@QUERY_SECONDS.time(query="get_recent_speed_checks")
+def get_recent_speed_checks(limit: int = 10) -> "pd.DataFrame":
+    import pandas as pd
+
+    query = """
+    SELECT mode, ROUND(download_mbps, 2) AS download_mbps,
+           ROUND(latency_ms, 1) AS latency_ms,
+           ROUND(dns_ms, 1) AS dns_ms, ROUND(connect_ms, 1) AS connect_ms,
+           ROUND(tls_ms, 1) AS tls_ms,
+           sample_count, ROUND(ci_mbps, 2) AS ci_mbps, stop_reason,
+           drop_detected, timestamp
+    FROM speed_checks
+    ORDER BY id DESC
+    LIMIT ?
+    """
+    with read_connection() as conn:
+        if conn is None:
+            return pd.DataFrame(
+                columns=[
+                    "mode",
+                    "download_mbps",
+                    "latency_ms",
+                    "dns_ms",
+                    "connect_ms",
+                    "tls_ms",
+                    "sample_count",
+                    "ci_mbps",
+                    "stop_reason",
+                    "drop_detected",
+                    "timestamp",
+                ]
+            )
+        return pd.read_sql_query(query, conn, params=(limit,))
+
+
+@QUERY_SECONDS.time(query="save_latency_probe")
+def save_latency_probe(summaries: list[dict], wait: bool = True) -> dict[str, dict]:
+    now = get_now()
+    timestamp = now.isoformat()
+    ts = int(now.timestamp())
+    path = config.DB_PATH
+
+    def insert(conn: sqlite3.Connection) -> dict[str, dict]:
+        with _anomaly_detector.lock:
+            _anomaly_detector.sync(conn, path)
+            verdicts = {
+                summary["target"]: _anomaly_detector.observe(
+                    conn, path, LATENCY_METRIC_PREFIX + summary["target"], summary["p50_ms"], ts
+                )
+                for summary in summaries
+            }
+        conn.executemany(
+            f"""
+            INSERT INTO latency_probes (target, sent, received, loss_pct, {", ".join(LATENCY_STAT_COLUMNS)}, timestamp, ts)
+            VALUES ({", ".join("?" for _ in range(6 + len(LATENCY_STAT_COLUMNS)))})
+            """,
+            [
+                (
+                    summary["target"],
+                    summary["sent"],
+                    summary["received"],
+                    summary["loss_pct"],
+                    *(summary[column] for column in LATENCY_STAT_COLUMNS),
+                    timestamp,
+                    ts,
+                )
+                for summary in summaries
+            ],
+        )
+        return verdicts
+
+    verdicts = write(insert, wait=wait)
+    bump_generation()
+    return verdicts or {}
+
+
+@cached_reader
+@QUERY_SECONDS.time(query="get_recent_latency_probes")
+def get_recent_latency_probes(limit: int = 12) -> "pd.DataFrame":
+    import pandas as pd
+
+    columns = ["target", "sent", "received", "loss_pct", *LATENCY_STAT_COLUMNS, "timestamp"]
+    query = f"""
+    SELECT target, sent, received, loss_pct,
+           {", ".join(f"ROUND({column}, 1) AS {column}" for column in LATENCY_STAT_COLUMNS)},
+           timestamp
+    FROM latency_probes
+    ORDER BY id DESC
+    LIMIT ?
+    """
+    with read_connection() as conn:
+        if conn is None:
+            return pd.DataFrame(columns=columns)
+        return pd.read_sql_query(query, conn, params=(limit,))
+
+
+def rebuild_anomaly_baselines() -> int | None:
+    with read_connection() as conn:
+        if conn is None:
+            return None
+        rows, last_speed_id, last_latency_id = compute_baselines(conn)
+    path = config.DB_PATH
+
+    def replace(conn: sqlite3.Connection) -> int:
+        with _anomaly_detector.lock:
+            replace_baselines(_anomaly_detector, conn, path, rows, last_speed_id, last_latency_id)
+        return len(rows)
+
+    replaced = write(replace)
+    bump_generation()
+    return replaced
+
+
+def start_baseline_backfill() -> None:
+    # قاعدة بتاريخ سابق لخطوط الأساس تُبنى خطوطها مرة واحدة في الخلفية؛ حتى ذلك تعمل العتبة الثابتة
+    with read_connection() as conn:
+        if conn is None:
+            return
+        if conn.execute("SELECT 1 FROM baselines LIMIT 1").fetchone() is not None:
+            return
+        if conn.execute("SELECT 1 FROM speed_checks LIMIT 1").fetchone() is None:
+            return
+    threading.Thread(target=rebuild_anomaly_baselines, name="baseline-backfill", daemon=True).start()
+
+
+@cached_reader
+@QUERY_SECONDS.time(query="get_baselines")
+def get_baselines(metric: str = "download_mbps") -> "pd.DataFrame":
+    import pandas as pd
+
+    columns = ["hour", "samples", "median", "mad", "ewma", "threshold"]
+    with read_connection() as conn:
+        if conn is None:
+            return pd.DataFrame(columns=columns)
+        rows = conn.execute(
+            "SELECT hour, samples, ewma, ewvar, window FROM baselines WHERE metric = ? ORDER BY hour", (metric,)
+        ).fetchall()
+    overall = next((Baseline(samples, ewma, ewvar) for hour, samples, ewma, ewvar, _ in rows if hour == ALL_HOURS), None)
+    records = []
+    for hour, samples, ewma, ewvar, window in rows:
+        if hour == ALL_HOURS:
+            continue
+        baseline = Baseline(samples, ewma, ewvar, json.loads(window))
+        median, mad = baseline.robust()
+        verdict = evaluate(metric, None, baseline, overall)
+        records.append((f"{hour:02d}:00", samples, median, mad, ewma, verdict["threshold"]))
+    return pd.DataFrame(records, columns=columns).round(2)
+
+
+_TARGET_HEALTH_COLUMNS = [
+    "kind",
+    "target",
+    "state",
+    "failures",
+    "reopen_count",
+    "open_until_ts",
+    "p50_ms",
+    "p95_ms",
+    "timeout_s",
+    "last_error",
+]
+
+
+def _load_target_health() -> list[dict]:
+    with read_connection() as conn:
+        if conn is None:
+            return []
+        rows = conn.execute(f"SELECT {', '.join(_TARGET_HEALTH_COLUMNS)} FROM target_health").fetchall()
+    return [dict(zip(_TARGET_HEALTH_COLUMNS, row)) for row in rows]
+
+
+@QUERY_SECONDS.time(query="save_target_health")
+def save_target_health(snapshots: list[dict], wait: bool = False) -> None:
+    if not snapshots:
+        return
+    updated_ts = int(get_now().timestamp())
+
+    def upsert(conn: sqlite3.Connection) -> None:
+        conn.executemany(
+            f"""
+            INSERT OR REPLACE INTO target_health ({", ".join(_TARGET_HEALTH_COLUMNS)}, updated_ts)
+            VALUES ({", ".join("?" * (len(_TARGET_HEALTH_COLUMNS) + 1))})
+            """,
+            [(*(snapshot[column] for column in _TARGET_HEALTH_COLUMNS), updated_ts) for snapshot in snapshots],
+        )
+
+    write(upsert, wait=wait)
+    bump_generation()
+
+
+@cached_reader
+@QUERY_SECONDS.time(query="get_target_health")
+def get_target_health() -> "pd.DataFrame":
+    import pandas as pd
+
+    columns = ["kind", "target", "state", "failures", "p50_ms", "p95_ms", "timeout_s", "retry_at", "last_error"]
+    query = """
+    SELECT kind, target, state, failures, ROUND(p50_ms, 1) AS p50_ms, ROUND(p95_ms, 1) AS p95_ms,
+           ROUND(timeout_s, 2) AS timeout_s, open_until_ts, last_error
+    FROM target_health
+    ORDER BY kind, state != 'closed' DESC, target
+    """
+    with read_connection() as conn:
+        if conn is None:
+            return pd.DataFrame(columns=columns)
+        df = pd.read_sql_query(query, conn)
+    df["retry_at"] = (
+        pd.to_datetime(df.pop("open_until_ts"), unit="s", utc=True).dt.tz_convert(TZ).dt.strftime("%H:%M:%S")
+    )
+    return df[columns]
+
+
+@QUERY_SECONDS.time(query="seconds_since_last_speed_test")
+def seconds_since_last_speed_test() -> float | None:
+    with read_connection() as conn:
+        if conn is None:
+            return None
+        # ts قد يكون فارغًا لصف قديم لم تصله التعبئة بعد
+        row = conn.execute(
+            """
+            SELECT COALESCE(ts, CAST(strftime('%s', timestamp) AS INTEGER))
+            FROM speed_checks ORDER BY id DESC LIMIT 1
+            """
+        ).fetchone()
+    if not row or row[0] is None:
+        return None
+
+    return get_now().timestamp() - row[0]
+
+
+# ------------------ مقاييس الحالة ------------------
+# تُقرأ عند كل سحب لـ /metrics؛ استعلامات على الفهارس فقط
+def _scalar(query: str) -> float | None:
+    with read_connection() as conn:
+        if conn is None:
+            return None
+        row = conn.execute(query).fetchone()
+    return row[0] if row else None
+
+
+gauge(
+    "netmon_connectivity_up",
+    "1 when the latest connectivity check was UP, 0 when DOWN",
+    lambda: None if (status := get_last_status()) is None else int(status == "UP"),
+)
+gauge(
+    "netmon_last_download_mbps",
+    "Download throughput of the latest speed test",
+    lambda: _scalar("SELECT download_mbps FROM speed_checks ORDER BY id DESC LIMIT 1"),
+)
+gauge(
+    "netmon_open_incidents",
+    "Incidents that have not ended yet",
+    lambda: _scalar("SELECT COUNT(*) FROM incidents WHERE ended_at IS NULL"),
+)
+gauge("netmon_db_size_bytes", "Size of results.db including its WAL", database_size_bytes)
@@ -0,0 +1,255 @@
+import atexit
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections.abc import Callable, Iterator
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import TypeVar
+
+from netmon import config
+from netmon.metrics import counter, histogram
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+_STOP = object()
+
+WRITE_SECONDS = histogram("netmon_db_write_seconds", "Time from queueing a write task until it is committed")
+WRITE_BATCH_SIZE = histogram(
+    "netmon_db_write_batch_tasks", "Write tasks committed per transaction", buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256)
+)
+DB_ERRORS = counter("netmon_db_errors_total", "SQLite errors by operation")
+
+
+# ------------------ محرك SQLite ------------------
+# اتصالات القراءة تُعاد إلى مجمّع بعد كل استخدام، وكل الكتابة تمر عبر خيط واحد
+# يجمع المهام المنتظرة في معاملة واحدة (group commit)، فلا يتنافس القرّاء والكتّاب على القفل.
+def _connect(path: str, writer: bool) -> sqlite3.Connection:
+    # isolation_level=None: المعاملات تُدار صراحةً هنا لا ضمنيًا من وحدة sqlite3
+    conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, cached_statements=256)
+    conn.execute(f"PRAGMA busy_timeout={config.DB_BUSY_TIMEOUT_MS}")
+    if writer:
+        # لا يسري إلا على قاعدة جديدة قبل إنشاء الجداول؛ القواعد القائمة تُحوَّل بـ compact --vacuum
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA cache_size=-{config.DB_CACHE_KIB}")
+    conn.execute(f"PRAGMA mmap_size={config.DB_MMAP_BYTES}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+
+class _Writer(threading.Thread):
+    def __init__(self, path: str):
+        super().__init__(name="sqlite-writer", daemon=True)
+        self.path = path
+        self.tasks: queue.Queue = queue.Queue()
+
+    def run(self) -> None:
+        try:
+            conn = _connect(self.path, writer=True)
+        except sqlite3.Error as error:
+            logger.error("Database connection error: %s", error)
+            self._fail_pending(error)
+            return
+
+        pending = None
+        while True:
+            task = pending if pending is not None else self.tasks.get()
+            pending = None
+            if task is _STOP:
+                break
+            if not task[2]:
+                self._run_alone(conn, task)
+                continue
+            batch = [task]
+            while len(batch) < config.DB_WRITE_BATCH_SIZE:
+                try:
+                    task = self.tasks.get_nowait()
+                except queue.Empty:
+                    break
+                # مهام الصيانة (VACUUM وما شابه) تعمل خارج أي معاملة، فتُؤجَّل لما بعد الدفعة
+                if task is _STOP or not task[2]:
+                    pending = task
+                    break
+                batch.append(task)
+            self._run_batch(conn, batch)
+        conn.close()
+
+    def _run_alone(self, conn: sqlite3.Connection, task: tuple[Callable, Future, bool]) -> None:
+        func, future, _ = task
+        try:
+            future.set_result(func(conn))
+        except Exception as error:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            future.set_exception(error)
+
+    def _run_batch(self, conn: sqlite3.Connection, batch: list[tuple[Callable, Future, bool]]) -> None:
+        WRITE_BATCH_SIZE.observe(len(batch))
+        outcomes = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for func, future, _ in batch:
+                # نقطة حفظ لكل مهمة: فشل مهمة واحدة لا يُسقط بقية الدفعة
+                conn.execute("SAVEPOINT task")
+                try:
+                    outcomes.append((future, func(conn), None))
+                    conn.execute("RELEASE task")
+                except Exception as error:
+                    conn.execute("ROLLBACK TO task")
+                    conn.execute("RELEASE task")
+                    outcomes.append((future, None, error))
+            conn.execute("COMMIT")
+        except sqlite3.Error as error:
+            logger.error("Write batch of %d failed: %s", len(batch), error)
+            DB_ERRORS.inc(operation="write_batch")
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            for _, future, _ in batch:
+                future.set_exception(error)
+            return
+
+        for future, value, error in outcomes:
+            if error is None:
+                future.set_result(value)
+            else:
+                future.set_exception(error)
+
+    def _fail_pending(self, error: Exception) -> None:
+        while True:
+            try:
+                task = self.tasks.get_nowait()
+            except queue.Empty:
+                return
+            if task is not _STOP:
+                task[1].set_exception(error)
+
+
+class _Engine:
+    def __init__(self, path: str):
+        self.path = path
+        self.pid = os.getpid()
+        self._idle: list[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self._writer: _Writer | None = None
+        self._watch_conn: sqlite3.Connection | None = None
+        self._watch_lock = threading.Lock()
+        # خطوات الإعداد التي تمت لهذه القاعدة في هذه العملية (انظر db.init_db)
+        self.initialized: set[str] = set()
+
+    def acquire(self) -> sqlite3.Connection:
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return _connect(self.path, writer=False)
+
+    def release(self, conn: sqlite3.Connection) -> None:
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            if len(self._idle) < config.DB_READ_POOL_SIZE:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def writer(self) -> _Writer:
+        with self._lock:
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = _Writer(self.path)
+                self._writer.start()
+            return self._writer
+
+    def data_version(self) -> int:
+        # اتصال مراقبة مخصص: تتغير قيمته كلما التزم أي اتصال آخر، ولو من عملية أخرى
+        with self._watch_lock:
+            if self._watch_conn is None:
+                self._watch_conn = _connect(self.path, writer=False)
+            return self._watch_conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def close(self) -> None:
+        with self._watch_lock:
+            if self._watch_conn is not None:
+                self._watch_conn.close()
+                self._watch_conn = None
+        with self._lock:
+            writer, self._writer = self._writer, None
+            idle, self._idle = self._idle, []
+        if writer is not None and writer.is_alive():
+            writer.tasks.put(_STOP)
+            writer.join(timeout=10)
+        for conn in idle:
+            conn.close()
+
+
+_engine: _Engine | None = None
+_engine_lock = threading.Lock()
+
+
+def get_engine() -> _Engine:
+    global _engine
+    with _engine_lock:
+        # بعد fork (gunicorn/celery) لا تُشارك اتصالات العملية الأم
+        if _engine is None or _engine.path != config.DB_PATH or _engine.pid != os.getpid():
+            if _engine is not None and _engine.pid == os.getpid():
+                _engine.close()
+            _engine = _Engine(config.DB_PATH)
+        return _engine
+
+
+def close_engine() -> None:
+    global _engine
+    with _engine_lock:
+        engine, _engine = _engine, None
+    if engine is not None and engine.pid == os.getpid():
+        engine.close()
+
+
+atexit.register(close_engine)
+
+
+@contextmanager
+def read_connection() -> Iterator[sqlite3.Connection | None]:
+    engine = get_engine()
+    try:
+        conn = engine.acquire()
+    except sqlite3.Error as error:
+        logger.error("Database connection error: %s", error)
+        DB_ERRORS.inc(operation="connect")
+        yield None
+        return
+    try:
+        yield conn
+    finally:
+        engine.release(conn)
+
+
+def data_version() -> int | None:
+    try:
+        return get_engine().data_version()
+    except sqlite3.Error as error:
+        logger.error("Database connection error: %s", error)
+        return None
+
+
+def write(task: Callable[[sqlite3.Connection], T], wait: bool = True, transactional: bool = True) -> T | None:
+    # المهمة تُنفَّذ داخل معاملة الدفعة؛ يجب ألا تستدعي commit أو تستخدم with conn.
+    # transactional=False يشغّلها وحدها على اتصال الكاتب خارج أي معاملة.
+    future: Future = Future()
+    queued = time.perf_counter()
+    get_engine().writer().tasks.put((task, future, transactional))
+    if not wait:
+        return None
+    try:
+        return future.result()
+    except sqlite3.Error as error:
+        logger.error("Database write failed: %s", error)
+        DB_ERRORS.inc(operation="write")
+        return None
+    finally:
+        WRITE_SECONDS.observe(time.perf_counter() - queued, transactional=str(transactional).lower())
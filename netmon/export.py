@@ -0,0 +1,137 @@
+import csv
+import gzip
+import io
+import json
+import re
+from collections.abc import Iterator
+from datetime import datetime, timedelta
+
+from netmon.config import EXPORT_CHUNK_ROWS
+from netmon.engine import read_connection
+from netmon.metrics import counter
+from netmon.utils import get_now
+
+# الجداول القابلة للتصدير وعمودها الزمني المفهرس
+EXPORT_TABLES = {
+    "checks": "ts",
+    "speed_checks": "ts",
+    "incidents": "started_ts",
+    "latency_probes": "ts",
+    "remote_checks": "ts",
+    "remote_speed_checks": "ts",
+}
+EXPORT_FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+EXPORTED_ROWS = counter("netmon_exported_rows_total", "Rows streamed out by exports, by table and format")
+
+_RELATIVE_TIME = re.compile(r"^(\d+(?:\.\d+)?)([mhd])$")
+_RELATIVE_UNITS = {"m": "minutes", "h": "hours", "d": "days"}
+
+
+def parse_time(value: str) -> int:
+    # "24h" و "7d" نسبةً إلى الآن، أو تاريخ ISO (بتوقيت الرياض إن لم تُحدَّد منطقة)
+    match = _RELATIVE_TIME.match(value.strip())
+    now = get_now()
+    if match:
+        amount, unit = match.groups()
+        return int((now - timedelta(**{_RELATIVE_UNITS[unit]: float(amount)})).timestamp())
+    moment = datetime.fromisoformat(value.strip())
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=now.tzinfo)
+    return int(moment.timestamp())
+
+
+# ------------------ التصدير المتدفق ------------------
+# حدود id تُحسب مرة واحدة من فهرس العمود الزمني، ثم تُقرأ الصفوف على دفعات بمفتاح id
+# (keyset) باتصال يُعاد إلى المجمّع بعد كل دفعة: لا معاملة قراءة طويلة تعطّل checkpoint،
+# والذاكرة بحجم دفعة واحدة مهما بلغ عدد الصفوف. الصفوف المضافة أثناء التصدير لا تدخل فيه.
+def _id_bounds(table: str, since: int | None, until: int | None) -> tuple[int, int] | None:
+    time_column = EXPORT_TABLES[table]
+    with read_connection() as conn:
+        if conn is None:
+            return None
+        if since is None:
+            low = conn.execute(f"SELECT MIN(id) FROM {table}").fetchone()[0]
+        else:
+            low = conn.execute(f"SELECT MIN(id) FROM {table} WHERE {time_column} >= ?", (since,)).fetchone()[0]
+        if until is None:
+            high = conn.execute(f"SELECT MAX(id) FROM {table}").fetchone()[0]
+        else:
+            high = conn.execute(f"SELECT MAX(id) FROM {table} WHERE {time_column} < ?", (until,)).fetchone()[0]
+    if low is None or high is None or low > high:
+        return None
+    return low, high
+
+
+def iter_chunks(
+    table: str, since: int | None = None, until: int | None = None, chunk_rows: int = EXPORT_CHUNK_ROWS
+) -> Iterator[tuple[list[str], list[tuple]]]:
+    if table not in EXPORT_TABLES:
+        raise ValueError(f"Unknown export table: {table}")
+    bounds = _id_bounds(table, since, until)
+    if bounds is None:
+        return
+    low, high = bounds
+
+    time_column = EXPORT_TABLES[table]
+    filters = ""
+    if since is not None:
+        filters += f" AND {time_column} >= :since"
+    if until is not None:
+        filters += f" AND {time_column} < :until"
+    query = f"SELECT * FROM {table} WHERE id > :cursor AND id <= :high{filters} ORDER BY id LIMIT :limit"
+
+    cursor = low - 1
+    while cursor < high:
+        with read_connection() as conn:
+            if conn is None:
+                return
+            result = conn.execute(
+                query, {"cursor": cursor, "high": high, "since": since, "until": until, "limit": chunk_rows}
+            )
+            columns = [description[0] for description in result.description]
+            rows = result.fetchall()
+        if not rows:
+            return
+        yield columns, rows
+        cursor = rows[-1][columns.index("id")]
+
+
+def stream_export(
+    table: str,
+    fmt: str = "csv",
+    since: int | None = None,
+    until: int | None = None,
+    chunk_rows: int = EXPORT_CHUNK_ROWS,
+) -> Iterator[str]:
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    header_written = False
+    for columns, rows in iter_chunks(table, since, until, chunk_rows):
+        if fmt == "csv":
+            if not header_written:
+                writer.writerow(columns)
+                header_written = True
+            writer.writerows(rows)
+            chunk = buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        else:
+            chunk = "".join(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + "\n" for row in rows)
+        EXPORTED_ROWS.inc(len(rows), table=table, format=fmt)
+        yield chunk
+
+
+def export_bytes(
+    table: str, fmt: str = "csv", since: int | None = None, until: int | None = None, compress: bool = True
+) -> bytes:
+    # زر التنزيل في Streamlit يحتاج الملف كاملًا قبل إرساله؛ الضغط أثناء التدفق يبقيه بجزء من حجمه.
+    # للتصديرات الكبيرة بلا سقف للذاكرة: python -m netmon export
+    buffer = io.BytesIO()
+    sink = gzip.GzipFile(fileobj=buffer, mode="wb") if compress else buffer
+    for chunk in stream_export(table, fmt, since, until):
+        sink.write(chunk.encode())
+    if compress:
+        sink.close()
+    return buffer.getvalue()
@@ -0,0 +1,138 @@
+import http.client
+import socket
+import ssl
+import threading
+import time
+from urllib.parse import urljoin, urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from netmon.config import HTTP_POOL_SIZE, PHASE_COLUMNS
+
+# ------------------ طبقة HTTP ------------------
+_http_session: requests.Session | None = None
+_http_session_lock = threading.Lock()
+_probe_pool: dict[tuple[str, str, int], list[http.client.HTTPConnection]] = {}
+_probe_pool_lock = threading.Lock()
+_ssl_context = ssl.create_default_context()
+
+
+def get_http_session() -> requests.Session:
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE
+            )
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _http_session = session
+        return _http_session
+
+
+def _open_probe_connection(scheme: str, host: str, port: int, timeout: float, timings: dict):
+    started = time.perf_counter()
+    addresses = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    resolved = time.perf_counter()
+    timings["dns_ms"] += (resolved - started) * 1000
+
+    sock = None
+    last_error: OSError | None = None
+    for family, socktype, proto, _, address in addresses:
+        sock = socket.socket(family, socktype, proto)
+        sock.settimeout(timeout)
+        try:
+            sock.connect(address)
+            break
+        except OSError as error:
+            sock.close()
+            sock = None
+            last_error = error
+    if sock is None:
+        raise last_error or OSError(f"could not connect to {host}:{port}")
+    connected = time.perf_counter()
+    timings["connect_ms"] += (connected - resolved) * 1000
+
+    if scheme == "https":
+        sock = _ssl_context.wrap_socket(sock, server_hostname=host)
+        timings["tls_ms"] += (time.perf_counter() - connected) * 1000
+        conn = http.client.HTTPSConnection(host, port, timeout=timeout, context=_ssl_context)
+    else:
+        conn = http.client.HTTPConnection(host, port, timeout=timeout)
+    conn.sock = sock
+    return conn
+
+
+def _probe_once(url: str, timeout: float, timings: dict) -> tuple[int, str | None]:
+    parts = urlsplit(url)
+    scheme = parts.scheme or "https"
+    port = parts.port or (443 if scheme == "https" else 80)
+    key = (scheme, parts.hostname or "", port)
+    path = parts.path or "/"
+    if parts.query:
+        path = f"{path}?{parts.query}"
+
+    with _probe_pool_lock:
+        idle = _probe_pool.get(key)
+        conn = idle.pop() if idle else None
+
+    # اتصال خامل قد يغلقه الخادم؛ نعيد المحاولة مرة واحدة باتصال جديد
+    for attempt in range(2):
+        reused = conn is not None
+        if conn is None:
+            conn = _open_probe_connection(scheme, key[1], port, timeout, timings)
+        conn.timeout = timeout
+        # المقبس المفتوح يحتفظ بمهلة فتحه؛ الاتصال المعاد استخدامه يأخذ مهلة هذا الطلب صراحة
+        if reused:
+            conn.sock.settimeout(timeout)
+        try:
+            sent = time.perf_counter()
+            conn.request("GET", path, headers={"User-Agent": "network-monitor", "Accept": "*/*"})
+            response = conn.getresponse()
+            first_byte = time.perf_counter()
+            response.read()
+            finished = time.perf_counter()
+        except (OSError, http.client.HTTPException) as exc:
+            conn.close()
+            conn = None
+            # انقضاء المهلة ليس اتصالًا منتهيًا؛ إعادة المحاولة تضاعف زمن حكم DOWN
+            if reused and attempt == 0 and not isinstance(exc, TimeoutError):
+                continue
+            raise
+        timings["ttfb_ms"] += (first_byte - sent) * 1000
+        timings["transfer_ms"] += (finished - first_byte) * 1000
+        break
+
+    if response.will_close:
+        conn.close()
+    else:
+        with _probe_pool_lock:
+            _probe_pool.setdefault(key, []).append(conn)
+
+    location = response.getheader("Location")
+    return response.status, urljoin(url, location) if location and 300 <= response.status < 400 else None
+
+
+def timed_get(url: str, timeout: float = 5, max_redirects: int = 5) -> dict:
+    # طلب خفيف على اتصال قابل لإعادة الاستخدام، مع تفكيك الزمن إلى مراحله:
+    # DNS ثم TCP ثم TLS ثم أول بايت ثم النقل. الاتصال المعاد استخدامه مراحله الأولى صفر.
+    timings = {column: 0.0 for column in PHASE_COLUMNS}
+    status_code = None
+    error = None
+    started = time.perf_counter()
+    try:
+        for _ in range(max_redirects + 1):
+            status_code, redirect = _probe_once(url, timeout, timings)
+            if redirect is None:
+                break
+            url = redirect
+    except (OSError, http.client.HTTPException, ValueError) as exc:
+        error = type(exc).__name__
+    return {
+        "status_code": status_code,
+        "latency_ms": (time.perf_counter() - started) * 1000 if error is None else None,
+        "error": error,
+        **timings,
+    }
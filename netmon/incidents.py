@@ -0,0 +1,97 @@
+import sqlite3
+import threading
+from datetime import datetime
+
+from netmon.config import INCIDENT_CLOSE_AFTER_SUCCESSES, INCIDENT_OPEN_AFTER_FAILURES
+from netmon.rollups import bump_rollups
+
+
+# ------------------ آلة حالة الحوادث ------------------
+# الحالة في الذاكرة: الحادثة المفتوحة وطول سلسلة النتائج المتطابقة الأخيرة. الحادثة تُفتح بعد
+# open_after فشلًا متتاليًا وتُغلق بعد close_after نجاحًا، فلا يولّد خط متذبذب حادثة وتنبيهًا
+# مع كل انقلاب. البداية والنهاية تؤرَّخان بأول فحص في السلسلة لا بالفحص الذي تجاوز العتبة.
+class IncidentTracker:
+    def __init__(
+        self,
+        open_after: int = INCIDENT_OPEN_AFTER_FAILURES,
+        close_after: int = INCIDENT_CLOSE_AFTER_SUCCESSES,
+    ):
+        self.open_after = max(1, open_after)
+        self.close_after = max(1, close_after)
+        self.lock = threading.Lock()
+        self.open_incident: tuple[int, datetime] | None = None
+        self.streak_status: str | None = None
+        self.streak_count = 0
+        self.streak_started: datetime | None = None
+        # (مسار القاعدة، آخر check_id رأته الحالة)؛ أي اختلاف يعني كاتبًا آخر أو معاملة تراجعت
+        self._synced: tuple[str, int | None] | None = None
+
+    def sync(self, conn: sqlite3.Connection, path: str) -> None:
+        last_id = conn.execute("SELECT MAX(id) FROM checks").fetchone()[0]
+        if self._synced != (path, last_id):
+            self._load(conn)
+            self._synced = (path, last_id)
+
+    def _load(self, conn: sqlite3.Connection) -> None:
+        row = conn.execute(
+            "SELECT id, started_at FROM incidents WHERE ended_at IS NULL ORDER BY id DESC LIMIT 1"
+        ).fetchone()
+        self.open_incident = (row[0], datetime.fromisoformat(row[1])) if row else None
+
+        self.streak_status, self.streak_count, self.streak_started = None, 0, None
+        limit = max(self.open_after, self.close_after)
+        rows = conn.execute("SELECT status, timestamp FROM checks ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+        for status, timestamp in rows:
+            if self.streak_status is not None and status != self.streak_status:
+                break
+            self.streak_status = status
+            self.streak_count += 1
+            self.streak_started = datetime.fromisoformat(timestamp)
+
+    def observe(
+        self, conn: sqlite3.Connection, path: str, check_id: int, status: str, at: datetime
+    ) -> tuple[bool, bool]:
+        # تُعلَّم الحالة غير متزامنة حتى تكتمل، فإن فشلت المهمة في منتصفها أعاد الفحص التالي بناءها
+        self._synced = None
+        if status == self.streak_status:
+            self.streak_count += 1
+        else:
+            self.streak_status, self.streak_count, self.streak_started = status, 1, at
+
+        opened = closed = False
+        if status == "DOWN" and self.open_incident is None and self.streak_count >= self.open_after:
+            started = self.streak_started
+            reason = (
+                "Connectivity check failed"
+                if self.open_after == 1
+                else f"{self.open_after} consecutive connectivity checks failed"
+            )
+            cur = conn.execute(
+                "INSERT INTO incidents (started_at, started_ts, start_reason) VALUES (?, ?, ?)",
+                (started.isoformat(), int(started.timestamp()), reason),
+            )
+            bump_rollups(conn, started.timestamp(), incidents=1)
+            self.open_incident = (cur.lastrowid, started)
+            opened = True
+        elif status == "UP" and self.open_incident is not None and self.streak_count >= self.close_after:
+            incident_id, started = self.open_incident
+            ended = self.streak_started
+            conn.execute(
+                """
+                UPDATE incidents
+                SET ended_at=?, ended_ts=?, duration_seconds=?, end_reason=?
+                WHERE id=?
+                """,
+                (
+                    ended.isoformat(),
+                    int(ended.timestamp()),
+                    (ended - started).total_seconds(),
+                    "Connectivity restored",
+                    incident_id,
+                ),
+            )
+            self.open_incident = None
+            closed = True
+
+        self._synced = (path, check_id)
+        return opened, closed
@@ -0,0 +1,188 @@
+import hmac
+import json
+import logging
+import sqlite3
+import zlib
+
+from flask import Flask, Response, jsonify, request
+
+from netmon.cache import bump_generation
+from netmon.config import INGEST_MAX_BATCH_BYTES, INGEST_TOKEN, PHASE_COLUMNS
+from netmon.engine import write
+from netmon.metrics import CONTENT_TYPE, counter, render
+
+logger = logging.getLogger(__name__)
+
+INGESTED_ROWS = counter("netmon_ingest_rows_total", "Remote result rows received by outcome")
+
+
+class BatchError(ValueError):
+    pass
+
+
+# ------------------ استقبال دفعات الفروع ------------------
+# كل طلب دفعة واحدة من وكيل واحد؛ الإدراج بـ executemany داخل معاملة الكاتب المجمّعة،
+# و INSERT OR IGNORE على (spool_id, agent_seq) يجعل إعادة الإرسال بعد الانقطاع آمنة.
+def _decode_body(raw: bytes, encoding: str | None) -> dict:
+    if encoding == "gzip":
+        # حد لحجم الناتج بعد فك الضغط، لا لحجم الطلب المضغوط فقط
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        try:
+            raw = decompressor.decompress(raw, INGEST_MAX_BATCH_BYTES + 1)
+        except zlib.error as error:
+            raise BatchError(f"Bad gzip body: {error}") from error
+        if len(raw) > INGEST_MAX_BATCH_BYTES:
+            raise BatchError("Batch too large")
+    elif encoding:
+        raise BatchError(f"Unsupported Content-Encoding: {encoding}")
+    try:
+        batch = json.loads(raw)
+    except ValueError as error:
+        raise BatchError(f"Bad JSON: {error}") from error
+    if not isinstance(batch, dict) or not isinstance(batch.get("results"), list):
+        raise BatchError("Expected an object with a results list")
+    for key in ("site_id", "agent_id", "spool_id"):
+        if not isinstance(batch.get(key), str) or not batch[key]:
+            raise BatchError(f"Missing {key}")
+    return batch
+
+
+def ingest_batch(batch: dict) -> int | None:
+    site_id, agent_id, spool_id = batch["site_id"], batch["agent_id"], batch["spool_id"]
+    checks, speeds = [], []
+    for item in batch["results"]:
+        try:
+            seq, kind, data = int(item["seq"]), item["kind"], item["data"]
+            if kind == "check":
+                checks.append(
+                    (
+                        site_id,
+                        agent_id,
+                        spool_id,
+                        seq,
+                        data["status"],
+                        data["timestamp"],
+                        int(data["ts"]),
+                        json.dumps(data.get("targets") or []),
+                    )
+                )
+            elif kind == "speed":
+                speeds.append(
+                    (
+                        site_id,
+                        agent_id,
+                        spool_id,
+                        seq,
+                        data["mode"],
+                        data.get("download_mbps"),
+                        data.get("latency_ms"),
+                        int(bool(data.get("drop_detected"))),
+                        data["timestamp"],
+                        int(data["ts"]),
+                        *(data.get(column) for column in PHASE_COLUMNS),
+                    )
+                )
+            else:
+                raise BatchError(f"Unknown result kind: {kind}")
+        except (KeyError, TypeError, ValueError) as error:
+            raise BatchError(f"Bad result item: {error}") from error
+
+    def insert(conn: sqlite3.Connection) -> int:
+        inserted = 0
+        if checks:
+            inserted += conn.executemany(
+                """
+                INSERT OR IGNORE INTO remote_checks (
+                    site_id, agent_id, spool_id, agent_seq, status, timestamp, ts, targets
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                checks,
+            ).rowcount
+            last_check = max(checks, key=lambda row: row[6])
+            conn.execute(
+                """
+                INSERT INTO remote_sites (site_id, agent_id, last_seen_ts, last_status, last_check_ts)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(site_id, agent_id) DO UPDATE SET
+                    last_seen_ts = MAX(COALESCE(last_seen_ts, 0), excluded.last_seen_ts),
+                    last_status = CASE WHEN excluded.last_check_ts >= COALESCE(last_check_ts, 0)
+                                       THEN excluded.last_status ELSE last_status END,
+                    last_check_ts = MAX(COALESCE(last_check_ts, 0), excluded.last_check_ts)
+                """,
+                (site_id, agent_id, last_check[6], last_check[4], last_check[6]),
+            )
+        if speeds:
+            placeholders = ", ".join("?" for _ in range(10 + len(PHASE_COLUMNS)))
+            inserted += conn.executemany(
+                f"""
+                INSERT OR IGNORE INTO remote_speed_checks (
+                    site_id, agent_id, spool_id, agent_seq, mode, download_mbps, latency_ms,
+                    drop_detected, timestamp, ts, {", ".join(PHASE_COLUMNS)}
+                )
+                VALUES ({placeholders})
+                """,
+                speeds,
+            ).rowcount
+            last_speed = max(speeds, key=lambda row: row[9])
+            conn.execute(
+                """
+                INSERT INTO remote_sites (site_id, agent_id, last_seen_ts, last_download_mbps, last_speed_ts)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(site_id, agent_id) DO UPDATE SET
+                    last_seen_ts = MAX(COALESCE(last_seen_ts, 0), excluded.last_seen_ts),
+                    last_download_mbps = CASE WHEN excluded.last_speed_ts >= COALESCE(last_speed_ts, 0)
+                                              THEN excluded.last_download_mbps ELSE last_download_mbps END,
+                    last_speed_ts = MAX(COALESCE(last_speed_ts, 0), excluded.last_speed_ts)
+                """,
+                (site_id, agent_id, last_speed[9], last_speed[5], last_speed[9]),
+            )
+        return inserted
+
+    inserted = write(insert)
+    if inserted:
+        bump_generation()
+    if inserted is not None:
+        INGESTED_ROWS.inc(inserted, outcome="inserted")
+        INGESTED_ROWS.inc(len(checks) + len(speeds) - inserted, outcome="duplicate")
+    return inserted
+
+
+def _authorized() -> bool:
+    if not INGEST_TOKEN:
+        return True
+    return hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {INGEST_TOKEN}")
+
+
+def create_app() -> Flask:
+    from netmon.db import init_db
+
+    init_db()
+    app = Flask(__name__)
+    app.config["MAX_CONTENT_LENGTH"] = INGEST_MAX_BATCH_BYTES
+
+    @app.post("/ingest")
+    def ingest():
+        if not _authorized():
+            return jsonify(error="unauthorized"), 401
+        try:
+            batch = _decode_body(request.get_data(), request.headers.get("Content-Encoding"))
+            inserted = ingest_batch(batch)
+        except BatchError as error:
+            logger.warning("Rejected batch from %s: %s", request.remote_addr, error)
+            return jsonify(error=str(error)), 400
+        if inserted is None:
+            return jsonify(error="database unavailable"), 503
+        # الصفوف المكررة تُؤكَّد أيضًا، فيحذفها الوكيل من مخزنه
+        acked_seq = max((int(item["seq"]) for item in batch["results"]), default=0)
+        return jsonify(accepted=inserted, acked_seq=acked_seq)
+
+    @app.get("/metrics")
+    def metrics():
+        return Response(render(), content_type=CONTENT_TYPE)
+
+    @app.get("/healthz")
+    def healthz():
+        return jsonify(status="ok")
+
+    return app
@@ -0,0 +1,107 @@
+from netmon.alerts import enqueue_alert
+from netmon.anomaly import describe as describe_drop
+from netmon.breakers import BREAKERS
+from netmon.config import QUICK_TEST_INTERVAL_SECONDS, SPEED_DROP_THRESHOLD_MBPS, TARGETS
+from netmon.db import (
+    record_check,
+    save_latency_probe,
+    save_speed_check,
+    save_target_health,
+    seconds_since_last_speed_test,
+)
+from netmon.probes import check_connection, run_latency_burst, run_speed_test
+from netmon.singleflight import single_flight
+from netmon.utils import get_now
+
+
+# مسارات الفحص المشتركة بين لوحة Streamlit والوكيل الخلفي، فكلاهما يكتب بالطريقة نفسها
+def run_connectivity_job(targets: list[str] | None = None) -> dict:
+    result = check_connection(TARGETS if targets is None else targets)
+    status = result["status"]
+    down_started, down_recovered = record_check(status, result["targets"])
+    save_target_health(BREAKERS.snapshot())
+
+    message = None
+    if down_started:
+        message = f"🚨 Incident started at {get_now().strftime('%Y-%m-%d %H:%M:%S')} (internet DOWN)"
+    elif down_recovered:
+        message = f"✅ Incident recovered at {get_now().strftime('%Y-%m-%d %H:%M:%S')} (internet UP)"
+    if message:
+        enqueue_alert(message)
+
+    return {**result, "event_message": message}
+
+
+def is_speed_drop(result: dict) -> bool:
+    # العتبة الثابتة لوكلاء الفروع؛ المراقب المركزي يحكم بخط الأساس في save_speed_check
+    return result["download_mbps"] is not None and result["download_mbps"] < SPEED_DROP_THRESHOLD_MBPS
+
+
+# اختباران متزامنان يتقاسمان الخط فيفسد كل منهما قياس الآخر؛ الطلبات المتزامنة (من أي وضع)
+# تنضم إلى الاختبار الجاري وتعود بنتيجته، و joined يميّزها عن نتيجة شغّلها الطالب بنفسه
+SPEED_FLIGHT = "speed_test"
+
+
+def run_speed_job(mode: str) -> dict:
+    job, joined = single_flight(SPEED_FLIGHT, lambda: _speed_job(mode))
+    return {**job, "joined": joined}
+
+
+def _speed_job(mode: str) -> dict:
+    result = run_speed_test(mode)
+    drop = save_speed_check(result)["download_mbps"]
+    save_target_health(BREAKERS.snapshot())
+    if not drop["anomaly"]:
+        return {"result": result, "alert": None, "drop": drop}
+
+    alert = (
+        f"⚠️ Speed dropped to {result['download_mbps']:.2f} Mbps ({describe_drop(drop)}). "
+        "Running automatic quick verification now..."
+    )
+    enqueue_alert(alert, kind="speed_drop")
+    quick_result = run_speed_test("quick")
+    return {"result": quick_result, "alert": alert, "drop": save_speed_check(quick_result)["download_mbps"]}
+
+
+def run_auto_quick_job(min_interval_seconds: int = QUICK_TEST_INTERVAL_SECONDS) -> dict | None:
+    if _tested_recently(min_interval_seconds):
+        return None
+    job, joined = single_flight(SPEED_FLIGHT, lambda: _auto_quick_job(min_interval_seconds))
+    return None if job is None else {**job, "joined": joined}
+
+
+def _tested_recently(min_interval_seconds: int) -> bool:
+    seconds_since_last = seconds_since_last_speed_test()
+    return seconds_since_last is not None and seconds_since_last < min_interval_seconds
+
+
+def _auto_quick_job(min_interval_seconds: int) -> dict | None:
+    # يُعاد الفحص داخل العقد: اختبار انتهى بين الفحص الأول وأخذ العقد يكفي
+    if _tested_recently(min_interval_seconds):
+        return None
+
+    quick_result = run_speed_test("quick")
+    drop = save_speed_check(quick_result)["download_mbps"]
+    save_target_health(BREAKERS.snapshot())
+    alert = None
+    if drop["anomaly"]:
+        alert = (
+            f"🚨 Low speed detected automatically: {quick_result['download_mbps']:.2f} Mbps ({describe_drop(drop)})"
+        )
+        enqueue_alert(alert, kind="speed_drop")
+    return {"result": quick_result, "alert": alert, "drop": drop}
+
+
+def run_latency_job(targets: list[str] | None = None) -> list[dict]:
+    summaries = run_latency_burst(targets)
+    if not summaries:
+        return summaries
+    verdicts = save_latency_probe(summaries)
+    return [
+        {
+            **summary,
+            "baseline_p50_ms": verdicts.get(summary["target"], {}).get("expected"),
+            "anomaly": verdicts.get(summary["target"], {}).get("anomaly", False),
+        }
+        for summary in summaries
+    ]
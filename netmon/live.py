@@ -0,0 +1,58 @@
+from typing import TYPE_CHECKING
+
+from netmon.db import get_rows_since
+from netmon.utils import format_duration
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+# ------------------ مخازن اللوحات الحية ------------------
+# آخر limit صف من جدول، محفوظة في جلسة المتصفح. كل دورة تضيف الجديد فقط وتسقط الأقدم،
+# فلا يُعاد قراءة ما عُرض من قبل؛ الحوادث المفتوحة وحدها يُعاد طلبها حتى تُغلق.
+class LiveTable:
+    def __init__(self, table: str, limit: int):
+        self.table = table
+        self.limit = limit
+        self.columns: list[str] = []
+        self.rows: dict[int, tuple] = {}
+        self.last_id = 0
+
+    def _open_ids(self) -> tuple[int, ...]:
+        if self.table != "incidents" or not self.columns:
+            return ()
+        ended = self.columns.index("ended_at")
+        return tuple(row_id for row_id, row in self.rows.items() if row[ended] is None)
+
+    def poll(self) -> bool:
+        fetched = get_rows_since(self.table, self.last_id, self.limit, self._open_ids())
+        if fetched is None:
+            return False
+        columns, rows = fetched
+        self.columns = columns
+        changed = False
+        for row in rows:
+            if self.rows.get(row[0]) != row:
+                self.rows[row[0]] = row
+                changed = True
+        if changed:
+            for row_id in sorted(self.rows)[: -self.limit]:
+                del self.rows[row_id]
+            self.last_id = max(self.last_id, max(self.rows))
+        return changed
+
+    def latest(self) -> dict | None:
+        if not self.rows:
+            return None
+        return dict(zip(self.columns, self.rows[max(self.rows)]))
+
+    def frame(self) -> "pd.DataFrame":
+        import pandas as pd
+
+        df = pd.DataFrame(
+            [self.rows[row_id] for row_id in sorted(self.rows, reverse=True)], columns=self.columns or None
+        )
+        df = df.drop(columns="id", errors="ignore")
+        if self.table == "incidents" and not df.empty:
+            df.insert(2, "duration", df.pop("duration_seconds").apply(format_duration))
+        return df
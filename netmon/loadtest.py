@@ -0,0 +1,326 @@
+import logging
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import sqlite3
+import statistics
+import threading
+import time
+from collections.abc import Callable
+
+from netmon import config
+from netmon.utils import get_now
+
+# ------------------ اختبار الحمل ------------------
+# جلسات لوحة متزامنة في هذه العملية (كما يخدمها Streamlit بخيط لكل جلسة) تسجّل الدخول ثم تكرر
+# قراءات إعادة التشغيل الكاملة، وكتّاب في عمليات منفصلة (كالوكيل) يحفظون الفحوص بمعدلات ثابتة.
+# التقرير: الإنتاجية ومئينات الزمن لكل عملية، وأخطاء SQLite وأخطاء القفل، ووقت المعالج.
+RENDER_READS = [
+    "compute_sla",
+    "get_last_check_targets",
+    "get_target_health",
+    "get_baselines",
+    "get_rollup_series",
+    "get_latency_series",
+    "get_recent_latency_probes",
+    "get_remote_sites",
+]
+LIVE_PANELS = {"checks": 20, "speed_checks": 10, "incidents": 20}
+
+
+class _Recorder:
+    def __init__(self):
+        self.samples: dict[str, list[float]] = {}
+        self.exceptions: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def time(self, name: str, func: Callable[[], object]) -> object:
+        started = time.perf_counter()
+        try:
+            return func()
+        except Exception as error:
+            with self._lock:
+                key = f"{name}: {type(error).__name__}: {error}"
+                self.exceptions[key] = self.exceptions.get(key, 0) + 1
+            return None
+        finally:
+            self.add(name, (time.perf_counter() - started) * 1000)
+
+    def add(self, name: str, value: float) -> None:
+        with self._lock:
+            self.samples.setdefault(name, []).append(value)
+
+
+# المحرك يسجّل أخطاء SQLite ويعيد None بدل رفعها، فتُعدّ من سجلّه
+class _DbErrorCounter(logging.Handler):
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.errors = 0
+        self.lock_errors = 0
+
+    def emit(self, record: logging.LogRecord) -> None:
+        message = record.getMessage().lower()
+        self.errors += 1
+        if "locked" in message or "busy" in message:
+            self.lock_errors += 1
+
+
+def _summary(samples: list[float], seconds: float) -> dict:
+    ordered = sorted(samples)
+    if not ordered:
+        return {"count": 0}
+
+    def pick(fraction: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * fraction))], 3)
+
+    return {
+        "count": len(ordered),
+        "per_second": round(len(ordered) / seconds, 2),
+        "p50_ms": pick(0.50),
+        "p95_ms": pick(0.95),
+        "p99_ms": pick(0.99),
+        "max_ms": round(ordered[-1], 3),
+        "mean_ms": round(statistics.fmean(ordered), 3),
+    }
+
+
+def _cpu_seconds() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+# ------------------ الجلسات ------------------
+def _session(recorder: _Recorder, stop: threading.Event, think_seconds: float, hours: int) -> None:
+    from netmon import db
+    from netmon.live import LiveTable
+
+    username, password, _ = config.DEFAULT_USERS[0]
+    recorder.time("login", lambda: db.login(username, password))
+    panels = {table: LiveTable(table, limit) for table, limit in LIVE_PANELS.items()}
+    reads: dict[str, Callable[[], object]] = {
+        "compute_sla": lambda: db.compute_sla(hours),
+        "get_rollup_series": lambda: db.get_rollup_series(hours),
+        "get_latency_series": lambda: db.get_latency_series(hours),
+    }
+    for name in RENDER_READS:
+        reads.setdefault(name, getattr(db, name))
+    for table, panel in panels.items():
+        reads[f"live_poll_{table}"] = panel.poll
+
+    # بداية عشوائية ضمن فترة التفكير حتى لا تتزامن كل الجلسات على الثانية نفسها
+    stop.wait(random.uniform(0, think_seconds))
+    while not stop.is_set():
+        started = time.perf_counter()
+        for name, read in reads.items():
+            recorder.time(name, read)
+        recorder.add("render", (time.perf_counter() - started) * 1000)
+        stop.wait(think_seconds)
+
+
+# ------------------ الكتّاب ------------------
+def _speed_result() -> dict:
+    return {"mode": "quick", "download_mbps": max(0.0, random.gauss(80, 10)), "latency_ms": random.gauss(30, 4)}
+
+
+def _writer_ops(check_rate: float, speed_rate: float, down_fraction: float) -> dict[str, tuple[float, Callable]]:
+    from netmon import db
+
+    def status() -> str:
+        return "DOWN" if random.random() < down_fraction else "UP"
+
+    def legacy_check() -> None:
+        # مسار الوكلاء القدامى: الانتقال ثم الحفظ في كتابتين
+        current = status()
+        db.track_incident_transition(current)
+        db.save_check(current)
+
+    # record_check يحفظ الفحص ويفتح/يغلق الحادثة في مهمة واحدة؛ save_check فحص بلا متابعة حوادث (الفروع والاستيراد)
+    return {
+        "record_check": (check_rate, lambda: db.record_check(status())),
+        "track_incident_transition": (check_rate / 4, legacy_check),
+        "save_check": (check_rate / 2, lambda: db.save_check("UP")),
+        "save_speed_check": (speed_rate, lambda: db.save_speed_check(_speed_result())),
+    }
+
+
+def _paced(recorder: _Recorder, stop: threading.Event, name: str, rate: float, func: Callable) -> None:
+    # معدل ثابت بجدول زمني لا بفاصل بعد كل عملية: الكتابة البطيئة تؤخر ما بعدها ولا تخفض المعدل
+    # المستهدف خفية؛ الفترات التي فاتت بالكامل تُعدّ missed
+    interval = 1 / rate
+    next_at = time.monotonic() + random.uniform(0, interval)
+    missed = 0
+    while not stop.is_set():
+        delay = next_at - time.monotonic()
+        if delay > 0 and stop.wait(delay):
+            break
+        recorder.time(name, func)
+        next_at += interval
+        behind = int((time.monotonic() - next_at) / interval)
+        if behind > 0:
+            missed += behind
+            next_at += behind * interval
+    recorder.add(f"{name}_missed", missed)
+
+
+def _writer_process(path: str, check_rate: float, speed_rate: float, down_fraction: float, seconds: float, results) -> None:
+    config.DB_PATH = path
+    from netmon.engine import close_engine
+
+    counter = _DbErrorCounter()
+    logging.getLogger("netmon").addHandler(counter)
+    recorder = _Recorder()
+    stop = threading.Event()
+    cpu_started = _cpu_seconds()
+    threads = [
+        threading.Thread(target=_paced, args=(recorder, stop, name, rate, func), daemon=True)
+        for name, (rate, func) in _writer_ops(check_rate, speed_rate, down_fraction).items()
+        if rate > 0
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    close_engine()
+    results.put(
+        {
+            "samples": recorder.samples,
+            "exceptions": recorder.exceptions,
+            "db_errors": counter.errors,
+            "lock_errors": counter.lock_errors,
+            "cpu_seconds": _cpu_seconds() - cpu_started,
+        }
+    )
+
+
+# ------------------ التشغيل ------------------
+def prepare_database(workdir: str, rows: int) -> str:
+    # نسخة من القاعدة الاصطناعية للقياس، فلا تغيّر كتابات الاختبار قاعدة bench المعاد استخدامها
+    from netmon.bench import _synthetic_db
+
+    source = _synthetic_db(workdir, rows)
+    path = os.path.join(workdir, f"loadtest-{rows}.db")
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    with sqlite3.connect(source) as src, sqlite3.connect(path) as dst:
+        src.backup(dst)
+    return path
+
+
+def run_load_test(
+    path: str,
+    sessions: int,
+    seconds: float,
+    think_seconds: float,
+    check_rate: float,
+    speed_rate: float,
+    writer_processes: int,
+    down_fraction: float = 0.05,
+    hours: int = 24,
+) -> dict:
+    from netmon.db import init_db
+    from netmon.engine import close_engine
+
+    saved_path = config.DB_PATH
+    config.DB_PATH = path
+    counter = _DbErrorCounter()
+    netmon_logger = logging.getLogger("netmon")
+    netmon_logger.addHandler(counter)
+    try:
+        init_db(background_backfill=False)
+
+        context = multiprocessing.get_context("spawn")
+        results = context.Queue()
+        writers = [
+            context.Process(
+                target=_writer_process,
+                args=(path, check_rate / writer_processes, speed_rate / writer_processes, down_fraction, seconds, results),
+                daemon=True,
+            )
+            for _ in range(writer_processes if check_rate > 0 or speed_rate > 0 else 0)
+        ]
+        for process in writers:
+            process.start()
+
+        recorder = _Recorder()
+        stop = threading.Event()
+        cpu_started = _cpu_seconds()
+        threads = [
+            threading.Thread(target=_session, args=(recorder, stop, think_seconds, hours), daemon=True)
+            for _ in range(sessions)
+        ]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        time.sleep(seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+        session_cpu = _cpu_seconds() - cpu_started
+
+        writer_reports = [results.get(timeout=seconds + 60) for _ in writers]
+        for process in writers:
+            process.join()
+    finally:
+        netmon_logger.removeHandler(counter)
+        close_engine()
+        config.DB_PATH = saved_path
+
+    writer_samples: dict[str, list[float]] = {}
+    for report in writer_reports:
+        for name, values in report["samples"].items():
+            writer_samples.setdefault(name, []).extend(values)
+    writer_ops = {}
+    for name, (rate, _) in _writer_ops(check_rate, speed_rate, down_fraction).items():
+        if rate > 0:
+            writer_ops[name] = {
+                "target_per_second": round(rate, 2),
+                "missed": int(sum(writer_samples.get(f"{name}_missed", []))),
+                **_summary(writer_samples.get(name, []), elapsed),
+            }
+
+    exceptions = dict(recorder.exceptions)
+    for report in writer_reports:
+        for key, count in report["exceptions"].items():
+            exceptions[key] = exceptions.get(key, 0) + count
+
+    return {
+        "meta": {
+            "started_at": get_now().isoformat(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "database": path,
+            "database_bytes": os.path.getsize(path),
+        },
+        "config": {
+            "sessions": sessions,
+            "seconds": seconds,
+            "think_seconds": think_seconds,
+            "check_rate": check_rate,
+            "speed_rate": speed_rate,
+            "writer_processes": len(writers),
+            "down_fraction": down_fraction,
+        },
+        "sessions": {
+            name: _summary(recorder.samples.get(name, []), elapsed) for name in ["login", "render", *recorder.samples]
+        },
+        "writers": writer_ops,
+        "errors": {
+            "db_errors": counter.errors + sum(report["db_errors"] for report in writer_reports),
+            "lock_errors": counter.lock_errors + sum(report["lock_errors"] for report in writer_reports),
+            "exceptions": exceptions,
+        },
+        "cpu": {
+            "session_process_seconds": round(session_cpu, 3),
+            "session_process_cores": round(session_cpu / elapsed, 3),
+            "writer_process_seconds": round(sum(report["cpu_seconds"] for report in writer_reports), 3),
+            "cpu_ms_per_render": round(session_cpu * 1000 / max(1, len(recorder.samples.get("render", []))), 3),
+        },
+    }
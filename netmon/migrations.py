@@ -0,0 +1,506 @@
+import logging
+import sqlite3
+import threading
+import time
+
+from netmon.config import LATENCY_STAT_COLUMNS, MIGRATION_CHUNK_PAUSE_SECONDS, MIGRATION_CHUNK_ROWS, PHASE_COLUMNS
+from netmon.engine import read_connection, write
+from netmon.rollups import DOWNSAMPLED_TABLES, create_rollup_tables, fold_rows_into_rollups
+from netmon.utils import get_now
+
+logger = logging.getLogger(__name__)
+
+
+# ------------------ ترحيل المخطط ------------------
+# كل ترحيل يُطبَّق مرة واحدة في معاملة واحدة ويُسجَّل في schema_version.
+# تحويل البيانات القديمة (تعبئة أعمدة epoch) لا يتم داخل الترحيل، بل على دفعات
+# صغيرة بعده حتى لا يُقفل قاعدة كبيرة لدقائق أمام التطبيق الحي.
+def _ensure_columns(cur: sqlite3.Cursor, table: str, columns: dict[str, str]) -> None:
+    existing = {row[1] for row in cur.execute(f"PRAGMA table_info({table})").fetchall()}
+    for column, column_type in columns.items():
+        if column not in existing:
+            cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+
+
+def _migration_1_baseline(conn: sqlite3.Connection) -> None:
+    cur = conn.cursor()
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE,
+            password TEXT,
+            role TEXT DEFAULT 'client'
+        )
+        """
+    )
+
+    # قواعد قديمة أُنشئ فيها users قبل إضافة عمود role
+    _ensure_columns(cur, "users", {"role": "TEXT DEFAULT 'client'"})
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS checks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            status TEXT,
+            timestamp TEXT
+        )
+        """
+    )
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS check_targets (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            check_id INTEGER,
+            target TEXT,
+            status_code INTEGER,
+            latency_ms REAL,
+            error TEXT,
+            timestamp TEXT
+        )
+        """
+    )
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS speed_checks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            mode TEXT,
+            download_mbps REAL,
+            latency_ms REAL,
+            drop_detected INTEGER,
+            threshold_mbps REAL,
+            timestamp TEXT
+        )
+        """
+    )
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS speed_streams (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            speed_check_id INTEGER,
+            server TEXT,
+            stream INTEGER,
+            bytes INTEGER,
+            seconds REAL,
+            mbps REAL,
+            error TEXT
+        )
+        """
+    )
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS incidents (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            started_at TEXT,
+            ended_at TEXT,
+            duration_seconds REAL,
+            start_reason TEXT,
+            end_reason TEXT
+        )
+        """
+    )
+
+    phase_columns = {column: "REAL" for column in PHASE_COLUMNS}
+    _ensure_columns(cur, "check_targets", phase_columns)
+    _ensure_columns(cur, "speed_checks", phase_columns)
+
+    create_rollup_tables(conn)
+
+
+# (الجدول، عمود epoch، عمود النص المصدر)
+EPOCH_COLUMNS = [
+    ("checks", "ts", "timestamp"),
+    ("check_targets", "ts", "timestamp"),
+    ("speed_checks", "ts", "timestamp"),
+    ("incidents", "started_ts", "started_at"),
+    ("incidents", "ended_ts", "ended_at"),
+]
+
+# الأعمدة التي تُضاف صفوفها إلى جداول التجميع أثناء التعبئة إن كانت فارغة
+_ROLLUP_BACKFILL_SOURCES = {("checks", "ts"), ("speed_checks", "ts"), ("incidents", "started_ts")}
+
+
+def _migration_2_epoch_columns(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_backfills (
+            table_name TEXT,
+            column_name TEXT,
+            source_column TEXT,
+            cursor_id INTEGER,
+            last_id INTEGER,
+            fold_rollups INTEGER,
+            PRIMARY KEY (table_name, column_name)
+        )
+        """
+    )
+    rollups_empty = conn.execute("SELECT 1 FROM rollup_hour LIMIT 1").fetchone() is None
+    for table, column, source in EPOCH_COLUMNS:
+        _ensure_columns(conn.cursor(), table, {column: "INTEGER"})
+        last_id = conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}").fetchone()[0]
+        if last_id:
+            conn.execute(
+                """
+                INSERT OR REPLACE INTO schema_backfills
+                (table_name, column_name, source_column, cursor_id, last_id, fold_rollups)
+                VALUES (?, ?, ?, 0, ?, ?)
+                """,
+                (table, column, source, last_id, int(rollups_empty and (table, column) in _ROLLUP_BACKFILL_SOURCES)),
+            )
+
+
+def _migration_3_indexes(conn: sqlite3.Connection) -> None:
+    # فهارس جزئية على أعمدة epoch: تُبنى فورًا لأن الأعمدة ما زالت فارغة،
+    # ثم تكبر تدريجيًا مع كل دفعة تعبئة. الأعمدة الإضافية تجعلها فهارس تغطية.
+    statements = [
+        "CREATE INDEX IF NOT EXISTS idx_checks_ts ON checks(ts, status) WHERE ts IS NOT NULL",
+        """
+        CREATE INDEX IF NOT EXISTS idx_speed_checks_ts
+        ON speed_checks(ts, download_mbps, latency_ms) WHERE ts IS NOT NULL
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_incidents_started_ts
+        ON incidents(started_ts) WHERE started_ts IS NOT NULL
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_incidents_open ON incidents(id) WHERE ended_at IS NULL",
+        "CREATE INDEX IF NOT EXISTS idx_check_targets_check_id ON check_targets(check_id)",
+        "CREATE INDEX IF NOT EXISTS idx_speed_streams_check_id ON speed_streams(speed_check_id)",
+    ]
+    for statement in statements:
+        conn.execute(statement)
+
+
+def _migration_4_downsampled_rollups(conn: sqlite3.Connection) -> None:
+    create_rollup_tables(conn, list(DOWNSAMPLED_TABLES))
+
+
+def _migration_5_alert_outbox(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS alert_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            channel TEXT NOT NULL,
+            kind TEXT,
+            message TEXT NOT NULL,
+            coalesced INTEGER NOT NULL DEFAULT 1,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            created_ts INTEGER NOT NULL,
+            next_attempt_ts INTEGER NOT NULL,
+            sent_ts INTEGER,
+            last_error TEXT
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_alert_outbox_due
+        ON alert_outbox(channel, next_attempt_ts) WHERE status IN ('pending', 'sending')
+        """
+    )
+    conn.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_alert_outbox_kind
+        ON alert_outbox(channel, kind, created_ts) WHERE status = 'pending'
+        """
+    )
+
+
+def _migration_6_remote_sites(conn: sqlite3.Connection) -> None:
+    # نتائج وكلاء الفروع في جداول مستقلة حتى لا تختلط بـ SLA الجهاز المحلي ومجاميعه.
+    # (spool_id, agent_seq) فريد: إعادة إرسال الدفعة نفسها بعد انقطاع لا تكرر الصفوف.
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS remote_checks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            site_id TEXT NOT NULL,
+            agent_id TEXT NOT NULL,
+            spool_id TEXT NOT NULL,
+            agent_seq INTEGER NOT NULL,
+            status TEXT,
+            timestamp TEXT,
+            ts INTEGER,
+            targets TEXT,
+            UNIQUE (spool_id, agent_seq)
+        )
+        """
+    )
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS remote_speed_checks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            site_id TEXT NOT NULL,
+            agent_id TEXT NOT NULL,
+            spool_id TEXT NOT NULL,
+            agent_seq INTEGER NOT NULL,
+            mode TEXT,
+            download_mbps REAL,
+            latency_ms REAL,
+            drop_detected INTEGER,
+            timestamp TEXT,
+            ts INTEGER,
+            {", ".join(f"{column} REAL" for column in PHASE_COLUMNS)},
+            UNIQUE (spool_id, agent_seq)
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS remote_sites (
+            site_id TEXT NOT NULL,
+            agent_id TEXT NOT NULL,
+            last_seen_ts INTEGER,
+            last_status TEXT,
+            last_check_ts INTEGER,
+            last_download_mbps REAL,
+            last_speed_ts INTEGER,
+            PRIMARY KEY (site_id, agent_id)
+        )
+        """
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_remote_checks_site_ts ON remote_checks(site_id, ts)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_remote_checks_ts ON remote_checks(ts)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_remote_speed_checks_site_ts ON remote_speed_checks(site_id, ts)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_remote_speed_checks_ts ON remote_speed_checks(ts)")
+
+
+def _migration_7_speed_convergence(conn: sqlite3.Connection) -> None:
+    _ensure_columns(
+        conn.cursor(),
+        "speed_checks",
+        {"sample_count": "INTEGER", "ci_mbps": "REAL", "converged": "INTEGER", "stop_reason": "TEXT"},
+    )
+
+
+def _migration_8_latency_probes(conn: sqlite3.Connection) -> None:
+    # صف ملخّص واحد لكل هدف في كل دفعة، لا صف لكل طلب
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS latency_probes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            target TEXT,
+            sent INTEGER,
+            received INTEGER,
+            loss_pct REAL,
+            {", ".join(f"{column} REAL" for column in LATENCY_STAT_COLUMNS)},
+            timestamp TEXT,
+            ts INTEGER
+        )
+        """
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_latency_probes_ts ON latency_probes(ts)")
+
+
+def _migration_9_flight_leases(conn: sqlite3.Connection) -> None:
+    # مالك واحد لكل اسم حتى expires_ts، وآخر نتيجة منشورة لكل اسم ليقرأها المنضمّون
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS flight_leases (
+            name TEXT PRIMARY KEY,
+            owner TEXT NOT NULL,
+            started_ts REAL NOT NULL,
+            expires_ts REAL NOT NULL
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS flight_results (
+            name TEXT PRIMARY KEY,
+            owner TEXT NOT NULL,
+            result TEXT,
+            finished_ts REAL NOT NULL
+        )
+        """
+    )
+
+
+def _migration_10_target_health(conn: sqlite3.Connection) -> None:
+    # آخر حالة لقاطع كل هدف، تُستعاد عند الإقلاع وتُعرض في اللوحة
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS target_health (
+            kind TEXT NOT NULL,
+            target TEXT NOT NULL,
+            state TEXT NOT NULL,
+            failures INTEGER NOT NULL DEFAULT 0,
+            reopen_count INTEGER NOT NULL DEFAULT 0,
+            open_until_ts REAL,
+            p50_ms REAL,
+            p95_ms REAL,
+            timeout_s REAL,
+            last_error TEXT,
+            updated_ts INTEGER,
+            PRIMARY KEY (kind, target)
+        )
+        """
+    )
+
+
+def _migration_11_baselines(conn: sqlite3.Connection) -> None:
+    # خط أساس لكل مقياس وساعة من اليوم (hour = -1 لكل الساعات)؛ window مصفوفة JSON لآخر القيم
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS baselines (
+            metric TEXT NOT NULL,
+            hour INTEGER NOT NULL,
+            samples INTEGER NOT NULL,
+            ewma REAL,
+            ewvar REAL,
+            window TEXT NOT NULL,
+            updated_ts INTEGER,
+            PRIMARY KEY (metric, hour)
+        )
+        """
+    )
+
+
+MIGRATIONS = [
+    (1, "baseline tables", _migration_1_baseline),
+    (2, "integer epoch columns", _migration_2_epoch_columns),
+    (3, "covering indexes", _migration_3_indexes),
+    (4, "5-minute rollup tier", _migration_4_downsampled_rollups),
+    (5, "alert outbox", _migration_5_alert_outbox),
+    (6, "remote probe sites", _migration_6_remote_sites),
+    (7, "speed test convergence stats", _migration_7_speed_convergence),
+    (8, "latency burst summaries", _migration_8_latency_probes),
+    (9, "single-flight leases", _migration_9_flight_leases),
+    (10, "probe target health", _migration_10_target_health),
+    (11, "per-hour anomaly baselines", _migration_11_baselines),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def _current_version(conn: sqlite3.Connection) -> int:
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TEXT
+        )
+        """
+    )
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+
+def schema_version() -> int:
+    # قراءة فقط، دون المرور بخيط الكتابة؛ جدول غائب يعني قاعدة جديدة أو سابقة للترحيلات
+    with read_connection() as conn:
+        if conn is None:
+            return 0
+        try:
+            return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+        except sqlite3.OperationalError:
+            return 0
+
+
+def migrate() -> int:
+    version = write(_current_version)
+    if version is None:
+        raise RuntimeError("Could not read the schema version")
+
+    for number, description, migration in MIGRATIONS:
+        if number <= version:
+            continue
+
+        def apply(conn: sqlite3.Connection, number=number, description=description, migration=migration) -> bool:
+            # عملية أخرى ربما طبّقته بين القراءة والكتابة
+            if _current_version(conn) >= number:
+                return True
+            migration(conn)
+            conn.execute(
+                "INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+                (number, description, get_now().isoformat()),
+            )
+            return True
+
+        if not write(apply):
+            raise RuntimeError(f"Schema migration {number} ({description}) failed")
+        logger.info("Applied schema migration %d: %s", number, description)
+    return SCHEMA_VERSION
+
+
+def _backfill_chunk(conn: sqlite3.Connection, chunk_rows: int) -> int | None:
+    # يُعاد قراءة المؤشر داخل المعاملة، فلا تعالج عمليتان الدفعة نفسها مرتين
+    row = conn.execute(
+        """
+        SELECT table_name, column_name, source_column, cursor_id, last_id, fold_rollups
+        FROM schema_backfills ORDER BY table_name, column_name LIMIT 1
+        """
+    ).fetchone()
+    if row is None:
+        return None
+
+    table, column, source, cursor_id, last_id, fold_rollups = row
+    upto = min(cursor_id + chunk_rows, last_id)
+    updated = conn.execute(
+        f"""
+        UPDATE {table} SET {column} = CAST(strftime('%s', {source}) AS INTEGER)
+        WHERE id > ? AND id <= ? AND {column} IS NULL
+        """,
+        (cursor_id, upto),
+    ).rowcount
+    if fold_rollups:
+        fold_rows_into_rollups(conn, table, cursor_id, upto)
+
+    if upto >= last_id:
+        conn.execute("DELETE FROM schema_backfills WHERE table_name=? AND column_name=?", (table, column))
+    else:
+        conn.execute(
+            "UPDATE schema_backfills SET cursor_id=? WHERE table_name=? AND column_name=?",
+            (upto, table, column),
+        )
+    return updated
+
+
+def pending_backfills() -> list[dict]:
+    with read_connection() as conn:
+        if conn is None:
+            return []
+        try:
+            rows = conn.execute(
+                "SELECT table_name, column_name, cursor_id, last_id FROM schema_backfills ORDER BY 1, 2"
+            ).fetchall()
+        except sqlite3.OperationalError:
+            return []
+    return [
+        {"table": table, "column": column, "cursor_id": cursor_id, "last_id": last_id}
+        for table, column, cursor_id, last_id in rows
+    ]
+
+
+def run_backfills(
+    chunk_rows: int = MIGRATION_CHUNK_ROWS,
+    pause_seconds: float = MIGRATION_CHUNK_PAUSE_SECONDS,
+    stop_event: threading.Event | None = None,
+) -> int:
+    total = 0
+    while stop_event is None or not stop_event.is_set():
+        updated = write(lambda conn: _backfill_chunk(conn, chunk_rows))
+        if updated is None:
+            break
+        total += updated
+        # مهلة قصيرة بين الدفعات تترك الكاتب متاحًا لفحوص التطبيق الحي
+        time.sleep(pause_seconds)
+    return total
+
+
+_backfill_thread: threading.Thread | None = None
+_backfill_lock = threading.Lock()
+
+
+def start_background_backfill() -> None:
+    global _backfill_thread
+    with _backfill_lock:
+        if _backfill_thread is not None and _backfill_thread.is_alive():
+            return
+        if not pending_backfills():
+            return
+
+        def run() -> None:
+            started = time.monotonic()
+            rows = run_backfills()
+            logger.info("Backfilled %d rows in %.1fs", rows, time.monotonic() - started)
+
+        _backfill_thread = threading.Thread(target=run, name="schema-backfill", daemon=True)
+        _backfill_thread.start()
@@ -0,0 +1,414 @@
+import statistics
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+
+import numpy as np
+import requests
+
+from netmon.config import (
+    CONNECTIVITY_QUORUM,
+    CONNECTIVITY_TIMEOUT_SECONDS,
+    LATENCY_BURST_COUNT,
+    LATENCY_BURST_INTERVAL_MS,
+    LATENCY_BURST_TARGETS,
+    LATENCY_BURST_TIMEOUT_SECONDS,
+    LATENCY_PROBE_URL,
+    PHASE_COLUMNS,
+    SPEED_TEST_PROFILES,
+    SPEED_CONVERGENCE_TOLERANCE,
+    SPEED_CONVERGENCE_WINDOW,
+    SPEED_RAMP_MIN_SECONDS,
+    SPEED_SAMPLE_INTERVAL_SECONDS,
+    SPEED_TEST_RANGE_CHUNK_BYTES,
+    SPEED_TEST_SERVER_COUNT,
+    SPEED_TEST_TIMEOUT_SECONDS,
+)
+from netmon.breakers import BREAKERS
+from netmon.httpclient import get_http_session, timed_get
+from netmon.metrics import histogram
+from netmon.servers import SERVER_POOL
+
+PROBE_SECONDS = histogram("netmon_probe_seconds", "Duration of connectivity checks and speed tests")
+
+
+def _probe_target(url: str, timeout: float) -> dict:
+    return {"target": url, **timed_get(url, timeout=timeout)}
+
+
+def _skipped_target(url: str, error: str) -> dict:
+    return {
+        "target": url,
+        "status_code": None,
+        "latency_ms": None,
+        "error": error,
+        **{column: None for column in PHASE_COLUMNS},
+    }
+
+
+def _record_probe(url: str, future: Future) -> None:
+    # يُستدعى عند انتهاء الفحص ولو بعد صدور الحكم، فلا تضيع نتيجة هدف بطيء على قاطعه
+    breaker = BREAKERS.get("probe", url)
+    if future.cancelled():
+        breaker.cancel_trial()
+        return
+    result = future.result()
+    if result["status_code"] == 200:
+        breaker.record_success(result["latency_ms"])
+    else:
+        breaker.record_failure(result["error"] or f"HTTP {result['status_code']}")
+
+
+@PROBE_SECONDS.time(probe="check_connection")
+def check_connection(
+    targets: list[str], quorum: int = CONNECTIVITY_QUORUM, timeout: float = CONNECTIVITY_TIMEOUT_SECONDS
+) -> dict:
+    # كل الأهداف تُفحص بالتوازي، والحكم يصدر فور بلوغ النصاب أو استحالته،
+    # فحكم DOWN يكلّف مهلة واحدة بدل مهلة لكل هدف. الأهداف ذات القاطع المفتوح تُتخطى،
+    # ولكل هدف مهلة بحسب زمنه المعتاد.
+    quorum = max(1, min(quorum, len(targets)))
+    results: dict[str, dict] = {}
+    up_count = 0
+
+    probed = BREAKERS.select("probe", targets, quorum)
+    for url in targets:
+        if url not in probed:
+            results[url] = _skipped_target(url, "circuit open")
+    executor = ThreadPoolExecutor(max_workers=max(1, len(probed)))
+    pending = set()
+    for url in probed:
+        future = executor.submit(_probe_target, url, BREAKERS.get("probe", url).timeout(timeout))
+        future.add_done_callback(lambda future, url=url: _record_probe(url, future))
+        pending.add(future)
+    try:
+        while pending and quorum - up_count <= len(pending):
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                results[result["target"]] = result
+                if result["status_code"] == 200:
+                    up_count += 1
+            if up_count >= quorum:
+                break
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    target_results = [results.get(url) or _skipped_target(url, "not awaited") for url in targets]
+    return {
+        "status": "UP" if targets and up_count >= quorum else "DOWN",
+        "targets": target_results,
+    }
+
+
+def _measure_latency(url: str, timeout: int = 5) -> dict:
+    # زمن الاستجابة هو زمن أول بايت؛ مراحل DNS/TCP/TLS تُخزّن منفصلة
+    timing = timed_get(url, timeout=timeout)
+    timing["latency_ms"] = timing["ttfb_ms"] if timing["error"] is None else None
+    return timing
+
+
+def _latency_burst(url: str, count: int, interval_ms: float, timeout: float) -> list[float]:
+    # طلب تمهيدي يفتح الاتصال (DNS/TCP/TLS) ثم count طلبًا متباعدًا على الاتصال نفسه.
+    # الفشل يُسجّل NaN فيُحتسب فقدًا، وللدفعة كلها مهلة حتى لا يطيلها هدف لا يرد
+    deadline = time.perf_counter() + count * interval_ms / 1000 + 2 * timeout
+    timed_get(url, timeout=timeout, max_redirects=0)
+    samples = []
+    for index in range(count):
+        if index:
+            time.sleep(interval_ms / 1000)
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            samples.extend([np.nan] * (count - index))
+            break
+        timing = timed_get(url, timeout=min(timeout, remaining), max_redirects=0)
+        samples.append(timing["ttfb_ms"] if timing["error"] is None and timing["status_code"] else np.nan)
+    return samples
+
+
+def summarize_latency(targets: list[str], samples: np.ndarray) -> list[dict]:
+    # مصفوفة (هدف × عينة) تُلخَّص دفعة واحدة: المئينات والاهتزاز (متوسط الفرق المطلق
+    # بين عينتين متتاليتين، كما في RFC 3550) ونسبة الفقد لكل الأهداف معًا
+    received = np.sum(~np.isnan(samples), axis=1)
+    has_data = received > 0
+    safe = np.where(has_data[:, None], samples, 0.0)
+    p50, p95, p99 = np.nanpercentile(safe, [50, 95, 99], axis=1)
+    steps = np.abs(np.diff(safe, axis=1))
+    step_counts = np.sum(~np.isnan(steps), axis=1)
+    jitter = np.where(step_counts > 0, np.nansum(steps, axis=1) / np.maximum(step_counts, 1), np.nan)
+    stats = {
+        "min_ms": np.nanmin(safe, axis=1),
+        "p50_ms": p50,
+        "p95_ms": p95,
+        "p99_ms": p99,
+        "max_ms": np.nanmax(safe, axis=1),
+        "mean_ms": np.nanmean(safe, axis=1),
+        "jitter_ms": jitter,
+    }
+    sent = samples.shape[1]
+    return [
+        {
+            "target": target,
+            "sent": sent,
+            "received": int(received[index]),
+            "loss_pct": round(float(100 * (1 - received[index] / sent)), 2) if sent else None,
+            **{
+                key: float(values[index]) if has_data[index] and not np.isnan(values[index]) else None
+                for key, values in stats.items()
+            },
+        }
+        for index, target in enumerate(targets)
+    ]
+
+
+@PROBE_SECONDS.time(probe="run_latency_burst")
+def run_latency_burst(
+    targets: list[str] | None = None,
+    count: int = LATENCY_BURST_COUNT,
+    interval_ms: float = LATENCY_BURST_INTERVAL_MS,
+    timeout: float = LATENCY_BURST_TIMEOUT_SECONDS,
+) -> list[dict]:
+    targets = LATENCY_BURST_TARGETS if targets is None else targets
+    if not targets:
+        return []
+    with ThreadPoolExecutor(max_workers=len(targets)) as executor:
+        rows = list(executor.map(lambda url: _latency_burst(url, count, interval_ms, timeout), targets))
+    return summarize_latency(targets, np.array(rows, dtype=float).reshape(len(targets), count))
+
+
+# عدّاد مشترك بين كل اتصالات اختبار السرعة الواحد: تُحسب الإنتاجية من أول بايت
+# يصل لأي اتصال حتى آخر بايت، فلا يُحتسب زمن إنشاء الاتصال على الخط.
+class _TransferWindow:
+    def __init__(self, deadline: float, max_bytes: int):
+        self.deadline = deadline
+        self.max_bytes = max_bytes
+        self.first_byte_at: float | None = None
+        self.last_byte_at: float | None = None
+        self.total_bytes = 0
+        self.stopped = False
+        self._lock = threading.Lock()
+
+    def add(self, nbytes: int) -> None:
+        now = time.perf_counter()
+        with self._lock:
+            if self.first_byte_at is None:
+                self.first_byte_at = now
+            self.last_byte_at = now
+            self.total_bytes += nbytes
+
+    def done(self) -> bool:
+        if self.stopped or time.perf_counter() >= self.deadline:
+            return True
+        return bool(self.max_bytes) and self.total_bytes >= self.max_bytes
+
+    def mbps(self) -> float | None:
+        if self.first_byte_at is None or self.last_byte_at is None:
+            return None
+        elapsed = self.last_byte_at - self.first_byte_at
+        if elapsed <= 0:
+            return None
+        return (self.total_bytes * 8) / (elapsed * 1_000_000)
+
+
+# قيم t للطرفين عند 95% حسب درجات الحرية؛ نافذة التقارب صغيرة فلا يصح التقريب بـ 1.96
+_T_95 = {1: 12.71, 2: 4.30, 3: 3.18, 4: 2.78, 5: 2.57, 6: 2.45, 7: 2.36, 8: 2.31, 9: 2.26, 10: 2.23, 15: 2.13, 20: 2.09}
+
+
+def _t_95(degrees: int) -> float:
+    for limit in sorted(_T_95):
+        if degrees <= limit:
+            return _T_95[limit]
+    return 1.96
+
+
+# يقيس الإنتاجية على فترات قصيرة. العينات الأولى (بطء بداية TCP) تُستبعد حتى يمضي
+# SPEED_RAMP_MIN_SECONDS وتتوقف القراءة عن الصعود، ثم يُحكم بالتقارب على آخر
+# SPEED_CONVERGENCE_WINDOW عينة: نصف عرض فترة الثقة 95% نسبةً إلى المتوسط.
+class _ThroughputSampler:
+    RAMP_GROWTH = 0.10
+
+    def __init__(self, window: _TransferWindow, budget_seconds: float):
+        self.window = window
+        self.ramp_limit = max(SPEED_RAMP_MIN_SECONDS, budget_seconds / 2)
+        self.ramp_samples = 0
+        self.samples: list[float] = []
+        self._last_at: float | None = None
+        self._last_bytes = 0
+        self._previous: float | None = None
+
+    def sample(self) -> None:
+        first_byte_at = self.window.first_byte_at
+        if first_byte_at is None:
+            return
+        now = time.perf_counter()
+        total = self.window.total_bytes
+        if self._last_at is None:
+            self._last_at = first_byte_at
+        elapsed = now - self._last_at
+        if elapsed <= 0:
+            return
+        mbps = ((total - self._last_bytes) * 8) / (elapsed * 1_000_000)
+        self._last_at, self._last_bytes = now, total
+
+        if not self.samples:
+            since_first_byte = now - first_byte_at
+            rising = self._previous is not None and mbps > self._previous * (1 + self.RAMP_GROWTH)
+            if since_first_byte < self.ramp_limit and (since_first_byte < SPEED_RAMP_MIN_SECONDS or rising):
+                self.ramp_samples += 1
+                self._previous = mbps
+                return
+        self.samples.append(mbps)
+
+    def estimate(self) -> tuple[float | None, float | None]:
+        recent = self.samples[-SPEED_CONVERGENCE_WINDOW:]
+        if len(recent) < 2:
+            return (recent[0] if recent else None), None
+        mean = statistics.fmean(recent)
+        half_width = _t_95(len(recent) - 1) * statistics.stdev(recent) / len(recent) ** 0.5
+        return mean, half_width
+
+    def converged(self) -> bool:
+        if len(self.samples) < SPEED_CONVERGENCE_WINDOW:
+            return False
+        mean, half_width = self.estimate()
+        return bool(mean) and half_width is not None and half_width / mean <= SPEED_CONVERGENCE_TOLERANCE
+
+
+def _download_stream(
+    url: str,
+    stream: int,
+    streams: int,
+    window: _TransferWindow,
+    timeout: float | tuple[float, float] = SPEED_TEST_TIMEOUT_SECONDS,
+) -> dict:
+    started = time.perf_counter()
+    downloaded = 0
+    error = None
+    first_response_ms = None
+    chunk_index = stream
+    try:
+        # يعيد الطلب عند انتهاء الملف حتى تنقضي الميزانية الزمنية أو سقف البايتات
+        while not window.done():
+            headers = {}
+            if SPEED_TEST_RANGE_CHUNK_BYTES > 0:
+                offset = chunk_index * SPEED_TEST_RANGE_CHUNK_BYTES
+                headers["Range"] = f"bytes={offset}-{offset + SPEED_TEST_RANGE_CHUNK_BYTES - 1}"
+            with get_http_session().get(url, headers=headers, stream=True, timeout=timeout) as response:
+                if first_response_ms is None:
+                    first_response_ms = response.elapsed.total_seconds() * 1000
+                if response.status_code == 416 and chunk_index != stream:
+                    chunk_index = stream
+                    continue
+                response.raise_for_status()
+                received = 0
+                for chunk in response.iter_content(chunk_size=64 * 1024):
+                    if not chunk:
+                        continue
+                    received += len(chunk)
+                    window.add(len(chunk))
+                    if window.done():
+                        break
+                    if response.status_code == 200 and headers and received >= SPEED_TEST_RANGE_CHUNK_BYTES:
+                        # الخادم تجاهل Range؛ نكتفي بحجم الجزء ونعيد الطلب
+                        break
+                downloaded += received
+                if received == 0:
+                    break
+            chunk_index += streams
+    except requests.RequestException as exc:
+        error = type(exc).__name__
+
+    elapsed = time.perf_counter() - started
+    return {
+        "server": url,
+        "stream": stream,
+        "bytes": downloaded,
+        "seconds": elapsed,
+        "mbps": (downloaded * 8) / (elapsed * 1_000_000) if elapsed > 0 and downloaded else None,
+        "first_response_ms": first_response_ms,
+        "error": error,
+    }
+
+
+def _record_downloads(urls: list[str], stream_stats: list[dict]) -> None:
+    # الخادم سليم إن أوصل أي اتصال منه بايتات؛ زمنه هو زمن أول استجابة (الوسيط بين اتصالاته)
+    for url in urls:
+        stats = [entry for entry in stream_stats if entry["server"] == url]
+        breaker = BREAKERS.get("download", url)
+        if any(entry["bytes"] for entry in stats):
+            latencies = [entry["first_response_ms"] for entry in stats if entry["first_response_ms"] is not None]
+            breaker.record_success(statistics.median(latencies) if latencies else None)
+        else:
+            breaker.record_failure(next((entry["error"] for entry in stats if entry["error"]), "no data"))
+
+
+@PROBE_SECONDS.time(probe="run_speed_test")
+def run_speed_test(mode: str, urls: list[str] | None = None, latency_url: str = LATENCY_PROBE_URL) -> dict:
+    profile = SPEED_TEST_PROFILES.get(mode, SPEED_TEST_PROFILES["quick"])
+    # بلا قائمة صريحة: أقرب SPEED_TEST_SERVER_COUNT خادمًا من المجموعة المرتبة. خادم لا يستجيب
+    # يُتخطى حتى موعد محاولته التالية ويحل محله التالي في الترتيب، ويبقى خادم واحد على الأقل
+    limit = None
+    if urls is None:
+        urls = SERVER_POOL.best_urls()
+        limit = max(1, SPEED_TEST_SERVER_COUNT)
+    selected = BREAKERS.select("download", urls, 1, limit=limit) if urls else []
+    # المتخطى هو ما سبق آخر خادم مختار في الترتيب ولم يُختر؛ ما بعده لم يكن ليُستخدم أصلًا
+    skipped = [url for url in urls[: urls.index(selected[-1]) if selected else None] if url not in selected]
+    # المهلة المتكيفة تُتعلّم من زمن أول استجابة فتحدّ الاتصال وحده؛ التوقف بين القراءات أثناء
+    # النقل يبقى على المهلة المضبوطة، وإلا قطع تزاحم عابر على خط مشبع الاتصال وفتح القاطع
+    timeouts = {
+        url: (BREAKERS.get("download", url).timeout(SPEED_TEST_TIMEOUT_SECONDS), SPEED_TEST_TIMEOUT_SECONDS)
+        for url in selected
+    }
+    streams = max(1, profile["streams"])
+
+    window = _TransferWindow(time.perf_counter() + profile["seconds"], profile["max_bytes"])
+    sampler = _ThroughputSampler(window, profile["seconds"])
+    converge = profile.get("converge", False)
+    jobs = [(url, stream) for url in selected for stream in range(streams)]
+    stream_stats = []
+    stop_reason = "no streams"
+    if jobs:
+        with ThreadPoolExecutor(max_workers=len(jobs)) as executor:
+            futures = [
+                executor.submit(_download_stream, url, stream, streams, window, timeouts[url]) for url, stream in jobs
+            ]
+            pending = set(futures)
+            while pending:
+                _, pending = wait(pending, timeout=SPEED_SAMPLE_INTERVAL_SECONDS)
+                # الفترة الأخيرة جزئية (الاتصالات تُغلق) فلا تُحتسب عينة
+                if pending:
+                    sampler.sample()
+                if converge and not window.stopped and sampler.converged():
+                    window.stopped = True
+            stream_stats = [future.result() for future in futures]
+        _record_downloads(selected, stream_stats)
+        if window.stopped:
+            stop_reason = "converged"
+        elif window.max_bytes and window.total_bytes >= window.max_bytes:
+            stop_reason = "bytes"
+        elif time.perf_counter() >= window.deadline:
+            stop_reason = "time"
+        else:
+            stop_reason = "streams ended"
+
+    estimate_mbps, ci_mbps = sampler.estimate()
+    # الوضع المتكيّف يعتمد متوسط العينات المستقرة؛ الأوضاع الثابتة تبقى على متوسط النافذة كاملة
+    download_mbps = estimate_mbps if converge and estimate_mbps is not None else window.mbps()
+
+    latency = _measure_latency(latency_url)
+
+    return {
+        "mode": mode,
+        "download_mbps": download_mbps,
+        "latency_ms": latency["latency_ms"],
+        **{column: latency[column] if latency["error"] is None else None for column in PHASE_COLUMNS},
+        "bytes": window.total_bytes,
+        "streams": stream_stats,
+        "servers": selected,
+        "skipped_servers": skipped,
+        "sample_count": len(sampler.samples),
+        "ramp_samples": sampler.ramp_samples,
+        "ci_mbps": ci_mbps,
+        "converged": window.stopped,
+        "stop_reason": stop_reason,
+    }
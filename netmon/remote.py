@@ -0,0 +1,154 @@
+import gzip
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+
+import requests
+
+from netmon.config import (
+    AGENT_ID,
+    INGEST_TOKEN,
+    REMOTE_PUSH_BACKOFF_MAX_SECONDS,
+    REMOTE_PUSH_BATCH_ROWS,
+    REMOTE_PUSH_TIMEOUT_SECONDS,
+    REMOTE_SPOOL_MAX_ROWS,
+    SITE_ID,
+    TARGETS,
+)
+from netmon.httpclient import get_http_session
+from netmon.jobs import is_speed_drop
+from netmon.probes import check_connection, run_speed_test
+from netmon.utils import get_now
+
+logger = logging.getLogger(__name__)
+
+
+# ------------------ مخزن الوكيل المحلي ------------------
+# وكيل الفرع لا يملك results.db؛ يحفظ كل نتيجة في ملف spool صغير ثم يدفعها على دفعات.
+# seq تسلسلي لا يُعاد استخدامه (AUTOINCREMENT)، و spool_id يميز الملف إن حُذف وأُعيد إنشاؤه.
+class Spool:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS spool (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS spool_meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._conn.execute(
+            "INSERT OR IGNORE INTO spool_meta (key, value) VALUES ('spool_id', ?)", (uuid.uuid4().hex,)
+        )
+        self.spool_id = self._conn.execute("SELECT value FROM spool_meta WHERE key = 'spool_id'").fetchone()[0]
+
+    def append(self, kind: str, payload: dict, max_rows: int = REMOTE_SPOOL_MAX_ROWS) -> int:
+        with self._lock:
+            seq = self._conn.execute(
+                "INSERT INTO spool (kind, payload) VALUES (?, ?)", (kind, json.dumps(payload))
+            ).lastrowid
+            # انقطاع طويل: الأقدم يُسقط أولًا حتى لا يمتلئ قرص الفرع
+            if max_rows > 0 and seq % 100 == 0:
+                self._conn.execute("DELETE FROM spool WHERE seq <= ?", (seq - max_rows,))
+            return seq
+
+    def peek(self, limit: int) -> list[tuple[int, str, str]]:
+        with self._lock:
+            return self._conn.execute("SELECT seq, kind, payload FROM spool ORDER BY seq LIMIT ?", (limit,)).fetchall()
+
+    def ack(self, upto_seq: int) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM spool WHERE seq <= ?", (upto_seq,))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM spool").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def probe_connectivity(spool: Spool, targets: list[str] | None = None) -> dict:
+    result = check_connection(TARGETS if targets is None else targets)
+    now = get_now()
+    spool.append(
+        "check",
+        {
+            "status": result["status"],
+            "timestamp": now.isoformat(),
+            "ts": int(now.timestamp()),
+            "targets": result["targets"],
+        },
+    )
+    return result
+
+
+def probe_speed(spool: Spool, mode: str = "quick") -> dict:
+    result = run_speed_test(mode)
+    now = get_now()
+    spool.append(
+        "speed",
+        {**result, "drop_detected": is_speed_drop(result), "timestamp": now.isoformat(), "ts": int(now.timestamp())},
+    )
+    return {"result": result}
+
+
+class SpoolPusher:
+    def __init__(self, spool: Spool, url: str, site_id: str = SITE_ID, agent_id: str = AGENT_ID):
+        self.spool = spool
+        self.url = url
+        self.site_id = site_id
+        self.agent_id = agent_id
+        self.failures = 0
+        self.retry_at = 0.0
+
+    def push_batch(self, batch_rows: int = REMOTE_PUSH_BATCH_ROWS) -> int:
+        rows = self.spool.peek(batch_rows)
+        if not rows:
+            return 0
+        batch = {
+            "site_id": self.site_id,
+            "agent_id": self.agent_id,
+            "spool_id": self.spool.spool_id,
+            "results": [{"seq": seq, "kind": kind, "data": json.loads(payload)} for seq, kind, payload in rows],
+        }
+        body = gzip.compress(json.dumps(batch).encode(), compresslevel=6)
+        headers = {"Content-Type": "application/json", "Content-Encoding": "gzip"}
+        if INGEST_TOKEN:
+            headers["Authorization"] = f"Bearer {INGEST_TOKEN}"
+
+        response = get_http_session().post(self.url, data=body, headers=headers, timeout=REMOTE_PUSH_TIMEOUT_SECONDS)
+        response.raise_for_status()
+        acked_seq = response.json()["acked_seq"]
+        self.spool.ack(acked_seq)
+        return len(rows)
+
+    def push(self) -> str:
+        if time.monotonic() < self.retry_at:
+            return "backing off"
+        pushed = 0
+        try:
+            # بعد الانقطاع تُفرَّغ المتأخرات على دفعات متتالية في الدورة نفسها
+            while True:
+                sent = self.push_batch()
+                pushed += sent
+                if sent < REMOTE_PUSH_BATCH_ROWS:
+                    break
+        except (requests.RequestException, ValueError, KeyError) as error:
+            self.failures += 1
+            delay = min(REMOTE_PUSH_TIMEOUT_SECONDS * 2 ** (self.failures - 1), REMOTE_PUSH_BACKOFF_MAX_SECONDS)
+            self.retry_at = time.monotonic() + delay
+            logger.warning("Push to %s failed (%s); %d rows spooled, retrying in %.0fs", self.url, error, len(self.spool), delay)
+            return f"pushed {pushed}, failed"
+        self.failures = 0
+        return f"pushed {pushed}"
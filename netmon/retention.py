@@ -0,0 +1,213 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections.abc import Callable
+
+from netmon import config
+from netmon.config import (
+    RETENTION_5MIN_ROLLUP_DAYS,
+    RETENTION_BATCH_ROWS,
+    RETENTION_INCIDENT_DAYS,
+    RETENTION_MINUTE_ROLLUP_DAYS,
+    RETENTION_PAUSE_SECONDS,
+    RETENTION_RAW_DAYS,
+    RETENTION_VACUUM_PAGES,
+)
+from netmon.engine import write
+from netmon.rollups import downsample_rollups
+from netmon.utils import get_now
+
+logger = logging.getLogger(__name__)
+
+DAY_SECONDS = 86400
+
+# (الجدول الخام، الجدول التابع له، عمود الربط)
+RAW_TABLES = [
+    ("checks", "check_targets", "check_id"),
+    ("speed_checks", "speed_streams", "speed_check_id"),
+    ("remote_checks", None, None),
+    ("remote_speed_checks", None, None),
+    ("latency_probes", None, None),
+]
+
+
+# ------------------ الاحتفاظ والضغط ------------------
+# الطبقات: صفوف خام لـ RETENTION_RAW_DAYS، مجاميع الدقيقة تُدمج في rollup_5min بعد
+# RETENTION_MINUTE_ROLLUP_DAYS، و rollup_5min تُحذف بعد RETENTION_5MIN_ROLLUP_DAYS،
+# أما rollup_hour فتبقى دائمًا ويُحسب منها SLA لأي فترة. القيمة 0 تعني بلا حد.
+def _downsample_minutes(conn: sqlite3.Connection, cutoff: int, batch_rows: int) -> int:
+    upto = conn.execute(
+        """
+        SELECT MAX(bucket) FROM (
+            SELECT bucket FROM rollup_minute WHERE bucket < ? ORDER BY bucket LIMIT ?
+        )
+        """,
+        (cutoff, batch_rows),
+    ).fetchone()[0]
+    if upto is None:
+        return 0
+    return downsample_rollups(conn, "rollup_minute", "rollup_5min", 300, upto)
+
+
+def _delete_old_buckets(conn: sqlite3.Connection, table: str, cutoff: int, batch_rows: int) -> int:
+    return conn.execute(
+        f"""
+        DELETE FROM {table} WHERE bucket IN (
+            SELECT bucket FROM {table} WHERE bucket < ? ORDER BY bucket LIMIT ?
+        )
+        """,
+        (cutoff, batch_rows),
+    ).rowcount
+
+
+def _delete_raw_rows(
+    conn: sqlite3.Connection,
+    table: str,
+    child_table: str | None,
+    child_column: str | None,
+    cutoff: int,
+    batch_rows: int,
+) -> int:
+    ids = [
+        (row[0],)
+        for row in conn.execute(
+            f"SELECT id FROM {table} WHERE ts < ? ORDER BY ts LIMIT ?", (cutoff, batch_rows)
+        ).fetchall()
+    ]
+    if not ids:
+        return 0
+    if child_table:
+        conn.executemany(f"DELETE FROM {child_table} WHERE {child_column} = ?", ids)
+    conn.executemany(f"DELETE FROM {table} WHERE id = ?", ids)
+    return len(ids)
+
+
+def _delete_closed_incidents(conn: sqlite3.Connection, cutoff: int, batch_rows: int) -> int:
+    # الحوادث المفتوحة لا تُحذف مهما قدُمت
+    return conn.execute(
+        """
+        DELETE FROM incidents WHERE id IN (
+            SELECT id FROM incidents
+            WHERE started_ts < ? AND ended_at IS NOT NULL
+            ORDER BY started_ts LIMIT ?
+        )
+        """,
+        (cutoff, batch_rows),
+    ).rowcount
+
+
+def _delete_delivered_alerts(conn: sqlite3.Connection, cutoff: int, batch_rows: int) -> int:
+    return conn.execute(
+        """
+        DELETE FROM alert_outbox WHERE id IN (
+            SELECT id FROM alert_outbox
+            WHERE created_ts < ? AND status IN ('sent', 'failed')
+            ORDER BY id LIMIT ?
+        )
+        """,
+        (cutoff, batch_rows),
+    ).rowcount
+
+
+def _run_in_chunks(
+    task: Callable[[sqlite3.Connection], int], pause_seconds: float, stop_event: threading.Event | None
+) -> int:
+    total = 0
+    while stop_event is None or not stop_event.is_set():
+        deleted = write(task)
+        if not deleted:
+            break
+        total += deleted
+        time.sleep(pause_seconds)
+    return total
+
+
+def reclaim_space(max_pages: int = RETENTION_VACUUM_PAGES) -> int | None:
+    # يعيد الصفحات الحرة إلى نظام الملفات تدريجيًا؛ None إن لم تكن القاعدة بوضع incremental
+    def vacuum(conn: sqlite3.Connection) -> int | None:
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            return None
+        before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        # executescript يكمل كل خطوات الـ pragma؛ execute يحرر صفحة واحدة فقط
+        conn.executescript(f"PRAGMA incremental_vacuum({int(max_pages)})")
+        return before - conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+    return write(vacuum, transactional=False)
+
+
+def enable_incremental_vacuum() -> None:
+    # تحويل لمرة واحدة للقواعد القديمة؛ VACUUM كامل يقفل القاعدة طوال مدته
+    def convert(conn: sqlite3.Connection) -> None:
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("VACUUM")
+
+    write(convert, transactional=False)
+
+
+def database_size_bytes() -> int:
+    return sum(
+        os.path.getsize(path)
+        for path in (config.DB_PATH, f"{config.DB_PATH}-wal")
+        if os.path.exists(path)
+    )
+
+
+def compact(
+    now: float | None = None,
+    batch_rows: int = RETENTION_BATCH_ROWS,
+    pause_seconds: float = RETENTION_PAUSE_SECONDS,
+    stop_event: threading.Event | None = None,
+) -> dict:
+    now = int(get_now().timestamp() if now is None else now)
+    size_before = database_size_bytes()
+    stats: dict[str, int | None] = {}
+
+    if RETENTION_MINUTE_ROLLUP_DAYS > 0:
+        cutoff = now - int(RETENTION_MINUTE_ROLLUP_DAYS * DAY_SECONDS)
+        stats["rollup_minute"] = _run_in_chunks(
+            lambda conn: _downsample_minutes(conn, cutoff, batch_rows), pause_seconds, stop_event
+        )
+    if RETENTION_5MIN_ROLLUP_DAYS > 0:
+        cutoff = now - int(RETENTION_5MIN_ROLLUP_DAYS * DAY_SECONDS)
+        stats["rollup_5min"] = _run_in_chunks(
+            lambda conn: _delete_old_buckets(conn, "rollup_5min", cutoff, batch_rows), pause_seconds, stop_event
+        )
+    if RETENTION_RAW_DAYS > 0:
+        cutoff = now - int(RETENTION_RAW_DAYS * DAY_SECONDS)
+        for table, child_table, child_column in RAW_TABLES:
+            stats[table] = _run_in_chunks(
+                lambda conn, table=table, child_table=child_table, child_column=child_column: _delete_raw_rows(
+                    conn, table, child_table, child_column, cutoff, batch_rows
+                ),
+                pause_seconds,
+                stop_event,
+            )
+    if RETENTION_INCIDENT_DAYS > 0:
+        cutoff = now - int(RETENTION_INCIDENT_DAYS * DAY_SECONDS)
+        stats["incidents"] = _run_in_chunks(
+            lambda conn: _delete_closed_incidents(conn, cutoff, batch_rows), pause_seconds, stop_event
+        )
+        stats["alert_outbox"] = _run_in_chunks(
+            lambda conn: _delete_delivered_alerts(conn, cutoff, batch_rows), pause_seconds, stop_event
+        )
+
+    freed_pages = 0
+    while stop_event is None or not stop_event.is_set():
+        freed = reclaim_space()
+        if freed is None:
+            freed_pages = None
+            break
+        freed_pages += freed
+        if freed == 0:
+            break
+        time.sleep(pause_seconds)
+    stats["freed_pages"] = freed_pages
+    write(lambda conn: conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone(), transactional=False)
+    stats["size_before"] = size_before
+    stats["size_after"] = database_size_bytes()
+
+    if freed_pages is None:
+        logger.info("Database is not in incremental auto_vacuum mode; run 'python -m netmon compact --vacuum' once")
+    return stats
@@ -0,0 +1,124 @@
+import sqlite3
+
+# ------------------ جداول التجميع ------------------
+# كل كتابة تُحدّث مجاميع الدقيقة والساعة في المعاملة نفسها، فيُحسب SLA لأي نافذة
+# من بضع مئات من الصفوف المجمّعة بدل مسح الجداول الخام.
+ROLLUP_TABLES = {"rollup_minute": 60, "rollup_hour": 3600}
+# طبقة لا تُحدَّث عند الكتابة، بل تُملأ من rollup_minute عند ضغط البيانات القديمة
+DOWNSAMPLED_TABLES = {"rollup_5min": 300}
+
+ROLLUP_COLUMNS = "bucket, up_count, total_count, speed_sum, speed_count, speed_min, speed_max, incident_count"
+
+_ROLLUP_CONFLICT = """
+ON CONFLICT(bucket) DO UPDATE SET
+    up_count = up_count + excluded.up_count,
+    total_count = total_count + excluded.total_count,
+    speed_sum = speed_sum + excluded.speed_sum,
+    speed_count = speed_count + excluded.speed_count,
+    speed_min = MIN(COALESCE(speed_min, excluded.speed_min), COALESCE(excluded.speed_min, speed_min)),
+    speed_max = MAX(COALESCE(speed_max, excluded.speed_max), COALESCE(excluded.speed_max, speed_max)),
+    incident_count = incident_count + excluded.incident_count
+"""
+
+# ما تساهم به كل صف خام في المجاميع، بعد أن يصبح له عمود زمني صحيح
+_ROLLUP_SOURCES = {
+    "checks": ("ts", "status = 'UP'", "1", "NULL", "0"),
+    "speed_checks": ("ts", "0", "0", "download_mbps", "0"),
+    "incidents": ("started_ts", "0", "0", "NULL", "1"),
+}
+
+
+def create_rollup_tables(conn: sqlite3.Connection, tables: list[str] | None = None) -> None:
+    for table in ROLLUP_TABLES if tables is None else tables:
+        conn.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                bucket INTEGER PRIMARY KEY,
+                up_count INTEGER NOT NULL DEFAULT 0,
+                total_count INTEGER NOT NULL DEFAULT 0,
+                speed_sum REAL NOT NULL DEFAULT 0,
+                speed_count INTEGER NOT NULL DEFAULT 0,
+                speed_min REAL,
+                speed_max REAL,
+                incident_count INTEGER NOT NULL DEFAULT 0
+            )
+            """
+        )
+
+
+def bump_rollups(
+    conn: sqlite3.Connection,
+    epoch: float,
+    up: int = 0,
+    total: int = 0,
+    speed: float | None = None,
+    incidents: int = 0,
+) -> None:
+    for table, width in ROLLUP_TABLES.items():
+        conn.execute(
+            f"INSERT INTO {table} ({ROLLUP_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?) {_ROLLUP_CONFLICT}",
+            (
+                int(epoch) - int(epoch) % width,
+                up,
+                total,
+                speed or 0.0,
+                int(speed is not None),
+                speed,
+                speed,
+                incidents,
+            ),
+        )
+
+
+def fold_rows_into_rollups(conn: sqlite3.Connection, source: str, first_id: int, last_id: int) -> None:
+    # يضيف صفوف النطاق (first_id, last_id] من جدول خام إلى المجاميع دفعة واحدة
+    ts, up, total, speed, incidents = _ROLLUP_SOURCES[source]
+    for table, width in ROLLUP_TABLES.items():
+        conn.execute(
+            f"""
+            INSERT INTO {table} ({ROLLUP_COLUMNS})
+            SELECT {ts} - {ts} % {width}, SUM({up}), SUM({total}), COALESCE(SUM({speed}), 0),
+                   COUNT({speed}), MIN({speed}), MAX({speed}), SUM({incidents})
+            FROM {source}
+            WHERE id > ? AND id <= ? AND {ts} IS NOT NULL
+            GROUP BY {ts} - {ts} % {width}
+            {_ROLLUP_CONFLICT}
+            """,
+            (first_id, last_id),
+        )
+
+
+def downsample_rollups(conn: sqlite3.Connection, source: str, target: str, width: int, upto_bucket: int) -> int:
+    # ينقل صفوف المصدر حتى upto_bucket إلى جدول أخشن ويحذفها، في المعاملة نفسها
+    conn.execute(
+        f"""
+        INSERT INTO {target} ({ROLLUP_COLUMNS})
+        SELECT bucket - bucket % {width}, SUM(up_count), SUM(total_count), SUM(speed_sum), SUM(speed_count),
+               MIN(speed_min), MAX(speed_max), SUM(incident_count)
+        FROM {source}
+        WHERE bucket <= ?
+        GROUP BY bucket - bucket % {width}
+        {_ROLLUP_CONFLICT}
+        """,
+        (upto_bucket,),
+    )
+    return conn.execute(f"DELETE FROM {source} WHERE bucket <= ?", (upto_bucket,)).rowcount
+
+
+# ------------------ سلاسل الرسوم ------------------
+# عرض الفئة يُختار من قائمة ثابتة بحيث لا يتجاوز عدد النقاط max_points لأي مدى، ثم تُجمَّع
+# الفئات من أخشن طبقة تكفي: مجاميع الساعة لا تُحذف، والدقيقة/5 دقائق تغطي ما دون الساعة.
+SERIES_WIDTHS = (60, 120, 300, 600, 900, 1800, 3600, 7200, 10800, 21600, 43200, 86400, 172800, 604800)
+
+
+def series_bucket_width(span_seconds: int, max_points: int) -> int:
+    for width in SERIES_WIDTHS:
+        if span_seconds / width <= max_points:
+            return width
+    return SERIES_WIDTHS[-1]
+
+
+def series_sources(width: int) -> list[str]:
+    if width % ROLLUP_TABLES["rollup_hour"] == 0:
+        return ["rollup_hour"]
+    return ["rollup_minute", *DOWNSAMPLED_TABLES]
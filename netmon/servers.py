@@ -0,0 +1,147 @@
+import logging
+import os
+import re
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from netmon import config
+from netmon.metrics import counter
+
+logger = logging.getLogger(__name__)
+
+_COMMENT = re.compile(r"(^|\s)#.*")
+
+SERVER_RANKINGS = counter("netmon_speed_server_rankings_total", "Speed-server re-rankings by trigger")
+
+
+def load_servers(path: str) -> list[dict]:
+    # سطر لكل خادم: "url [الاسم]" بفاصل مسافات أو Tab. # تعليق في أول السطر أو بعد مسافة فقط،
+    # حتى لا يُقطع رابط فيه مقطع #fragment
+    servers = []
+    with open(path, encoding="utf-8") as handle:
+        for line in handle:
+            fields = _COMMENT.sub("", line).split(None, 1)
+            if not fields:
+                continue
+            url = fields[0]
+            name = " ".join(fields[1].split()) if len(fields) > 1 else ""
+            servers.append({"url": url, "name": name or urlsplit(url).hostname or url})
+    return servers
+
+
+def measure_rtt(url: str, count: int, timeout: float) -> tuple[float | None, str | None]:
+    # زمن إنشاء اتصال TCP ≈ رحلة ذهاب وعودة واحدة، دون تنزيل أي بايت من الملف.
+    # يؤخذ الأدنى من عدة محاولات لأنه الأقل تأثرًا بالازدحام اللحظي
+    parts = urlsplit(url)
+    port = parts.port or (443 if parts.scheme == "https" else 80)
+    try:
+        address = socket.getaddrinfo(parts.hostname, port, type=socket.SOCK_STREAM)[0]
+    except (OSError, UnicodeError) as error:
+        return None, type(error).__name__
+    family, socktype, proto, _, sockaddr = address
+    best = None
+    error_name = None
+    for _ in range(max(1, count)):
+        sock = socket.socket(family, socktype, proto)
+        sock.settimeout(timeout)
+        started = time.perf_counter()
+        try:
+            sock.connect(sockaddr)
+            elapsed = (time.perf_counter() - started) * 1000
+            best = elapsed if best is None else min(best, elapsed)
+        except OSError as error:
+            error_name = type(error).__name__
+        finally:
+            sock.close()
+    return best, None if best is not None else error_name
+
+
+# ------------------ ترتيب خوادم السرعة ------------------
+# الترتيب يُحفظ في الذاكرة لمدة SPEED_SERVER_RANK_TTL_SECONDS. بعدها يُعاد الترتيب القديم فورًا
+# ويُجدَّد في خيط خلفي، فلا ينتظر اختبار السرعة القياس إلا في أول مرة بعد الإقلاع أو تغيّر المجموعة.
+class ServerPool:
+    def __init__(self):
+        self.ranking: list[dict] = []
+        self.ranked_at = 0.0
+        self._source: tuple | None = None
+        self._servers: list[dict] = []
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def servers(self) -> list[dict]:
+        path = config.SPEED_SERVERS_FILE
+        source: tuple = (path, None)
+        if path:
+            try:
+                source = (path, os.stat(path).st_mtime)
+            except OSError as error:
+                logger.warning("Speed server file %s unreadable (%s); using SPEED_TEST_URLS", path, error)
+                source = ("", None)
+        with self._lock:
+            if source != self._source:
+                if source[0]:
+                    self._servers = load_servers(source[0])
+                else:
+                    self._servers = [
+                        {"url": url, "name": urlsplit(url).hostname or url} for url in config.SPEED_TEST_URLS
+                    ]
+                self._source = source
+                self.ranked_at = 0.0
+            return list(self._servers)
+
+    def rank(self, trigger: str = "manual") -> list[dict]:
+        servers = self.servers()
+        if servers:
+            with ThreadPoolExecutor(max_workers=len(servers)) as executor:
+                measured = list(
+                    executor.map(
+                        lambda server: measure_rtt(
+                            server["url"], config.SPEED_SERVER_PING_COUNT, config.SPEED_SERVER_PING_TIMEOUT_SECONDS
+                        ),
+                        servers,
+                    )
+                )
+        else:
+            measured = []
+        # الخادم غير المتاح يبقى في آخر القائمة: احتياطي إن تعذّر غيره
+        ranking = sorted(
+            ({**server, "rtt_ms": rtt, "error": error} for server, (rtt, error) in zip(servers, measured)),
+            key=lambda server: (server["rtt_ms"] is None, server["rtt_ms"] or 0.0),
+        )
+        with self._lock:
+            self.ranking = ranking
+            self.ranked_at = time.time()
+        SERVER_RANKINGS.inc(trigger=trigger)
+        return ranking
+
+    def _refresh(self) -> None:
+        try:
+            self.rank("background")
+        except Exception:
+            logger.exception("Background speed-server ranking failed")
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def ranked(self) -> list[dict]:
+        self.servers()
+        with self._lock:
+            ranking, ranked_at = self.ranking, self.ranked_at
+            stale = time.time() - ranked_at >= config.SPEED_SERVER_RANK_TTL_SECONDS
+            refresh = bool(ranked_at) and stale and not self._refreshing
+            if refresh:
+                self._refreshing = True
+        if not ranked_at:
+            return self.rank("startup")
+        if refresh:
+            threading.Thread(target=self._refresh, name="speed-server-rank", daemon=True).start()
+        return ranking
+
+    def best_urls(self) -> list[str]:
+        return [server["url"] for server in self.ranked()]
+
+
+SERVER_POOL = ServerPool()
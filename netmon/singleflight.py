@@ -0,0 +1,194 @@
+import json
+import logging
+import threading
+import time
+import uuid
+from collections.abc import Callable
+from typing import TypeVar
+
+from netmon import config
+from netmon.engine import read_connection, write
+from netmon.metrics import counter
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+FLIGHTS = counter("netmon_singleflight_total", "Coordinated runs by name and role (owner, joined, uncoordinated)")
+
+
+# ------------------ عقود التشغيل المنفرد ------------------
+# المالك يأخذ عقدًا باسم المهمة حتى expires، ثم ينشر نتيجته ويحرّر العقد في خطوة واحدة.
+# من يجد العقد مأخوذًا ينتظر نتيجة ذلك المالك بعينه؛ إن اختفى العقد دون نتيجة (انهيار أو خطأ)
+# يحاول أخذه بنفسه.
+class _SqliteLeases:
+    def acquire(self, name: str, owner: str, ttl: float) -> str | None:
+        def take(conn) -> str:
+            now = time.time()
+            row = conn.execute(
+                "SELECT owner FROM flight_leases WHERE name = ? AND expires_ts > ?", (name, now)
+            ).fetchone()
+            if row is not None:
+                return row[0]
+            conn.execute(
+                "INSERT OR REPLACE INTO flight_leases (name, owner, started_ts, expires_ts) VALUES (?, ?, ?, ?)",
+                (name, owner, now, now + ttl),
+            )
+            return owner
+
+        return write(take)
+
+    def release(self, name: str, owner: str, result: str | None) -> None:
+        def finish(conn) -> None:
+            conn.execute("DELETE FROM flight_leases WHERE name = ? AND owner = ?", (name, owner))
+            if result is not None:
+                conn.execute(
+                    "INSERT OR REPLACE INTO flight_results (name, owner, result, finished_ts) VALUES (?, ?, ?, ?)",
+                    (name, owner, result, time.time()),
+                )
+
+        write(finish)
+
+    def poll(self, name: str, owner: str) -> tuple[bool, str | None]:
+        with read_connection() as conn:
+            if conn is None:
+                return False, None
+            row = conn.execute(
+                "SELECT result FROM flight_results WHERE name = ? AND owner = ?", (name, owner)
+            ).fetchone()
+            if row is not None:
+                return False, row[0]
+            running = conn.execute(
+                "SELECT 1 FROM flight_leases WHERE name = ? AND owner = ? AND expires_ts > ?",
+                (name, owner, time.time()),
+            ).fetchone()
+        return running is not None, None
+
+
+_REDIS_RELEASE = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0"
+
+
+class _RedisLeases:
+    def __init__(self, url: str):
+        import redis
+
+        self.client = redis.Redis.from_url(url, socket_timeout=2, socket_connect_timeout=2)
+        self.client.ping()
+
+    def _key(self, name: str) -> str:
+        return f"netmon:flight:{name}"
+
+    def acquire(self, name: str, owner: str, ttl: float) -> str | None:
+        key = self._key(name)
+        if self.client.set(key, owner, nx=True, px=int(ttl * 1000)):
+            return owner
+        holder = self.client.get(key)
+        # "" يعني أن العقد حُرِّر بين الأمرين؛ المحاولة التالية تأخذه
+        return holder.decode() if holder is not None else ""
+
+    def release(self, name: str, owner: str, result: str | None) -> None:
+        key = self._key(name)
+        if result is not None:
+            self.client.set(f"{key}:result:{owner}", result, ex=int(config.SPEED_TEST_LEASE_SECONDS))
+        self.client.eval(_REDIS_RELEASE, 1, key, owner)
+
+    def poll(self, name: str, owner: str) -> tuple[bool, str | None]:
+        key = self._key(name)
+        result = self.client.get(f"{key}:result:{owner}")
+        if result is not None:
+            return False, result.decode()
+        return self.client.get(key) == owner.encode(), None
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            if config.SINGLEFLIGHT_BACKEND == "redis":
+                try:
+                    _backend = _RedisLeases(config.REDIS_URL)
+                except Exception as error:
+                    logger.warning("Redis at %s unavailable (%s); using SQLite leases", config.REDIS_URL, error)
+            if _backend is None:
+                _backend = _SqliteLeases()
+        return _backend
+
+
+def _run_leased(name: str, func: Callable[[], T], lease_seconds: float) -> tuple[T, str]:
+    backend = get_backend()
+    token = uuid.uuid4().hex
+    while True:
+        try:
+            holder = backend.acquire(name, token, lease_seconds)
+        except Exception as error:
+            logger.warning("Lease %s unavailable: %s", name, error)
+            holder = None
+        if holder is None:
+            # المنسّق نفسه معطّل: التشغيل دون تنسيق أفضل من عدم التشغيل
+            return func(), "uncoordinated"
+
+        if holder == token:
+            result = None
+            try:
+                result = func()
+            finally:
+                payload = None if result is None else json.dumps(result, default=float)
+                try:
+                    backend.release(name, token, payload)
+                except Exception as error:
+                    logger.warning("Releasing lease %s failed: %s", name, error)
+            return result, "owner"
+
+        deadline = time.monotonic() + lease_seconds
+        while holder and time.monotonic() < deadline:
+            try:
+                running, payload = backend.poll(name, holder)
+            except Exception as error:
+                logger.warning("Polling lease %s failed: %s", name, error)
+                break
+            if payload is not None:
+                return json.loads(payload), "joined"
+            if not running:
+                break
+            time.sleep(config.SINGLEFLIGHT_POLL_SECONDS)
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+
+
+_flights: dict[str, _Flight] = {}
+_flights_lock = threading.Lock()
+
+
+def single_flight(name: str, func: Callable[[], T], lease_seconds: float | None = None) -> tuple[T, bool]:
+    # جلسات Streamlit خيوط في العملية نفسها فتنضم عبر Event دون استطلاع؛ العمليات الأخرى
+    # (الوكيل، عمّال gunicorn) تنسّق عبر العقد. النتيجة None تعني "لا شيء للمشاركة"،
+    # فيأخذ المنضم دوره بدل أن يعود بلا نتيجة.
+    lease_seconds = config.SPEED_TEST_LEASE_SECONDS if lease_seconds is None else lease_seconds
+    while True:
+        with _flights_lock:
+            flight = _flights.get(name)
+            leader = flight is None
+            if leader:
+                flight = _flights[name] = _Flight()
+        if not leader:
+            flight.done.wait()
+            if flight.result is not None:
+                FLIGHTS.inc(name=name, role="joined")
+                return flight.result, True
+            continue
+
+        try:
+            flight.result, role = _run_leased(name, func, lease_seconds)
+        finally:
+            with _flights_lock:
+                _flights.pop(name, None)
+            flight.done.set()
+        FLIGHTS.inc(name=name, role=role)
+        return flight.result, role == "joined"